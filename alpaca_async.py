@@ -0,0 +1,155 @@
+import asyncio
+from time import monotonic, time
+from typing import Optional, List, Dict, Any, Callable, Awaitable, AsyncIterator
+import aiohttp
+import pyarrow as pa
+from alpaca_client import AlpacaMarketDataClient
+from alpaca_decode import decode_page
+from http_session import DEFAULT_TIMEOUT, RETRY_STATUS
+from rate_limit import TokenBucket
+
+
+class AsyncAlpacaMarketDataClient(AlpacaMarketDataClient):
+    """
+    asyncio version of AlpacaMarketDataClient, every get_* method has the same arguments and returns an awaitable.
+    eg. async with AsyncAlpacaMarketDataClient(key, secret) as client:
+            bars = await client.gather(client.get_stock_bars, symbols, "1Day", "2024-01-01")   # {symbol: response}
+
+    requests share one aiohttp session, at most max_concurrency are in flight and they are paced by a token bucket
+    at requests_per_minute (alpaca free plan: 200/min). The bucket follows the X-Ratelimit-Remaining / Reset headers,
+    so other processes using the same key slow this one down too, and a 429 pauses every request until the reset.
+    iter_pages / iter_records / iter_tables are async generators here: async for page in client.iter_pages(...)
+    iter_dataframes is for the synchronous client only.
+    """
+
+    def __init__(self, api_key: str, api_secret: str, base_url: str = "https://data.alpaca.markets",
+                 requests_per_minute: int = 200, max_concurrency: int = 10, max_retries: int = 3):
+        super().__init__(api_key, api_secret, base_url)
+        self.bucket = TokenBucket(requests_per_minute, 60.0)
+        self.max_concurrency = max_concurrency
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.max_retries = max_retries
+        self.paused_until = 0.0
+        self._session = None
+
+    async def __aenter__(self) -> 'AsyncAlpacaMarketDataClient':
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None:
+            connect, read = DEFAULT_TIMEOUT
+            self._session = aiohttp.ClientSession(
+                headers=self.headers, timeout=aiohttp.ClientTimeout(sock_connect=connect, sock_read=read),
+                connector=aiohttp.TCPConnector(limit_per_host=self.max_concurrency))
+        return self._session
+
+    async def acquire(self):
+        """Wait for a request credit, and for the end of a rate limit pause."""
+        while True:
+            wait = max(self.bucket.wait_time(1), self.paused_until - monotonic())
+            if wait <= 0:
+                self.bucket.take(1)
+                return
+            await asyncio.sleep(wait)
+
+    def throttle(self, status: int, headers) -> float:
+        """Adapt the bucket to alpaca's rate limit headers, returns the seconds to wait before a retry."""
+        remaining, reset = headers.get("X-Ratelimit-Remaining"), headers.get("X-Ratelimit-Reset")
+        until_reset = max(0.0, float(reset) - time()) if reset else None
+        if remaining is not None:
+            self.bucket.refill()
+            self.bucket.tokens = min(self.bucket.tokens, float(remaining))
+        if status == 429:
+            retry_after = headers.get("Retry-After")
+            wait = float(retry_after) if retry_after else (until_reset if until_reset is not None else 60.0 / self.bucket.capacity)
+            self.bucket.drain()
+            self.paused_until = max(self.paused_until, monotonic() + wait)
+            return wait
+        if remaining is not None and int(remaining) <= 1 and until_reset is not None:
+            self.paused_until = max(self.paused_until, monotonic() + until_reset)
+        return 0.0
+
+    async def _get(self, endpoint: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Helper method to make GET requests."""
+        url = f"{self.base_url}{endpoint}"
+        # Filter out None values from params
+        if params:
+            params = {k: v for k, v in params.items() if v is not None}
+
+        for attempt in range(self.max_retries + 1):
+            wait = 0.0
+            try:
+                async with self.semaphore:
+                    await self.acquire()
+                    async with self.session().get(url, params=params) as response:
+                        wait = self.throttle(response.status, response.headers)
+                        if response.status not in RETRY_STATUS or attempt == self.max_retries:
+                            response.raise_for_status()
+                            return await response.json()
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if attempt == self.max_retries:
+                    raise
+            # same retry policy as http_session: connection errors and RETRY_STATUS, exponential backoff
+            await asyncio.sleep(max(wait, 0.5 * 2 ** attempt))
+
+    async def gather(self, method: Callable[..., Awaitable[Dict[str, Any]]], symbols: List[str], *args,
+                     **kwargs) -> Dict[str, Any]:
+        """
+        Call method(symbol, *args, **kwargs) for every symbol concurrently, within the client's limits.
+        Returns {symbol: response or the exception raised for that symbol}.
+        """
+        results = await asyncio.gather(*(method(symbol, *args, **kwargs) for symbol in symbols),
+                                       return_exceptions=True)
+        return dict(zip(symbols, results))
+
+    async def iter_pages(self, method: Callable[..., Awaitable[Dict[str, Any]]], *args, prefetch: bool = False,
+                         **kwargs) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Yield every page of a paginated endpoint, following next_page_token.
+        eg. async for page in client.iter_pages(client.get_stock_trades, "AAPL", "2024-01-02", limit=10000): ...
+        prefetch=True requests the next page in a task while the caller works on the current one.
+        """
+        kwargs.pop("page_token", None)
+        pending = asyncio.ensure_future(method(*args, page_token=None, **kwargs))
+        try:
+            while pending is not None:
+                page = await pending
+                page_token = page.get("next_page_token")
+                pending = method(*args, page_token=page_token, **kwargs) if page_token else None
+                if pending is not None and prefetch:
+                    pending = asyncio.ensure_future(pending)
+                yield page
+        finally:
+            if isinstance(pending, asyncio.Future):
+                pending.cancel()
+            elif pending is not None:
+                pending.close()
+
+    async def iter_records(self, method: Callable[..., Awaitable[Dict[str, Any]]], *args, prefetch: bool = False,
+                           **kwargs) -> AsyncIterator[tuple]:
+        """
+        Yield (symbol, record) for every bar / trade / quote across all pages.
+        """
+        async for page in self.iter_pages(method, *args, prefetch=prefetch, **kwargs):
+            for item in self.page_records(page):
+                yield item
+
+    async def iter_tables(self, method: Callable[..., Awaitable[Dict[str, Any]]], *args, prefetch: bool = False,
+                          **kwargs) -> AsyncIterator[pa.Table]:
+        """
+        Yield one typed arrow table per page of bars / trades / quotes, see alpaca_decode.decode_page.
+        """
+        async for page in self.iter_pages(method, *args, prefetch=prefetch, **kwargs):
+            yield decode_page(page, as_arrow=True)
+
+    def iter_dataframes(self, *args, **kwargs):
+        raise TypeError("iter_dataframes is synchronous, use AlpacaMarketDataClient, "
+                        "or concatenate the tables of AsyncAlpacaMarketDataClient.iter_tables")
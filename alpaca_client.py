@@ -1,5 +1,9 @@
-import requests
-from typing import Optional, List, Dict, Any, Union
+import http_session
+import pandas as pd
+import pyarrow as pa
+from alpaca_decode import decode_page
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, List, Dict, Any, Union, Callable, Iterator
 
 class AlpacaMarketDataClient:
     """
@@ -22,10 +26,92 @@ class AlpacaMarketDataClient:
         if params:
             params = {k: v for k, v in params.items() if v is not None}
             
-        response = requests.get(url, headers=self.headers, params=params)
+        response = http_session.get(url, headers=self.headers, params=params)
         response.raise_for_status()
         return response.json()
 
+    # ==========================================
+    # Pagination
+    # ==========================================
+
+    def iter_pages(self, method: Callable[..., Dict[str, Any]], *args, prefetch: bool = False,
+                   **kwargs) -> Iterator[Dict[str, Any]]:
+        """
+        Yield every page of a paginated endpoint, following next_page_token.
+        eg. for page in client.iter_pages(client.get_stock_trades, "AAPL", "2024-01-02", limit=10000): ...
+        prefetch=True requests the next page on a background thread while the caller works on the current one.
+        """
+        kwargs.pop("page_token", None)
+        if not prefetch:
+            page_token = None
+            while True:
+                page = method(*args, page_token=page_token, **kwargs)
+                yield page
+                page_token = page.get("next_page_token")
+                if not page_token:
+                    return
+        executor = ThreadPoolExecutor(max_workers=1)
+        try:
+            future = executor.submit(method, *args, page_token=None, **kwargs)
+            while future is not None:
+                page = future.result()
+                page_token = page.get("next_page_token")
+                future = executor.submit(method, *args, page_token=page_token, **kwargs) if page_token else None
+                yield page
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    @staticmethod
+    def page_records(page: Dict[str, Any]) -> Iterator[tuple]:
+        """
+        (symbol, record) pairs of one page, for single symbol pages {"trades": [...], "symbol": "AAPL"}
+        and multi symbol pages {"trades": {"AAPL": [...], "MSFT": [...]}}.
+        """
+        for key, value in page.items():
+            if key in ("symbol", "next_page_token", "currency"):
+                continue
+            if isinstance(value, list):
+                for record in value:
+                    yield page.get("symbol"), record
+            elif isinstance(value, dict):
+                for symbol, records in value.items():
+                    for record in records or []:
+                        yield symbol, record
+
+    def iter_records(self, method: Callable[..., Dict[str, Any]], *args, prefetch: bool = False,
+                     **kwargs) -> Iterator[tuple]:
+        """
+        Yield (symbol, record) for every bar / trade / quote across all pages.
+        eg. for symbol, trade in client.iter_records(client.get_multi_stock_trades, ["AAPL", "MSFT"], "2024-01-02"): ...
+        """
+        for page in self.iter_pages(method, *args, prefetch=prefetch, **kwargs):
+            yield from self.page_records(page)
+
+    def iter_tables(self, method: Callable[..., Dict[str, Any]], *args, prefetch: bool = False,
+                    **kwargs) -> Iterator[pa.Table]:
+        """
+        Yield one typed arrow table per page of bars / trades / quotes, see alpaca_decode.decode_page.
+        """
+        for page in self.iter_pages(method, *args, prefetch=prefetch, **kwargs):
+            yield decode_page(page, as_arrow=True)
+
+    def iter_dataframes(self, method: Callable[..., Dict[str, Any]], *args, chunk_size: int = 100_000,
+                        prefetch: bool = False, **kwargs) -> Iterator[pd.DataFrame]:
+        """
+        Yield DataFrames of chunk_size rows (the last one may be shorter) with a symbol column,
+        so a day of tick data is processed chunk by chunk instead of held in memory at once.
+        """
+        pending, rows = [], 0
+        for table in self.iter_tables(method, *args, prefetch=prefetch, **kwargs):
+            pending.append(table)
+            rows += table.num_rows
+            while rows >= chunk_size:
+                combined = pa.concat_tables(pending, promote_options="permissive")
+                yield combined.slice(0, chunk_size).to_pandas()
+                pending, rows = [combined.slice(chunk_size)], rows - chunk_size
+        if rows:
+            yield pa.concat_tables(pending, promote_options="permissive").to_pandas()
+
     # ==========================================
     # Stock Pricing Data API (v2)
     # ==========================================
@@ -0,0 +1,65 @@
+''' columnar decoding of alpaca bars / trades / quotes pages
+eg. page = client.get_multi_stock_quotes(["AAPL", "MSFT"], "2024-01-02")
+    decode_page(page)                    # DataFrame: symbol, timestamp, ask_exchange, ask_price, ask_size, ...
+    decode_page(page, as_arrow=True)     # pyarrow Table with the same columns
+
+records go straight into an arrow struct array (built in C++, no per-record python work), then each short
+field is cast to its column type: timestamps int64 ns UTC, prices float64, exchange / tape / symbol
+dictionary encoded (pandas categorical). Sizes keep the inferred type, int64 for stocks, float64 for crypto.'''
+from itertools import chain
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+FIELD_NAMES = {
+    'bars': {'t': 'timestamp', 'o': 'open', 'h': 'high', 'l': 'low', 'c': 'close', 'v': 'volume',
+             'n': 'trade_count', 'vw': 'vwap'},
+    'trades': {'t': 'timestamp', 'x': 'exchange', 'p': 'price', 's': 'size', 'c': 'conditions', 'i': 'id',
+               'z': 'tape', 'tks': 'taker_side'},
+    'quotes': {'t': 'timestamp', 'ax': 'ask_exchange', 'ap': 'ask_price', 'as': 'ask_size', 'bx': 'bid_exchange',
+               'bp': 'bid_price', 'bs': 'bid_size', 'c': 'conditions', 'z': 'tape'},
+}
+FLOAT_COLUMNS = {'open', 'high', 'low', 'close', 'vwap', 'price', 'ask_price', 'bid_price'}
+CATEGORICAL_COLUMNS = {'symbol', 'exchange', 'ask_exchange', 'bid_exchange', 'tape', 'taker_side'}
+TIMESTAMP_TYPE = pa.timestamp('ns', 'UTC')
+
+
+def page_kind(page: dict) -> str:
+    for kind in FIELD_NAMES:
+        if kind in page:
+            return kind
+    raise KeyError(f"no bars, trades or quotes in page with keys {list(page)}")
+
+
+def cast_column(name: str, column: pa.Array) -> pa.Array:
+    if name == 'timestamp':
+        return pc.cast(column, TIMESTAMP_TYPE)
+    if name in FLOAT_COLUMNS:
+        return pc.cast(column, pa.float64())
+    if name in CATEGORICAL_COLUMNS:
+        return column.dictionary_encode()
+    return column
+
+
+def records_to_table(records: list, kind: str, symbols: pa.Array = None) -> pa.Table:
+    struct = pa.array(records) if records else pa.array([], pa.struct([('t', pa.string())]))
+    names = FIELD_NAMES[kind]
+    columns = {} if symbols is None else {'symbol': cast_column('symbol', symbols)}
+    for i, field in enumerate(struct.type):
+        name = names.get(field.name, field.name)
+        columns[name] = cast_column(name, struct.field(i))
+    return pa.table(columns)
+
+
+def decode_page(page: dict, as_arrow: bool = False):
+    ''' one page of a single or multi symbol bars / trades / quotes response '''
+    kind = page_kind(page)
+    data = page[kind]
+    if isinstance(data, dict):  # multi symbol, {"AAPL": [...], "MSFT": [...]}
+        counts = [len(v or []) for v in data.values()]
+        symbols = pc.take(pa.array(list(data), pa.string()), pa.array(np.repeat(np.arange(len(counts)), counts)))
+        table = records_to_table(list(chain.from_iterable(v or [] for v in data.values())), kind, symbols)
+    else:
+        symbols = pa.array([page.get('symbol')] * len(data or []), pa.string()) if page.get('symbol') else None
+        table = records_to_table(data or [], kind, symbols)
+    return table if as_arrow else table.to_pandas()
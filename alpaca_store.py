@@ -0,0 +1,124 @@
+''' local store of alpaca trades / quotes / bars, one arrow IPC file per symbol per UTC day
+eg. store = AlpacaStore()
+    store.backfill(client, "AAPL", "2024-01-02", "2024-01-05", kind="trades", feed="iex")   # only fetches days not stored yet
+    store.load("AAPL", "2024-01-02T14:30:00Z", "2024-01-02T15:00:00Z", kind="trades")       # pyarrow Table, memory mapped
+    store.load("AAPL", "2024-01-02", "2024-01-03", kind="bars", timeframe="1Min")
+
+layout: .cache/alpaca/<kind>/<symbol>/<YYYY-MM-DD>.arrow plus index.json per symbol, day -> [rows, first_ns, last_ns],
+bars are kept per timeframe under bars_<timeframe>.
+A day is only marked complete once it has ended when fetched, so today's partition is refetched on the next backfill.
+load memory maps the partitions overlapping the range and slices them by timestamp, no rows are copied.'''
+import json
+import os
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+pwd = os.path.dirname(os.path.realpath(__file__))
+default_store_dir = os.environ.get("ALPACA_STORE_DIR", pwd + "/.cache/alpaca")
+
+DAY_NS = 86_400 * 10**9
+KINDS = ("trades", "quotes", "bars")
+
+
+def utc_ns(t) -> int:
+    t = pd.Timestamp(t)
+    return (t.tz_localize("UTC") if t.tzinfo is None else t.tz_convert("UTC")).value
+
+
+def store_kind(kind: str, timeframe: str = "1Min") -> str:
+    ''' directory of a kind, bars_<timeframe> for bars '''
+    if kind not in KINDS:
+        raise ValueError(f"unknown kind {kind!r}, expected one of {KINDS}")
+    return f"bars_{timeframe}" if kind == "bars" else kind
+
+
+class AlpacaStore:
+    def __init__(self, store_dir: str = default_store_dir):
+        self.store_dir = store_dir
+
+    def symbol_dir(self, symbol: str, kind: str) -> str:
+        return os.path.join(self.store_dir, kind, symbol.replace("/", "_"))
+
+    def index(self, symbol: str, kind: str) -> dict:
+        try:
+            with open(os.path.join(self.symbol_dir(symbol, kind), "index.json")) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def save_index(self, symbol: str, kind: str, index: dict):
+        path = os.path.join(self.symbol_dir(symbol, kind), "index.json")
+        with open(path + ".tmp", 'w') as f:
+            json.dump(index, f, sort_keys=True)
+        os.replace(path + ".tmp", path)
+
+    @staticmethod
+    def days(start_ns: int, end_ns: int) -> list:
+        ''' UTC days overlapping [start_ns, end_ns) '''
+        return [str(pd.Timestamp(d, unit='ns').date()) for d in range(start_ns - start_ns % DAY_NS, end_ns, DAY_NS)]
+
+    def missing_days(self, symbol: str, start, end, kind: str = "trades", timeframe: str = "1Min") -> list:
+        index = self.index(symbol, store_kind(kind, timeframe))
+        return [day for day in self.days(utc_ns(start), utc_ns(end)) if day not in index]
+
+    def write_day(self, symbol: str, kind: str, day: str, table: pa.Table):
+        path = os.path.join(self.symbol_dir(symbol, kind), day + ".arrow")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if 'timestamp' in table.column_names and table.num_rows:
+            table = table.sort_by('timestamp')
+        table = table.unify_dictionaries().combine_chunks()  # the ipc file format allows one dictionary per column
+        with pa.OSFile(path + ".tmp", 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)  # uncompressed so it can be memory mapped
+        os.replace(path + ".tmp", path)
+
+    def backfill(self, client, symbol: str, start, end, kind: str = "trades", timeframe: str = "1Min", **kwargs) -> int:
+        ''' fetch and store every day in [start, end) that is not stored yet, returns the number of rows fetched
+        kind is trades, quotes or bars (bars are stored per timeframe), kwargs go to the client method eg. feed="iex" '''
+        directory = store_kind(kind, timeframe)
+        method = {"trades": client.get_stock_trades, "quotes": client.get_stock_quotes}.get(kind)
+        index = self.index(symbol, directory)
+        fetched = 0
+        for day in self.missing_days(symbol, start, end, kind, timeframe):
+            day_start = pd.Timestamp(day, tz="UTC")
+            day_end = day_start + pd.Timedelta(days=1)
+            window = dict(start=day_start.isoformat().replace("+00:00", "Z"),
+                          end=day_end.isoformat().replace("+00:00", "Z"), limit=10000, **kwargs)
+            if method:
+                tables = list(client.iter_tables(method, symbol, **window))
+            else:
+                tables = list(client.iter_tables(client.get_stock_bars, symbol, timeframe, **window))
+            tables = [t for t in tables if t.num_rows]
+            table = pa.concat_tables(tables, promote_options="permissive") if tables else pa.table({
+                'timestamp': pa.array([], pa.timestamp('ns', 'UTC'))})
+            self.write_day(symbol, directory, day, table)
+            fetched += table.num_rows
+            if day_end <= pd.Timestamp.now(tz="UTC"):
+                bounds = pc.min_max(table.column('timestamp').cast(pa.int64()))
+                index[day] = [table.num_rows, bounds['min'].as_py(), bounds['max'].as_py()]
+                self.save_index(symbol, directory, index)
+        return fetched
+
+    def load(self, symbol: str, start, end, kind: str = "trades", timeframe: str = "1Min") -> pa.Table:
+        ''' rows with start <= timestamp < end, zero copy slices of the memory mapped day files '''
+        start_ns, end_ns = utc_ns(start), utc_ns(end)
+        kind = store_kind(kind, timeframe)
+        index = self.index(symbol, kind)
+        slices = []
+        for day in self.days(start_ns, end_ns):
+            rows, first, last = index.get(day, [None, None, None])
+            if rows == 0 or (first is not None and (last < start_ns or first >= end_ns)):
+                continue
+            path = os.path.join(self.symbol_dir(symbol, kind), day + ".arrow")
+            if not os.path.exists(path):
+                continue
+            table = pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+            if not table.num_rows:
+                continue
+            ts = table.column('timestamp').cast(pa.int64()).to_numpy()
+            i, j = np.searchsorted(ts, [start_ns, end_ns], side='left')
+            slices.append(table.slice(i, j - i))
+        if not slices:
+            return pa.table({'timestamp': pa.array([], pa.timestamp('ns', 'UTC'))})
+        return pa.concat_tables(slices, promote_options="permissive")
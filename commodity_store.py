@@ -0,0 +1,140 @@
+''' local store of the LBMA gold and silver fixes from Nasdaq Data Link, refreshed incrementally
+eg. gold = commodity_prices("GOLD")                       # Series of the USD (PM) fix, DATE index
+    gold_1200px = minmax_downsample(gold, 1200)          # at most 2 points per pixel column, peaks kept
+
+every column of a dataset is kept in .cache/commodities.sqlite. The first call downloads the full history, later
+ones ask only for rows from start_date = last stored date - OVERLAP_DAYS (corrections are replaced), and only once
+the next fix can have been published and RECHECK_HOURS have passed since the previous check.
+The API key comes from the NASDAQ_DATA_LINK_API_KEY environment variable.'''
+import io
+import os
+import sqlite3
+import time
+from contextlib import closing
+from functools import partial
+from typing import Optional
+import numpy as np
+import pandas as pd
+import http_session
+import miniEnc as enc
+from fetch_pool import FetchPool
+
+pwd = os.path.dirname(os.path.realpath(__file__))
+default_cache_dir = os.environ.get("COMMODITY_CACHE_DIR", pwd + "/.cache")
+
+NASDAQ_URL = "https://data.nasdaq.com/api/v3/datasets/{dataset}.csv"
+NASDAQ_HOST = "data.nasdaq.com"
+RECHECK_HOURS = 6
+OVERLAP_DAYS = 7
+
+# name: (Nasdaq Data Link dataset, column charted by default)
+COMMODITIES = {
+    'GOLD': ('LBMA/GOLD', 'USD (PM)'),
+    'SILVER': ('LBMA/SILVER', 'USD'),
+}
+
+
+def nasdaq_api_key() -> str:
+    return os.environ.get("NASDAQ_DATA_LINK_API_KEY") or enc.decode(enc.cccccccz, b'ud--wr-4nbzKnr-5tIzCmZjBo6o')
+
+
+def minmax_downsample(series: pd.Series, buckets: int) -> pd.Series:
+    ''' keep the lowest and highest point of each of buckets equal slices, so spikes survive the thinning '''
+    series = series.dropna()
+    if len(series) <= 2 * buckets:
+        return series
+    values = series.to_numpy()
+    bucket = np.arange(len(values)) * buckets // len(values)
+    order = np.lexsort((values, bucket))  # by bucket, then by value: first of a bucket is its low, last its high
+    starts = np.flatnonzero(np.r_[True, bucket[order][1:] != bucket[order][:-1]])
+    ends = np.r_[starts[1:], len(order)] - 1
+    return series.iloc[np.union1d(order[starts], order[ends])]
+
+
+class CommodityStore:
+    def __init__(self, cache_dir: str = default_cache_dir, api_key: str = None):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.db_path = os.path.join(cache_dir, "commodities.sqlite")
+        self.api_key = api_key or nasdaq_api_key()
+        self.pool = FetchPool(max_workers=len(COMMODITIES), per_host=len(COMMODITIES))
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute('''CREATE TABLE IF NOT EXISTS prices (
+                dataset TEXT NOT NULL, date TEXT NOT NULL, field TEXT NOT NULL, value REAL,
+                PRIMARY KEY (dataset, date, field))''')
+            conn.execute('''CREATE TABLE IF NOT EXISTS datasets (
+                dataset TEXT PRIMARY KEY, last_date TEXT, checked_at REAL NOT NULL)''')
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def fetch_start(self, dataset: str, now: float) -> Optional[str]:
+        ''' "" for a full download, a start_date for an incremental one, or None if the stored copy is up to date '''
+        with closing(self._connect()) as conn:
+            state = conn.execute("SELECT last_date, checked_at FROM datasets WHERE dataset = ?", (dataset,)).fetchone()
+        if state is None or state[0] is None:
+            return ""
+        last = pd.Timestamp(state[0])
+        if pd.Timestamp(now, unit='s') < last + pd.offsets.BDay(1) or now - state[1] < RECHECK_HOURS * 3600:
+            return None
+        return str((last - pd.DateOffset(days=OVERLAP_DAYS)).date())
+
+    def download(self, dataset: str, start_date: str) -> pd.DataFrame:
+        params = {"api_key": self.api_key, "order": "asc"}
+        if start_date:
+            params["start_date"] = start_date
+        r = http_session.get(NASDAQ_URL.format(dataset=dataset), params=params)
+        r.raise_for_status()
+        return pd.read_csv(io.BytesIO(r.content))
+
+    def write(self, dataset: str, df: pd.DataFrame, now: float):
+        dates = pd.to_datetime(df['Date']).dt.strftime('%Y-%m-%d')
+        df_long = df.drop(columns='Date').set_index(dates).rename_axis('date').melt(ignore_index=False).reset_index()
+        rows = [(dataset, d, c, None if pd.isna(v) else float(v)) for d, c, v in df_long.itertuples(index=False)]
+        last_date = dates.max() if len(dates) else None
+        with closing(self._connect()) as conn, conn:
+            conn.executemany("INSERT OR REPLACE INTO prices VALUES (?, ?, ?, ?)", rows)
+            conn.execute('''INSERT INTO datasets (dataset, last_date, checked_at) VALUES (?, ?, ?)
+                ON CONFLICT (dataset) DO UPDATE SET
+                last_date = NULLIF(MAX(COALESCE(last_date, ''), COALESCE(excluded.last_date, '')), ''),
+                checked_at = excluded.checked_at''', (dataset, last_date, now))
+
+    def refresh(self, names: list) -> dict:
+        ''' download the new rows of every dataset that is due, concurrently, returns {dataset: error} '''
+        now = time.time()
+        datasets = [COMMODITIES[name][0] for name in names]
+        due = {d: self.fetch_start(d, now) for d in datasets}
+        jobs = {d: partial(self.download, d, start) for d, start in due.items() if start is not None}
+        results, errors = self.pool.run(jobs, host=NASDAQ_HOST)
+        for dataset, df in results.items():
+            self.write(dataset, df, now)
+        for dataset, e in errors.items():
+            print(f"Error downloading {dataset}: {e}")
+        return errors
+
+    def read(self, name: str, column: str = None, start_date: str = None) -> pd.Series:
+        dataset, default_column = COMMODITIES[name]
+        with closing(self._connect()) as conn:
+            df = pd.read_sql_query(
+                "SELECT date, value FROM prices WHERE dataset = ? AND field = ? AND date >= ? ORDER BY date",
+                conn, params=[dataset, column or default_column, start_date or ""])
+        return pd.Series(df['value'].to_numpy(), index=pd.DatetimeIndex(pd.to_datetime(df['date']), name='DATE'),
+                         name=name)
+
+    def get(self, name: str, column: str = None, start_date: str = None) -> pd.Series:
+        self.refresh([name])
+        return self.read(name, column, start_date)
+
+
+_store = None
+
+
+def commodity_store() -> CommodityStore:
+    global _store
+    if _store is None:
+        _store = CommodityStore()
+    return _store
+
+
+def commodity_prices(name: str, column: str = None, start_date: str = None) -> pd.Series:
+    return commodity_store().get(name, column, start_date)
@@ -0,0 +1,101 @@
+''' convert amounts in any currency to a base currency (GBP by default) with indexed rate lookups
+eg. fx = FXConverter.from_yahoo(["USD", "EUR", "GBp"], "2021-01-04")
+    fx.to_base(df['Market Value'], df['Currency'])                 # latest rate
+    fx.to_base(df['Cost/Proceeds'], df['Currency'], df['Date'])    # rate on or before each trade date
+
+rates hold units of currency per one base unit, the close of yahoo pair f"{base}{currency}=X", eg GBPUSD=X.
+Minor units (yahoo quotes LSE prices in GBp/GBX pence) are converted to their major currency explicitly
+with MINOR_UNITS instead of guessing from the ticker suffix. A currency without a rate (missing, or a pair yahoo
+did not return) converts to NaN, fx.unknown(currencies) lists them so the caller can warn once.
+Rows whose currency is missing altogether can be filled with infer_currencies first.'''
+import numpy as np
+import pandas as pd
+from market_data_api import yahoo_batch_download
+
+MINOR_UNITS = {'GBp': ('GBP', 0.01), 'GBX': ('GBP', 0.01), 'ZAc': ('ZAR', 0.01), 'ILA': ('ILS', 0.01)}
+# yahoo ticker suffix -> trade currency, a ticker without suffix is US listed
+SUFFIX_CURRENCIES = {'.L': 'GBP', '.DE': 'EUR', '.PA': 'EUR', '.AS': 'EUR', '.MI': 'EUR', '.MC': 'EUR'}
+
+
+def infer_currencies(currencies, tickers, markets=None) -> pd.Series:
+    ''' currencies with the missing ones taken from the ticker suffix, or from the IG market name
+    when the ticker is missing too ("... (All Sessions)" markets are US shares), NaN if neither tells '''
+    currencies = pd.Series(currencies, dtype=object).reset_index(drop=True)
+    tickers = pd.Series(tickers, dtype=object).reset_index(drop=True)
+    suffix = tickers.str.extract(r'(\.[A-Z]+)$', expand=False)
+    from_ticker = suffix.map(SUFFIX_CURRENCIES).where(suffix.notna(), tickers.map(lambda t: 'USD', na_action='ignore'))
+    filled = currencies.fillna(from_ticker)
+    if markets is not None:
+        us = pd.Series(markets, dtype=object).reset_index(drop=True).str.contains('(All Sessions)', regex=False, na=False)
+        filled = filled.where(filled.notna() | ~us, 'USD')
+    return filled
+
+
+def normalise_minor_units(amounts, currencies) -> tuple:
+    ''' returns (amounts in major units as float64 array, major currency codes as object array) '''
+    amounts = np.asarray(amounts, dtype=np.float64)
+    currencies = pd.Series(currencies, dtype=object).reset_index(drop=True)
+    scale = currencies.map({c: s for c, (_, s) in MINOR_UNITS.items()}).fillna(1.0).to_numpy(dtype=np.float64)
+    majors = currencies.replace({c: m for c, (m, _) in MINOR_UNITS.items()}).to_numpy(dtype=object)
+    return amounts * scale, majors
+
+
+class FXConverter:
+    def __init__(self, rates: pd.DataFrame, base: str = 'GBP'):
+        rates = rates.copy()
+        rates.index = pd.to_datetime(rates.index)
+        rates = rates[~rates.index.duplicated(keep='last')].sort_index()
+        rates[base] = 1.0
+        self.base = base
+        self.rates = rates.ffill().bfill()
+        self.dates = self.rates.index.to_numpy()
+        self.values = self.rates.to_numpy(dtype=np.float64)
+
+    @classmethod
+    def from_yahoo(cls, currencies, start_date: str, base: str = 'GBP') -> 'FXConverter':
+        majors = {MINOR_UNITS.get(c, (c, 1.0))[0] for c in currencies if isinstance(c, str)}
+        pairs = {f"{base}{c}=X": c for c in sorted(majors - {base})}
+        df_fx, errors = yahoo_batch_download([(pair, start_date, None) for pair in pairs])
+        if errors:
+            print(f"Error retrieving fx rates for {list(errors)}")
+        if df_fx.empty:
+            return cls(pd.DataFrame(index=pd.to_datetime([start_date])), base)
+        rates = df_fx.pivot_table(index='Date', columns='ticker', values='close', aggfunc='last')
+        return cls(rates.rename(columns=pairs), base)
+
+    def column_positions(self, currencies: np.ndarray) -> np.ndarray:
+        ''' column of each currency in values, -1 for a currency without rates '''
+        return self.rates.columns.get_indexer(pd.Index(currencies, dtype=object))
+
+    def lookup(self, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+        return np.where(cols < 0, np.nan, self.values[rows, np.maximum(cols, 0)])
+
+    def unknown(self, currencies) -> list:
+        ''' currencies that convert to NaN, "missing" standing for empty currencies '''
+        _, majors = normalise_minor_units(np.zeros(len(currencies)), currencies)
+        cols = self.column_positions(majors)
+        return sorted({c if isinstance(c, str) else "missing" for c in majors[cols < 0]})
+
+    def latest(self) -> pd.Series:
+        return self.rates.iloc[-1]
+
+    def rate(self, currencies, dates=None) -> np.ndarray:
+        ''' units of each currency per base unit, latest or on/before each date '''
+        cols = self.column_positions(np.asarray(currencies, dtype=object))
+        if dates is None:
+            return self.lookup(np.full(len(cols), len(self.dates) - 1), cols)
+        rows = np.searchsorted(self.dates, pd.to_datetime(dates).to_numpy(), side='right') - 1
+        return self.lookup(np.clip(rows, 0, len(self.dates) - 1), cols)
+
+    def to_base(self, amounts, currencies, dates=None) -> np.ndarray:
+        amounts, majors = normalise_minor_units(amounts, currencies)
+        return amounts / self.rate(majors, dates)
+
+    def rate_matrix(self, currencies, dates: pd.DatetimeIndex) -> pd.DataFrame:
+        ''' base units per one unit of each currency on each date, for broadcasting against a value matrix '''
+        majors = [MINOR_UNITS.get(c, (c, 1.0)) for c in currencies]
+        cols = self.column_positions(np.asarray([m for m, _ in majors], dtype=object))
+        rows = np.clip(np.searchsorted(self.dates, dates.to_numpy(), side='right') - 1, 0, len(self.dates) - 1)
+        scale = np.array([s for _, s in majors], dtype=np.float64)
+        return pd.DataFrame(scale[np.newaxis, :] / self.lookup(rows[:, np.newaxis], cols[np.newaxis, :]),
+                            index=dates, columns=list(currencies))
@@ -0,0 +1,69 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Hashable, Optional
+
+# per-host slots are shared by every pool in the process, so two dashboard sessions
+# fetching at the same time still respect the host limit together
+_host_slots: Dict[str, threading.BoundedSemaphore] = {}
+_host_slots_lock = threading.Lock()
+
+
+def host_slot(host: str, limit: int) -> threading.BoundedSemaphore:
+    with _host_slots_lock:
+        if host not in _host_slots:
+            _host_slots[host] = threading.BoundedSemaphore(limit)
+        return _host_slots[host]
+
+
+class FetchPool:
+    ''' bounded thread pool for I/O bound fetches with a per-host concurrency cap
+    eg. pool = FetchPool(max_workers=8, per_host=4)
+        results, errors = pool.run({"MSCI": partial(fetch, "MSCI"), "FDS": partial(fetch, "FDS")},
+                                   host="query1.finance.yahoo.com")
+    results and errors are dicts keyed like the jobs, results keep the order of the jobs
+    pool.stats[key] accumulates calls, errors, total / last latency in seconds and the last error of each job key'''
+
+    def __init__(self, max_workers: int = 8, per_host: int = 4):
+        self.max_workers = max_workers
+        self.per_host = per_host
+        self.stats: Dict[Hashable, dict] = {}
+        self.stats_lock = threading.Lock()
+
+    def record(self, key: Hashable, latency: float, error: Optional[Exception]):
+        with self.stats_lock:
+            stat = self.stats.setdefault(key, {'calls': 0, 'errors': 0, 'total_latency': 0.0,
+                                               'last_latency': 0.0, 'last_error': None})
+            stat['calls'] += 1
+            stat['errors'] += error is not None
+            stat['total_latency'] += latency
+            stat['last_latency'] = latency
+            stat['last_error'] = None if error is None else repr(error)
+
+    def run(self, jobs: Dict[Hashable, Callable], host: Optional[str] = None) -> tuple:
+        slot = host_slot(host, self.per_host) if host else None
+
+        def call(key, fn):
+            start, error = time.perf_counter(), None
+            try:
+                if slot is None:
+                    return fn()
+                with slot:
+                    return fn()
+            except Exception as e:
+                error = e
+                raise
+            finally:
+                self.record(key, time.perf_counter() - start, error)
+
+        results, errors = {}, {}
+        if not jobs:
+            return results, errors
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(jobs))) as executor:
+            futures = {key: executor.submit(call, key, fn) for key, fn in jobs.items()}
+        for key, future in futures.items():
+            try:
+                results[key] = future.result()
+            except Exception as e:
+                errors[key] = e
+        return results, errors
@@ -0,0 +1,179 @@
+''' one finnhub websocket per process, shared by every streamlit session
+eg. view = get_stream_manager().view()     # one per session, eg. kept in st.session_state
+    view.set_symbols(["AAPL", "BINANCE:BTCUSDT"])
+    version, symbols = view.snapshot()      # latest price and OHLCV bars of this view's symbols only
+
+symbols are reference counted across views: the first view to ask for a symbol sends the subscribe message,
+the last one to drop it sends unsubscribe, and the socket is closed when no symbol is left.
+A dropped connection is reopened with exponential backoff (1s doubling to 60s) and every symbol resubscribed.
+The token comes from the FINNHUB_TOKEN environment variable or streamlit secrets.'''
+import json
+import os
+import random
+import threading
+import weakref
+from collections import Counter
+import websocket
+from tick_buffer import CoalescingTickBuffer
+
+FINNHUB_WS_URL = "wss://ws.finnhub.io"
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+class FinnhubStreamManager:
+    def __init__(self, token: str, buffer: CoalescingTickBuffer = None, max_backoff: float = 60.0):
+        self.url = f"{FINNHUB_WS_URL}?token={token}"
+        self.buffer = buffer or CoalescingTickBuffer(interval=1.0, max_bars=300)
+        self.max_backoff = max_backoff
+        self.backoff = 1.0
+        self.refcount = Counter()
+        self.lock = threading.Lock()
+        self.ws = None
+        self.thread = None
+        self.connected = False
+        self.stopped = threading.Event()
+
+    # ---- reference counted subscriptions
+    def acquire(self, symbols):
+        with self.lock:
+            new = [s for s in symbols if self.refcount[s] == 0]
+            self.refcount.update(symbols)
+            if self.connected:
+                for symbol in new:
+                    self.send({"type": "subscribe", "symbol": symbol})
+            if self.refcount:
+                self.stopped.clear()  # a closing connection thread sees this and reconnects instead of exiting
+            if self.refcount and (self.thread is None or not self.thread.is_alive()):
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+
+    def release(self, symbols):
+        with self.lock:
+            dropped = []
+            for symbol in symbols:
+                if self.refcount[symbol] > 0:
+                    self.refcount[symbol] -= 1
+                if self.refcount[symbol] <= 0:
+                    del self.refcount[symbol]
+                    dropped.append(symbol)
+            if self.connected:
+                for symbol in dropped:
+                    self.send({"type": "unsubscribe", "symbol": symbol})
+            self.buffer.discard(dropped)
+            if not self.refcount:
+                self.stopped.set()
+                if self.ws is not None:
+                    self.ws.close()
+
+    def symbols(self) -> list:
+        with self.lock:
+            return sorted(self.refcount)
+
+    def view(self) -> 'StreamView':
+        return StreamView(self)
+
+    # ---- connection
+    def send(self, message: dict):
+        try:
+            self.ws.send(json.dumps(message))
+        except Exception as e:
+            print(f"Finnhub send failed: {e}")
+
+    def on_open(self, ws):
+        with self.lock:
+            self.connected = True
+            self.backoff = 1.0
+            for symbol in self.refcount:
+                self.send({"type": "subscribe", "symbol": symbol})
+        print(f"Finnhub stream opened, subscribed to {sorted(self.refcount)}")
+
+    def on_message(self, ws, message):
+        try:
+            data = json.loads(message)
+        except ValueError as e:
+            print(f"Error parsing message: {e}")
+            return
+        if data.get('type') == 'trade':
+            self.buffer.on_trades(data.get('data') or [])
+        elif data.get('type') != 'ping':
+            print(f"Received message: {message}")
+
+    def on_error(self, ws, error):
+        print(f"Finnhub WebSocket Error: {error}")
+
+    def on_close(self, ws, close_status_code, close_msg):
+        self.connected = False
+        print("### finnhub stream closed ###")
+
+    def exiting(self) -> bool:
+        ''' decided under the lock: an acquire either sees no thread and starts one, or keeps this one running '''
+        with self.lock:
+            if self.refcount:
+                self.stopped.clear()
+                return False
+            self.thread = None
+            return True
+
+    def run(self):
+        self.backoff = 1.0
+        while True:
+            if self.stopped.is_set() and self.exiting():
+                return
+            self.ws = websocket.WebSocketApp(self.url, on_open=self.on_open, on_message=self.on_message,
+                                             on_error=self.on_error, on_close=self.on_close)
+            self.ws.run_forever(ping_interval=20, ping_timeout=10)
+            self.connected = False
+            if self.stopped.is_set() and self.exiting():
+                return
+            wait = self.backoff * random.uniform(0.5, 1.0)  # jitter so restarted processes do not reconnect together
+            print(f"Finnhub stream reconnecting in {wait:.1f}s")
+            self.stopped.wait(wait)
+            self.backoff = min(self.backoff * 2, self.max_backoff)
+
+
+class StreamView:
+    ''' the symbols one session watches, released when the view is closed or garbage collected with its session '''
+    def __init__(self, manager: FinnhubStreamManager):
+        self.manager = manager
+        self.symbols = set()
+        self._finalizer = weakref.finalize(self, manager.release, self.symbols)
+
+    def set_symbols(self, symbols):
+        symbols = {s.strip() for s in symbols if s and s.strip()}
+        added, removed = symbols - self.symbols, self.symbols - symbols
+        self.symbols.difference_update(removed)
+        self.symbols.update(added)
+        if added:
+            self.manager.acquire(added)
+        if removed:
+            self.manager.release(removed)
+
+    def snapshot(self) -> tuple:
+        version, symbols = self.manager.buffer.snapshot()
+        return version, {s: ticks for s, ticks in symbols.items() if s in self.symbols}
+
+    def close(self):
+        self.set_symbols([])
+
+
+def finnhub_token() -> str:
+    token = os.environ.get("FINNHUB_TOKEN")
+    if not token:
+        try:
+            import streamlit as st
+            token = st.secrets.get("FINNHUB_TOKEN")
+        except Exception:  # streamlit not installed, or no secrets.toml
+            token = None
+    if not token:
+        raise RuntimeError("FINNHUB_TOKEN is not set, export it or add it to .streamlit/secrets.toml")
+    return token
+
+
+def get_stream_manager() -> FinnhubStreamManager:
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = FinnhubStreamManager(finnhub_token())
+        return _manager
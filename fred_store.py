@@ -0,0 +1,133 @@
+''' local store of FRED series, refreshed incrementally and fetched in parallel
+eg. df = fred(["DGS10", "DGS2", "UNRATE"], "2020-01-01")   # wide frame, DATE index, one column per series
+
+observations are kept in .cache/fred.sqlite with the last observation date of each series. A series is only
+requested again once its next observation can have been published (next day for daily series, two periods after
+the last observation date for monthly / quarterly ones, which FRED dates at the start of the period), and at most
+every RECHECK_HOURS while a release is late. A refresh re-downloads a short overlap so revisions are picked up.
+Series are downloaded from the public fredgraph.csv endpoint on a FetchPool, no API key needed.'''
+import io
+import os
+import sqlite3
+import time
+from contextlib import closing
+from functools import partial
+from typing import Optional
+import pandas as pd
+import http_session
+from fetch_pool import FetchPool
+
+pwd = os.path.dirname(os.path.realpath(__file__))
+default_cache_dir = os.environ.get("FRED_CACHE_DIR", pwd + "/.cache")
+
+FRED_CSV_URL = "https://fred.stlouisfed.org/graph/fredgraph.csv"
+FRED_HOST = "fred.stlouisfed.org"
+RECHECK_HOURS = 6
+
+# observation frequency of the series used by macro_widgets, anything else is treated as daily
+SERIES_FREQUENCY = {
+    'A191RL1Q225SBEA': 'Q', 'GDP': 'Q',
+    'PCE': 'M', 'CPIAUCSL': 'M', 'CORESTICKM159SFRBATL': 'M', 'PCEPI': 'M', 'UNRATE': 'M', 'UMCSENT': 'M',
+}
+# how far back a refresh starts from the last stored observation, to pick up revisions
+REVISION_OVERLAP = {'D': pd.DateOffset(days=7), 'M': pd.DateOffset(months=3), 'Q': pd.DateOffset(months=12)}
+
+
+class FredStore:
+    def __init__(self, cache_dir: str = default_cache_dir, max_workers: int = 8):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.db_path = os.path.join(cache_dir, "fred.sqlite")
+        self.pool = FetchPool(max_workers=max_workers, per_host=max_workers)
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute('''CREATE TABLE IF NOT EXISTS observations (
+                series_id TEXT NOT NULL, date TEXT NOT NULL, value REAL,
+                PRIMARY KEY (series_id, date))''')
+            conn.execute('''CREATE TABLE IF NOT EXISTS series (
+                series_id TEXT PRIMARY KEY, start_date TEXT NOT NULL, last_date TEXT, checked_at REAL NOT NULL)''')
+
+    def _connect(self) -> sqlite3.Connection:
+        # one connection per call so the store can be shared by fetch threads
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def series_state(self, series_id: str) -> Optional[tuple]:
+        ''' (start_date, last_date, checked_at) or None if the series was never fetched '''
+        with closing(self._connect()) as conn:
+            return conn.execute("SELECT start_date, last_date, checked_at FROM series WHERE series_id = ?",
+                                (series_id,)).fetchone()
+
+    def fetch_start(self, series_id: str, start_date: str, now: float) -> Optional[str]:
+        ''' date to download series_id from, or None if the stored copy is up to date '''
+        state = self.series_state(series_id)
+        if state is None or start_date < state[0]:
+            return start_date
+        stored_start, last_date, checked_at = state
+        if last_date is None:
+            return stored_start if now - checked_at > RECHECK_HOURS * 3600 else None
+        frequency = SERIES_FREQUENCY.get(series_id, 'D')
+        last = pd.Timestamp(last_date)
+        # FRED dates monthly / quarterly observations at the start of the period, published after the period ends
+        next_release = last + (pd.DateOffset(days=1) if frequency == 'D' else 2 * pd.tseries.frequencies.to_offset(frequency + 'S'))
+        if pd.Timestamp(now, unit='s') < next_release or now - checked_at < RECHECK_HOURS * 3600:
+            return None
+        return max(stored_start, str((last - REVISION_OVERLAP[frequency]).date()))
+
+    def download(self, series_id: str, start_date: str) -> pd.Series:
+        r = http_session.get(FRED_CSV_URL, params={"id": series_id, "cosd": start_date})
+        r.raise_for_status()
+        df = pd.read_csv(io.BytesIO(r.content), na_values=".")
+        # first column is the date, named DATE or observation_date depending on the FRED release
+        return pd.Series(pd.to_numeric(df.iloc[:, 1], errors='coerce').to_numpy(),
+                         index=pd.to_datetime(df.iloc[:, 0]).dt.strftime('%Y-%m-%d'), name=series_id)
+
+    def write(self, series_id: str, start_date: str, observations: pd.Series, now: float):
+        rows = [(series_id, d, None if pd.isna(v) else float(v)) for d, v in observations.items()]
+        last_date = observations.dropna().index.max() if observations.notna().any() else None
+        with closing(self._connect()) as conn, conn:
+            conn.executemany("INSERT OR REPLACE INTO observations VALUES (?, ?, ?)", rows)
+            conn.execute('''INSERT INTO series (series_id, start_date, last_date, checked_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT (series_id) DO UPDATE SET
+                start_date = MIN(start_date, excluded.start_date),
+                last_date = NULLIF(MAX(COALESCE(last_date, ''), COALESCE(excluded.last_date, '')), ''),
+                checked_at = excluded.checked_at''',
+                (series_id, start_date, last_date, now))
+
+    def refresh(self, series_ids: list, start_date: str) -> dict:
+        ''' download every series that is missing or due, concurrently, returns {series_id: error} '''
+        now = time.time()
+        due = {s: self.fetch_start(s, start_date, now) for s in series_ids}
+        jobs = {s: partial(self.download, s, start) for s, start in due.items() if start is not None}
+        results, errors = self.pool.run(jobs, host=FRED_HOST)
+        for series_id, observations in results.items():
+            self.write(series_id, due[series_id], observations, now)
+        for series_id, e in errors.items():
+            print(f"Error downloading FRED series {series_id}: {e}")
+        return errors
+
+    def read(self, series_ids: list, start_date: str) -> pd.DataFrame:
+        placeholders = ",".join("?" * len(series_ids))
+        with closing(self._connect()) as conn:
+            df = pd.read_sql_query(
+                f"SELECT series_id, date, value FROM observations WHERE series_id IN ({placeholders}) AND date >= ?",
+                conn, params=[*series_ids, str(pd.Timestamp(start_date).date())])
+        df_wide = df.pivot(index='date', columns='series_id', values='value').reindex(columns=series_ids)
+        df_wide.index = pd.DatetimeIndex(pd.to_datetime(df_wide.index), name='DATE')
+        df_wide.columns.name = None
+        return df_wide.sort_index()
+
+    def get(self, series_ids, start_date) -> pd.DataFrame:
+        series_ids = [series_ids] if isinstance(series_ids, str) else list(series_ids)
+        start_date = str(pd.Timestamp(start_date).date())
+        self.refresh(series_ids, start_date)
+        return self.read(series_ids, start_date)
+
+
+_store = None
+
+
+def fred(series_ids, start_date) -> pd.DataFrame:
+    ''' same shape as pandas_datareader web.DataReader(series_ids, 'fred', start_date), served from the local store '''
+    global _store
+    if _store is None:
+        _store = FredStore()
+    return _store.get(series_ids, start_date)
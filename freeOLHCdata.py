@@ -1,15 +1,18 @@
-import requests
+import http_session
 import pandas as pd
+import requests
 from datetime import datetime
 import json
 import io
 import re
 import ast
 import miniEnc as enc
+from market_data_api import decode_yahoo_chart
 
 class OHLCData:
     ''' requests call to yahoo, iex, alpha vantage, polygon, eodhd, 12Data
     eg. MSCI = OHLCData("MSCI", "2022-08-08") # end date default to "today" and interval default to "1d"
+    for one schema across providers with failover use ohlc_router.get_bars("MSCI", "2022-08-08")
 
     yahooV8:        MSCI = OHLCData("MSCI", "2022-08-08", "2022-08-12", interval="1h").yahooDataV8()
                     supported interval ["1m", "2m", "5m", "15m", "30m", "1h", "1d","5d", "1wk", "1mo"]
@@ -80,19 +83,7 @@ class OHLCData:
         return int(datetime.strptime(date, '%Y-%m-%d').timestamp())
     
     def convert_json_to_df(self, json_data):
-        p = json.loads(json_data)
-        ohlc_json = p['chart']['result'][0]['indicators']['quote'][0]
-        dates = p['chart']['result'][0]['timestamp']
-        ohlc_df = pd.DataFrame.from_dict(ohlc_json)
-
-        if self.interval == "1d":
-            ohlc_df['Date'] = [datetime.fromtimestamp(x).date() for x in dates]
-        else:
-            ohlc_df['Date'] = [datetime.fromtimestamp(x) for x in dates] 
-        
-        ohlc_df.index = ohlc_df['Date']
-        
-        return ohlc_df
+        return decode_yahoo_chart(json_data, self.interval)
 
 
     def yahooDataV8(self):
@@ -105,8 +96,8 @@ class OHLCData:
         url = f"{baseurl}?period1={start_epoch}&period2={end_epoch}&interval={self.interval}&events=history"
       
         try:
-            r = requests.get(url, headers=self.header)
-            return self.convert_json_to_df(r.text)
+            r = http_session.get(url, headers=self.header)
+            return self.convert_json_to_df(r.content)
         except Exception as e:
             print(e)
             return None
@@ -119,7 +110,7 @@ class OHLCData:
         print(url)
 
         try:
-            r = requests.get(url, headers=self.header)
+            r = http_session.get(url, headers=self.header)
             df = pd.read_csv(io.StringIO(r.text), index_col=0, parse_dates=True)
             return df
         except Exception as e:
@@ -138,7 +129,7 @@ class OHLCData:
                 "apikey": k['alpha_vantage'] } 
 
         try:
-            r = requests.get(API_URL, data, headers=self.header)
+            r = http_session.get(API_URL, data, headers=self.header)
             df=pd.read_csv(io.StringIO(r.text))
             return df
         except Exception as e:
@@ -216,7 +207,7 @@ class OHLCData:
         print(params)
         
         try:
-            r = requests.get(OHLC_URL, params)
+            r = http_session.get(OHLC_URL, params)
             
             if len(r.text) > 0 and r.text!="Unknown symbol":
                 df = pd.read_csv(io.StringIO(r.text))
@@ -302,7 +293,8 @@ class OHLCData:
         "n": "transactions"
         }
 
-        response = requests.get(full_url, data)
+        response = http_session.get(full_url, data)
+        response.raise_for_status()
         parsed = json.loads(response.text)
 
         df_polygon = pd.DataFrame.from_dict(parsed['results'])
@@ -336,10 +328,10 @@ class OHLCData:
             raise ValueError("Invalid interval for eodhd")
 
         data = {**p, "from": self.start_date, "to": self.end_date, "fmt": "csv", "api_token": api['eodhd']}
-        response = requests.get(url, data)
-        print(response.text)
+        response = http_session.get(url, data)
         if response.text == "Ticker Not Found.":
             raise ValueError("Invalid symbol for eodhd")
+        response.raise_for_status()
         df = pd.read_csv(io.StringIO(response.text))
         df.set_index("Date", inplace=True)
         return df
@@ -379,13 +371,20 @@ class OHLCData:
 
         if type(symbol) == str:
             data = {"symbol": symbol, "interval": interval,  "format": fmt, "start_date": start_date, "end_date": end_date, "apikey": apikey}
-            response = requests.get(url, data)    
-            print(response.text)
+            response = http_session.get(url, data)    
+            response.raise_for_status()
+            if response.text.lstrip().startswith("{"):
+                # errors come back as json with HTTP 200, eg. {"code": 429, "message": "...", "status": "error"}
+                error = response.json()
+                code, message = error.get("code"), error.get("message")
+                if code in (400, 404):
+                    raise ValueError(f"Invalid symbol for twelveData: {message}")
+                raise requests.HTTPError(f"twelveData error {code}: {message}", response=response)
             df = pd.read_csv(io.StringIO(response.text), sep=";")
             df.set_index("datetime", inplace=True)
         elif type(symbol) == list:
             data = {"symbol": ",".join(symbol), "interval": interval,  "start_date": start_date, "end_date": end_date, "apikey": apikey}
-            response = requests.get(url, data)    
+            response = http_session.get(url, data)    
             df = pd.read_json(response.text)
             # concat all dict df into one
             l = []
@@ -1,57 +1,158 @@
 # from time import sleep
 from time import sleep
+from collections import Counter, deque
 import miniEnc as enc
 import ast
-import requests
+import http_session
 import numpy as np
-from datetime import datetime
+import os
+from datetime import datetime, time, timezone
+from zoneinfo import ZoneInfo
+from alpaca_client import AlpacaMarketDataClient
 from market_data_api import OHLC_YahooFinance
+from currency_conversion import normalise_minor_units
+from rate_limit import TokenBucket
 
 def chunks(l, n):
     ll = list(l)
     for i in range(0, len(ll), n):
         yield ll[i:i+n]
 
-def less_than_32_symbols(symbols_in_8s, k) -> dict:
+class TwelveDataEODScheduler:
+    ''' dispatch twelve data /eod batches across api keys as soon as a key has the credits for a batch
+    eg. close_price = TwelveDataEODScheduler(keys).fetch(["MSCI", "FDS", "AAPL"])
+    credits_per_minute is an int for all keys or a dict {api_key: credits}
+    symbols rejected for rate limit (code 429) or missing from the response are queued again, up to max_attempts,
+    symbols already priced are never requested twice '''
     url = "https://api.twelvedata.com/eod"
-    count = 0
-    close_price = {}
-    for each_8_symbols in symbols_in_8s:
-        params = {"symbol": ",".join(each_8_symbols), "apikey": k[count]}
-        count += 1
-        response = requests.get(url, params=params)
-        r = response.json()
-        for ticker in each_8_symbols:
-            try:
-                close_price[ticker] = r[ticker]["close"]
-            except KeyError:
-                try:
-                    close_price[ticker] = r["close"]
-                except:
-                    print("Keyerror", response.text)
-            try:
-                close_price[ticker] = r[ticker]["close"]
-            except KeyError:
-                try:
-                    close_price[ticker] = r["close"]
-                except:
-                    print("Keyerror", response.text)
-    return close_price
+
+    def __init__(self, api_keys: list, credits_per_minute=8, batch_size: int = 8, max_attempts: int = 3):
+        if not api_keys:
+            raise ValueError("TwelveDataEODScheduler needs at least one api key")
+        if isinstance(credits_per_minute, dict):
+            self.buckets = {k: TokenBucket(credits_per_minute.get(k, 8)) for k in api_keys}
+        else:
+            self.buckets = {k: TokenBucket(credits_per_minute) for k in api_keys}
+        if min(b.capacity for b in self.buckets.values()) < 1:
+            raise ValueError("credits_per_minute must be at least 1 for every api key")
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+
+    def fetch(self, symbols) -> dict:
+        pending = deque(dict.fromkeys(symbols))  # unique, keep order
+        attempts = Counter()
+        close_price = {}
+        while pending:
+            # a batch never asks for more credits than its key can hold, or it would wait forever
+            batch_for = lambda b: min(self.batch_size, len(pending), b.capacity)
+            key, bucket = max(self.buckets.items(), key=lambda kb: kb[1].available())
+            batch_size = batch_for(bucket)
+            if bucket.available() < batch_size:
+                wait = min(b.wait_time(batch_for(b)) for b in self.buckets.values())
+                print(f"waiting {wait:.1f} seconds for twelve data credits, {len(pending)} symbols left")
+                sleep(wait)
+                continue
+            batch = [pending.popleft() for _ in range(batch_size)]
+            bucket.take(batch_size)
+            prices, retry = self.request_batch(batch, key)
+            close_price.update(prices)
+            for ticker in retry:
+                attempts[ticker] += 1
+                if attempts[ticker] < self.max_attempts:
+                    pending.append(ticker)
+                else:
+                    print(f"giving up on {ticker} after {attempts[ticker]} attempts")
+        return close_price
+
+    def request_batch(self, batch: list, key: str) -> tuple:
+        ''' returns ({ticker: close}, [tickers to retry]) '''
+        response = http_session.get(self.url, params={"symbol": ",".join(batch), "apikey": key})
+        try:
+            r = response.json()
+        except ValueError:
+            print("Invalid response", response.status_code, response.text)
+            return {}, batch
+        if r.get("status") == "error":  # whole request rejected
+            print("Error", r.get("code"), r.get("message"))
+            if r.get("code") == 429:
+                self.buckets[key].drain()
+            return {}, batch if r.get("code") in (429, 500, 503) else []
+
+        close_price, retry = {}, []
+        for ticker in batch:
+            data = r if len(batch) == 1 else r.get(ticker)
+            if data is None:
+                retry.append(ticker)
+            elif "close" in data:
+                close_price[ticker] = data["close"]
+            elif data.get("code") == 429:
+                self.buckets[key].drain()
+                retry.append(ticker)
+            else:
+                print("Keyerror", ticker, data)
+        return close_price, retry
 
 
 def getEODpriceUSA(L) -> dict:
     g = b'z4zZpKqmm9jAubi2gLF8d3ja2Kqgz56eyJhpxarIo6msqIyeen6NhYOBf3ikr6nY0aGenZtsmZqtx6uspabGo4qNtomEgW9xYqDarKOmm56XanGTpJunqainnaOTvbiHfoR6qnneqKXU05GThF1pw6rKqtasp5umjIqItrB_gad1qaylpNDNn8iaa8OolZrR'
     k = ast.literal_eval(enc.decode(enc.cccccccz, g))
-    
-    symbols_in_8s = list(chunks(set(L), 8)) # 8 symbols per request (12data free tier)
-    usa_close_price = {}
+    return TwelveDataEODScheduler(k, credits_per_minute=8, batch_size=8).fetch(L) # 8 symbols per request (12data free tier)
+
+def us_market_open(now: datetime = None) -> bool:
+    ''' NYSE / NASDAQ regular session, 9:30-16:00 New York time on weekdays (exchange holidays not included) '''
+    now = (now or datetime.now(timezone.utc)).astimezone(ZoneInfo("America/New_York"))
+    return now.weekday() < 5 and time(9, 30) <= now.time() < time(16, 0)
+
+def alpaca_client_from_env():
+    ''' AlpacaMarketDataClient from APCA_API_KEY_ID / APCA_API_SECRET_KEY, None if not set '''
+    key, secret = os.environ.get("APCA_API_KEY_ID"), os.environ.get("APCA_API_SECRET_KEY")
+    if not key or not secret:
+        return None
+    return AlpacaMarketDataClient(key, secret)
+
+def snapshot_price(snapshot: dict):
+    ''' last trade, or today's / previous daily bar close if there has been no trade '''
+    for field, price in (("latestTrade", "p"), ("dailyBar", "c"), ("prevDailyBar", "c")):
+        if (snapshot.get(field) or {}).get(price) is not None:
+            return snapshot[field][price]
+    return None
+
+def getSnapshotPriceUSA(L, client, feed: str = "iex", chunk_size: int = 200) -> dict:
+    ''' last trade price per symbol from alpaca /v2/stocks/snapshots, chunk_size symbols per request
+    to stay well under the url length limit. feed iex is the free plan, sip needs a subscription '''
+    prices = {}
+    for batch in chunks(L, chunk_size):
+        r = client.get_multi_stock_snapshots(batch, feed=feed)
+        snapshots = r.get("snapshots", r)  # keyed by symbol, nested under "snapshots" in newer responses
+        for ticker in batch:
+            price = snapshot_price(snapshots.get(ticker) or {})
+            if price is not None:
+                prices[ticker] = price
+    return prices
+
+def getLivePriceUSA(L, client=None) -> dict:
+    ''' alpaca snapshot prices while the US market is open, {} when it is closed, credentials are missing
+    or alpaca fails, symbols without a snapshot are left out '''
+    L = list(L)
+    client = client or alpaca_client_from_env()
+    if not L or client is None or not us_market_open():
+        return {}
+    try:
+        return getSnapshotPriceUSA(L, client, feed=os.environ.get("APCA_DATA_FEED", "iex"))
+    except Exception as e:
+        print("Error getting alpaca snapshots, falling back to EOD prices", e)
+        return {}
 
-    for i in range(0, int(len(symbols_in_8s)/(len(k)))+1):
-        usa_close_price.update(less_than_32_symbols(symbols_in_8s[i*len(k): (i+1)*len(k)], k))
-        if i>1:
-            print(i, "sleeping for 60 seconds")
-            sleep(60)
-    return usa_close_price
+def getCurrentPriceUSA(L, client=None) -> dict:
+    ''' live prices from alpaca snapshots while the US market is open, EOD close otherwise
+    eg. getCurrentPriceUSA(["MSCI", "FDS"])   # credentials from APCA_API_KEY_ID / APCA_API_SECRET_KEY
+    symbols missing from the snapshots, or every symbol if alpaca fails, fall back to getEODpriceUSA '''
+    L = list(L)
+    prices = getLivePriceUSA(L, client)
+    missing = [ticker for ticker in L if ticker not in prices]
+    if missing:
+        prices.update(getEODpriceUSA(missing))
+    return prices
 
 def getEODpriceUK(L) -> dict:
     if datetime.now().hour < 22.5:
@@ -73,7 +174,9 @@ def getEODpriceUK(L) -> dict:
                 close_price_object = OHLC_YahooFinance(i, str(last_business_day))
                 close_price = close_price_object.yahooDataV8()
 
-        uk_close_price[i] = close_price['close'].iloc[-1]/100
+        # LSE closes are quoted in pence (GBp), convert by the quote currency yahoo reports
+        close, _ = normalise_minor_units([close_price['close'].iloc[-1]], [close_price.attrs.get('currency')])
+        uk_close_price[i] = close[0]
 
     return uk_close_price
 
@@ -0,0 +1,43 @@
+''' shared HTTP transport for the market data clients
+one pooled requests.Session per process so connections (TCP + TLS) are kept alive between calls
+eg. r = http_session.get("https://api.twelvedata.com/eod", params={"symbol": "MSCI", "apikey": k})
+
+retries: GET/HEAD are retried on connection errors and on RETRY_STATUS with exponential backoff,
+Retry-After is respected for 429. Once retries are exhausted the last response is returned,
+so callers keep using response.raise_for_status() as before.'''
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_TIMEOUT = (5, 30)  # (connect, read) seconds
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def build_session(retries: int = 3, backoff_factor: float = 0.5, pool_maxsize: int = 32,
+                  status_forcelist: tuple = RETRY_STATUS) -> requests.Session:
+    retry = Retry(total=retries, backoff_factor=backoff_factor, status_forcelist=status_forcelist,
+                  allowed_methods=frozenset(["GET", "HEAD"]), respect_retry_after_header=True,
+                  raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=16, pool_maxsize=pool_maxsize, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({"Accept-Encoding": "gzip, deflate"})
+    return session
+
+
+def get_session() -> requests.Session:
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = build_session()
+    return _session
+
+
+def get(url: str, params=None, timeout=DEFAULT_TIMEOUT, **kwargs) -> requests.Response:
+    return get_session().get(url, params=params, timeout=timeout, **kwargs)
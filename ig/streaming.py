@@ -1,92 +1,230 @@
 import logging
+import random
 import threading
-import time
 import websocket
-from typing import Callable, Optional
+from itertools import count
+from typing import Callable, Dict, List, Optional
+from urllib.parse import quote, unquote
 
-from .models import UserSession
+from .models import UserSession, MarketData
 
 logger = logging.getLogger(__name__)
 
+TLCP_PROTOCOL = "TLCP-2.1.0.lightstreamer.com"
+LS_CID = "mgQkwtwdysogQz2BJ4Ji kOj2Bg"
+DEFAULT_FIELDS = ["BID", "OFFER", "HIGH", "LOW", "MARKET_STATE"]
+
+
+def encode_params(params: Dict[str, str]) -> str:
+    return "&".join(f"{k}={quote(str(v), safe='')}" for k, v in params.items() if v is not None)
+
+
+def apply_update(values: list, payload: str) -> List[int]:
+    """
+    Apply one TLCP update payload (pipe separated, one token per field) to the item's current values in place.
+    empty token: unchanged, ^N: next N fields unchanged, #: null, $: empty string, otherwise percent-encoded value.
+    Returns the indexes of the fields that changed.
+    """
+    changed = []
+    i = 0
+    for token in payload.split("|"):
+        if token == "":
+            i += 1
+        elif token[0] == "^" and token[1:].isdigit():
+            i += int(token[1:])
+        else:
+            values[i] = None if token == "#" else "" if token == "$" else unquote(token) if "%" in token else token
+            changed.append(i)
+            i += 1
+    return changed
+
+
+class Subscription:
+    """One MERGE subscription: epics x fields, the latest value of every field is kept per epic."""
+
+    def __init__(self, sub_id: int, epics: List[str], fields: List[str]):
+        self.sub_id = sub_id
+        self.epics = list(epics)
+        self.fields = list(fields)
+        self.values: List[list] = [[None] * len(self.fields) for _ in self.epics]
+        self.active = False
+
+    @property
+    def group(self) -> str:
+        return " ".join(f"MARKET:{epic}" if ":" not in epic else epic for epic in self.epics)
+
+    def item_values(self, item: int) -> Dict[str, Optional[str]]:
+        return dict(zip(self.fields, self.values[item]))
+
+
 class IGStreamingClient:
     """
-    A simplified Lightstreamer client for IG.
-    Note: Full Lightstreamer protocol implementation is complex. 
-    This is a basic adapter for demonstration purposes.
+    Lightstreamer (TLCP text protocol over websocket) client for IG.
+    eg. streamer = IGStreamingClient(session)
+        streamer.add_listener(lambda epic, values: print(epic, values["BID"], values["OFFER"]))
+        streamer.connect()
+        streamer.subscribe(["CS.D.EURUSD.TODAY.IP"])      # may be called before the session is created
+        streamer.market_data("CS.D.EURUSD.TODAY.IP")       # MarketData with the latest bid / offer
+
+    create_session is sent on the websocket, and a reconnect binds the existing session again (bind_session)
+    so subscriptions survive a dropped socket. A dropped socket is reopened by the connection thread after an
+    exponential backoff with jitter (1s doubling to max_backoff, reset once a session is bound), a LOOP from the
+    server is rebound at once. Listeners are kept in a tuple that is replaced on change,
+    so updates are dispatched from the reader thread without taking a lock.
+    on_update, like a listener, is called with (epic, {field: value}); it used to receive ("Raw", message).
     """
-    def __init__(self, session: UserSession):
+    def __init__(self, session: UserSession, adapter_set: str = "DEFAULT", reconnect: bool = True,
+                 max_backoff: float = 60.0):
         self.session = session
+        self.adapter_set = adapter_set
+        self.reconnect = reconnect
+        self.max_backoff = max_backoff
+        self.backoff = 1.0
         self.ws: Optional[websocket.WebSocketApp] = None
         self.wst: Optional[threading.Thread] = None
         self.connected = False
-        self._subscriptions = []
-        self.on_update: Optional[Callable[[str, str], None]] = None
+        self.session_id: Optional[str] = None
+        self.keepalive_ms: Optional[int] = None
+        self._closing = False
+        self._rebind = False
+        self._stop = threading.Event()
+        self._subscriptions: Dict[int, Subscription] = {}
+        self._sub_ids = count(1)
+        self._req_ids = count(1)
+        self._listeners: tuple = ()
+        self._listeners_lock = threading.Lock()
+        self.on_update: Optional[Callable[[str, Dict[str, Optional[str]]], None]] = None
 
-    def connect(self):
-        # Construct Lightstreamer URL
-        # IG uses specific endpoint logic
-        if not self.session:
-            raise Exception("Session required for streaming")
-            
-        # Example URL logic (simplified)
-        # Real IG LS endpoint often looks like: https://apd.marketdatasystems.com/lightstreamer
-        # WebSocket would be wss://...
-        
+    def add_listener(self, callback: Callable[[str, Dict[str, Optional[str]]], None]):
+        with self._listeners_lock:
+            self._listeners = self._listeners + (callback,)
+
+    def remove_listener(self, callback):
+        with self._listeners_lock:
+            self._listeners = tuple(c for c in self._listeners if c is not callback)
+
+    def _url(self) -> str:
         # Taking endpoint from session, cleaning protocol
-        endpoint = self.session.lightstreamer_endpoint
+        endpoint = self.session.lightstreamer_endpoint.rstrip("/")
         if endpoint.startswith("http"):
             endpoint = endpoint.replace("http", "ws", 1)
-        
-        url = f"{endpoint}/lightstreamer"
-        
-        self.ws = websocket.WebSocketApp(
-            url,
-            on_open=self._on_open,
-            on_message=self._on_message,
-            on_error=self._on_error,
-            on_close=self._on_close
-        )
-        
-        self.wst = threading.Thread(target=self.ws.run_forever)
+        return f"{endpoint}/lightstreamer"
+
+    def _password(self) -> str:
+        # Standard: CST-{cst}|XST-{xst}
+        if self.session.cst_token and self.session.x_security_token:
+            return f"CST-{self.session.cst_token}|XST-{self.session.x_security_token}"
+        if self.session.oauth_token:
+            return f"Bearer {self.session.oauth_token.get('access_token')}"
+        return ""
+
+    def connect(self):
+        if not self.session:
+            raise Exception("Session required for streaming")
+        self._closing = False
+        self._stop.clear()
+        self.wst = threading.Thread(target=self._run)
         self.wst.daemon = True
         self.wst.start()
 
+    def _run(self):
+        """Connection thread: one websocket at a time, reopened after a backoff until disconnect()."""
+        self.backoff = 1.0
+        while not self._closing:
+            self.ws = websocket.WebSocketApp(
+                self._url(),
+                subprotocols=[TLCP_PROTOCOL],
+                on_open=self._on_open,
+                on_message=self._on_message,
+                on_error=self._on_error,
+                on_close=self._on_close
+            )
+            self.ws.run_forever()
+            if not self.reconnect or self._closing:
+                return
+            if self._rebind:
+                self._rebind = False
+                continue
+            wait = self.backoff * random.uniform(0.5, 1.0)  # jitter so restarted processes do not reconnect together
+            logger.info(f"Streaming reconnecting in {wait:.1f}s")
+            self._stop.wait(wait)
+            self.backoff = min(self.backoff * 2, self.max_backoff)
+
+    def _send(self, request: str, params: Optional[Dict[str, str]] = None):
+        self.ws.send(request + ("\r\n" + encode_params(params) if params else ""))
+
     def _on_open(self, ws):
         logger.info("Streaming connection opened")
-        # Need to send connection creation request for Lightstreamer
-        
-        # Prepare password:
-        # Standard: CST-{cst}|XST-{xst}
-        # OAuth: Bearer {access_token} (Theoretical - IG specific LS auth varies)
-        
-        password = ""
-        if self.session.cst_token and self.session.x_security_token:
-            password = f"CST-{self.session.cst_token}|XST-{self.session.x_security_token}"
-        elif self.session.oauth_token:
-            # Fallback or specific OAuth handling for LS
-            # Note: IG Lightstreamer with OAuth often requires a different flow or mapping.
-            # Using raw access token as a guess for the password field if simple pattern allows.
-            password = f"Bearer {self.session.oauth_token.get('access_token')}"
-        
-        user = self.session.active_account_id
-        
-        # Proper LS protocol handshake is non-trivial (bind_session etc). 
-        # For this task, we will simulate the structure or use a library if available.
-        # Since we are implementing raw, we acknowledge this might need a real LS library.
-        # However, many Python users use `lightstreamer-client` or similar.
-        # Here we will assume a simplified text protocol if possible, or just log for now 
-        # as a placeholder if the protocol is too heavy for a single file.
-        
-        # Let's try sending a basic text protocol payload if supported or just log 
-        # that we are ready to subscribe.
-        self.connected = True
-        logger.info("IG Streaming connected (Simulated/Ready)")
+        self._send("wsok")
+        if self.session_id:
+            self._send("bind_session", {"LS_session": self.session_id, "LS_keepalive_millis": self.keepalive_ms})
+        else:
+            self._send("create_session", {
+                "LS_cid": LS_CID,
+                "LS_adapter_set": self.adapter_set,
+                "LS_user": self.session.active_account_id,
+                "LS_password": self._password(),
+                "LS_send_sync": "false",
+            })
 
     def _on_message(self, ws, message):
-        # Parse LS message
-        logger.debug(f"Stream Msg: {message}")
+        for line in message.split("\r\n"):
+            if line:
+                self._handle_line(line)
+
+    def _handle_line(self, line: str):
+        if line.startswith("U,"):
+            _, sub_id, item, payload = line.split(",", 3)
+            subscription = self._subscriptions.get(int(sub_id))
+            if subscription is None:
+                return
+            item = int(item) - 1
+            apply_update(subscription.values[item], payload)
+            self._dispatch(subscription.epics[item], subscription.item_values(item))
+            return
+        command, _, args = line.partition(",")
+        args = args.split(",") if args else []
+        if command == "CONOK":
+            new_session = args[0] != self.session_id
+            self.session_id, self.keepalive_ms = args[0], int(args[2])
+            self.connected = True
+            self.backoff = 1.0
+            logger.info(f"IG Streaming session {self.session_id} {'created' if new_session else 'bound'}")
+            if new_session:  # a bound session keeps its subscriptions on the server
+                for subscription in list(self._subscriptions.values()):
+                    self._send_subscribe(subscription)
+            else:
+                for subscription in list(self._subscriptions.values()):
+                    subscription.active = True
+        elif command == "SUBOK":
+            subscription = self._subscriptions.get(int(args[0]))
+            if subscription is not None:
+                subscription.active = True
+        elif command == "UNSUB":
+            self._subscriptions.pop(int(args[0]), None)
+        elif command in ("REQERR", "ERROR", "CONERR"):
+            logger.error(f"Streaming {command}: {args}")
+            if command == "CONERR":
+                self.session_id = None  # bind failed, create a new session on the next connect
+        elif command == "LOOP":
+            self._rebind = True
+            self.ws.close()  # server asks for a rebind, done at once by the connection thread
+        elif command == "END":
+            logger.info(f"Streaming session ended: {args}")
+            self.session_id = None
+            self.connected = False
+        elif command not in ("WSOK", "PROBE", "NOOP", "SYNC", "REQOK", "SERVNAME", "CLIENTIP", "CONS", "PROG",
+                             "EOS", "CS", "OV", "CONF", "MSGDONE", "MSGFAIL"):
+            logger.debug(f"Stream Msg: {line}")
+
+    def _dispatch(self, epic: str, values: Dict[str, Optional[str]]):
+        for callback in self._listeners:
+            try:
+                callback(epic, values)
+            except Exception as e:
+                logger.error(f"Streaming listener failed: {e}")
         if self.on_update:
-            self.on_update("Raw", message)
+            self.on_update(epic, values)
 
     def _on_error(self, ws, error):
         logger.error(f"Streaming error: {error}")
@@ -94,15 +232,54 @@ class IGStreamingClient:
     def _on_close(self, ws, close_status_code, close_msg):
         logger.info("Streaming connection closed")
         self.connected = False
+        for subscription in list(self._subscriptions.values()):
+            subscription.active = False
 
-    def subscribe(self, epics: list[str]):
-        if not self.connected:
-            logger.warning("Not connected to streaming server")
-            return
-        # Send subscription command
-        # control.txt format
+    def _send_subscribe(self, subscription: Subscription):
+        self._send("control", {
+            "LS_reqId": next(self._req_ids),
+            "LS_op": "add",
+            "LS_subId": subscription.sub_id,
+            "LS_mode": "MERGE",
+            "LS_group": subscription.group,
+            "LS_schema": " ".join(subscription.fields),
+            "LS_snapshot": "true",
+        })
+
+    def subscribe(self, epics: list[str], fields: Optional[list[str]] = None) -> int:
+        """Subscribe to MARKET:<epic> items, returns the subscription id used by unsubscribe."""
+        subscription = Subscription(next(self._sub_ids), epics, fields or DEFAULT_FIELDS)
+        self._subscriptions[subscription.sub_id] = subscription
         logger.info(f"Subscribing to {epics}")
+        if self.connected:
+            self._send_subscribe(subscription)
+        return subscription.sub_id
+
+    def unsubscribe(self, sub_id: int):
+        if self.connected and sub_id in self._subscriptions:
+            self._send("control", {"LS_reqId": next(self._req_ids), "LS_op": "delete", "LS_subId": sub_id})
+        else:
+            self._subscriptions.pop(sub_id, None)
+
+    def values(self, epic: str) -> Dict[str, Optional[str]]:
+        """Latest value of every subscribed field of epic."""
+        merged = {}
+        for subscription in list(self._subscriptions.values()):
+            if epic in subscription.epics:
+                merged.update(subscription.item_values(subscription.epics.index(epic)))
+        return merged
+
+    def market_data(self, epic: str) -> MarketData:
+        values = self.values(epic)
+        number = lambda field: float(values[field]) if values.get(field) else None
+        return MarketData(epic=epic, bid=number("BID"), offer=number("OFFER"), high=number("HIGH"),
+                          low=number("LOW"), market_status=values.get("MARKET_STATE") or "UNKNOWN")
 
     def disconnect(self):
+        self._closing = True
+        self._stop.set()
         if self.ws:
+            if self.session_id and self.connected:
+                self._send("control", {"LS_reqId": next(self._req_ids), "LS_op": "destroy"})
             self.ws.close()
+        self.session_id = None
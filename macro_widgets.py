@@ -1,11 +1,26 @@
-import miniEnc as enc
 import pandas as pd
-import pandas_datareader.data as web
 import plotly.graph_objects as go
 import plotly.express as px
 import datetime as dt
 from getEODprice import chunks
 from market_data_api import OHLC_YahooFinance
+from fred_store import fred
+from yield_curve import yield_curve, HISTORY_START
+from commodity_store import commodity_store, minmax_downsample
+
+TREASURY_CURVE_FRAMES = 60
+GOLD_SILVER_CHART_WIDTH = 1200
+
+# US recessions (start, end), shaded on long history charts
+RECESSIONS = pd.DataFrame([
+    ("1969-12-01", "1970-11-01"), ("1973-11-01", "1975-03-01"), ("1981-07-01", "1982-11-01"),
+    ("1990-07-01", "1991-03-01"), ("2001-03-01", "2001-11-01"), ("2007-12-01", "2009-06-01"),
+    ("2020-02-11", "2020-05-31"),
+], columns=["start", "end"])
+RECESSION_SHAPES = tuple(
+    dict(type="rect", xref="x", yref="paper", x0=start, x1=end, y0=0, y1=1, fillcolor="LightSalmon", opacity=0.5,
+         line_width=0, layer="below")
+    for start, end in RECESSIONS.itertuples(index=False))
 
 
 def get_vix_from_yahoo(start_date):
@@ -21,7 +36,7 @@ def get_vix_from_yahoo(start_date):
     return fig, df_vix.tail(1)
 
 def real_gdp_pct_change(start_date):
-    df_gdp = web.DataReader('A191RL1Q225SBEA', 'fred', start=start_date)
+    df_gdp = fred('A191RL1Q225SBEA', start_date)
     fig = go.Figure(data=[go.Bar(x=df_gdp.index, y=df_gdp["A191RL1Q225SBEA"])])
     fig.update_layout(xaxis_title="Year", yaxis_title="% Change")
     df_gdp.rename(columns={'A191RL1Q225SBEA': 'GDP % Change'}, inplace=True)
@@ -29,24 +44,25 @@ def real_gdp_pct_change(start_date):
     return fig, df_gdp.tail(4)[::-1]
 
 def pce_from_fred(start_date):
-    df_pce = web.DataReader('PCE', 'fred', start=start_date)
+    df_pce = fred('PCE', start_date)
     fig = go.Figure(data=[go.Scatter(x=df_pce.index, y=df_pce["PCE"])])
     fig.update_layout(xaxis_title="Year", yaxis_title="PCE (USD Billion)")
     df_pce.index = df_pce.index.strftime('%Y-%m-%d')
     return fig, df_pce.tail(3)
 
 def cpi_from_fred(start_date):
-    df_cpi = web.DataReader('CPIAUCSL', 'fred', start=start_date)
+    df_cpi = fred('CPIAUCSL', start_date)
     fig = go.Figure([go.Scatter(x=df_cpi.index, y=df_cpi['CPIAUCSL'])])
     fig.update_layout(xaxis_title="Year", yaxis_title="Index 1982-1984=100")
     df_cpi.index = df_cpi.index.strftime('%Y-%m-%d')
     return fig, df_cpi.tail(3)
 
 def cpi_pce_pct_change_from_fred(start_date):
-    cpi = web.DataReader('CORESTICKM159SFRBATL', 'fred', start=start_date)
-    cpi.rename(columns={"CORESTICKM159SFRBATL": "CPI less food energy"}, inplace=True)
     pce_start = pd.to_datetime(start_date) - pd.DateOffset(years=1)
-    pce = web.DataReader('PCEPI', 'fred', start=pce_start)
+    df_fred = fred(['CORESTICKM159SFRBATL', 'PCEPI'], pce_start)
+    cpi = df_fred.loc[start_date:, ['CORESTICKM159SFRBATL']].dropna()
+    cpi.rename(columns={"CORESTICKM159SFRBATL": "CPI less food energy"}, inplace=True)
+    pce = df_fred[['PCEPI']].dropna()
     pce['pct change'] = pce.pct_change(periods=12)*100
     pce.dropna(inplace=True)
     cpi_pce = pd.concat([cpi, pce], axis=1)
@@ -56,13 +72,13 @@ def cpi_pce_pct_change_from_fred(start_date):
     return fig, cpi_pce.tail(3)
 
 def unemployment_rate_from_fred(start_date):
-    df_unemployment = web.DataReader('UNRATE', 'fred', start=start_date)
+    df_unemployment = fred('UNRATE', start_date)
     fig = go.Figure(data=[go.Scatter(x=df_unemployment.index, y=df_unemployment["UNRATE"])])
     fig.update_layout(xaxis_title="Year", yaxis_title="Unemployment Rate")
     return fig, df_unemployment.tail(3)
 
 def consumer_confidence_from_fred(start_date):
-    df_consumer_confidence = web.DataReader('UMCSENT', 'fred', start=start_date)
+    df_consumer_confidence = fred('UMCSENT', start_date)
     fig = go.Figure(data=[go.Scatter(x=df_consumer_confidence.index, y=df_consumer_confidence["UMCSENT"])])
     fig.update_layout(xaxis_title="Year", yaxis_title="Consumer Confidence")
     return fig, df_consumer_confidence.tail(3)
@@ -70,8 +86,9 @@ def consumer_confidence_from_fred(start_date):
 def buffet_indicator_calc_from_fred(start_date: str):
     indicator_range = [0,0.5,0.75,0.9,1.15,10]
     indicator_description = ['Very Undervalued', 'Undervalued','Fair Value','Overvalued','Extremely Overvalued']
-    df_gdp = web.DataReader("GDP", "fred", start=start_date)
-    df_wilshire = web.DataReader('WILL5000PR','fred', start=start_date)
+    df_fred = fred(["GDP", "WILL5000PR"], start_date)
+    df_gdp = df_fred[['GDP']].dropna()
+    df_wilshire = df_fred[['WILL5000PR']].dropna()
     df_wb = df_wilshire.join(df_gdp, how='left')
     df_wb['GDP'] = df_wb['GDP'].ffill()
     df_wb.dropna(subset = ['WILL5000PR'], inplace=True)
@@ -82,50 +99,42 @@ def buffet_indicator_calc_from_fred(start_date: str):
 
 
 def treasury_curve(start_date):
-    treasury_codes_mapping = {'DGS1MO': '1 MO', 'DGS3MO': '3MO', 'DGS6MO': '6 MO', 'DGS1': '1 YR', 'DGS2': '2 YR', 'DGS3': '3 YR', 'DGS5': '5 YR', 'DGS7': '7 YR', 'DGS10': '10 YR', 'DGS20': '20 YR', 'DGS30': '30 YR'}
-    treasury_yield = pd.DataFrame()
-
-    if start_date < dt.datetime.today().strftime('%Y-%m-%d'):        
-        for code, maturity in treasury_codes_mapping.items():
-            data = web.DataReader(code, 'fred', start_date)
-            treasury_yield[maturity] = data[code]
-
-        fig = go.Figure(go.Scatter(x=treasury_yield.columns, y=treasury_yield.loc[start_date]))
+    # dates x maturities matrix kept in memory by yield_curve, a date lookup does not touch FRED or the store
+    cube = yield_curve(min(start_date, HISTORY_START))
+    today = dt.datetime.today().strftime('%Y-%m-%d')
+
+    if start_date < today:
+        curve = cube.curve_series(start_date)  # nearest prior business day with data
+        if curve is None:
+            return go.Figure().update_layout(title=f"No treasury yields on or before {start_date}")
+        fig = go.Figure(go.Scatter(x=curve.index, y=curve.values))
+        fig.update_layout(title=f"Treasury Yield Curve on {curve.name}")
         fig.add_vrect(x0="1 MO", x1="1 YR", fillcolor="LightSalmon", opacity=0.5, line_width=0, annotation_text = "Bill", annotation_position="top left")
         fig.add_vrect(x0="2 YR", x1="5 YR", fillcolor="LightGreen", opacity=0.5, line_width=0, annotation_text = "Note", annotation_position="top left")
         fig.add_vrect(x0="7 YR", x1="30 YR", fillcolor="LightBlue", opacity=0.5, line_width=0, annotation_text = "Bond", annotation_position="top left")
-        return fig       
+        return fig
+    elif start_date == today:
+        # last 90 days, at most TREASURY_CURVE_FRAMES animation frames
+        df_long = cube.frames((dt.datetime.today() - dt.timedelta(days=90)).strftime('%Y-%m-%d'), max_frames=TREASURY_CURVE_FRAMES)
+        return px.line(df_long, x="variable", y="value", range_y=[df_long["value"].min(), df_long["value"].max()], animation_frame="DATE", title="Treasury Yields")
     else:
-        for code, maturity in treasury_codes_mapping.items():
-            data = web.DataReader(code, 'fred', (dt.datetime.today() - dt.timedelta(days=90)).strftime('%Y-%m-%d')) # get the last 5 days data
-            treasury_yield[maturity] = data[code]
-        if start_date == dt.datetime.today().strftime('%Y-%m-%d'): 
-            df_long=pd.melt(treasury_yield.reset_index(), id_vars=['DATE'], value_vars=treasury_codes_mapping.values())
-            plot = px.line(df_long, x="variable", y="value", range_y=[df_long["value"].min(), df_long["value"].max()], animation_frame="DATE", title="Treasury Yields")
-        else:
-            # TODO: handle date in the future
-            treasuries_yield = treasuries_yield.set_index('Date')
-            plot = px.line(treasuries_yield, x=treasuries_yield.index, y=treasuries_yield.columns, title='Treasury rates full history')
-        return plot
-
-def gold_silver_price(highlight_recession=False):
-    ndqk = b'ud--wr-4nbzKnr-5tIzCmZjBo6o'
-    nasdaq = enc.decode(enc.cccccccz, ndqk)
-    df_gold = pd.read_csv(f"https://data.nasdaq.com/api/v3/datasets/LBMA/GOLD.csv?api_key={nasdaq}")
-    df_silver = pd.read_csv(f"https://data.nasdaq.com/api/v3/datasets/LBMA/SILVER.csv?api_key={nasdaq}")
+        # date in the future: every maturity over the whole history held by the cube
+        treasury_yield = cube.history()
+        return px.line(treasury_yield, x=treasury_yield.index, y=treasury_yield.columns, title='Treasury rates full history')
+
+def gold_silver_price(highlight_recession=False, width=GOLD_SILVER_CHART_WIDTH):
+    # local copy of the LBMA fixes, only new rows are downloaded, thinned to ~2 points per pixel of the chart
+    store = commodity_store()
+    store.refresh(['GOLD', 'SILVER'])
+    gold = minmax_downsample(store.read('GOLD'), width)
+    silver = minmax_downsample(store.read('SILVER'), width)
     fig = go.Figure()
-    fig.add_trace(go.Scatter(x=df_gold['Date'], y=df_gold['USD (PM)'], name="Gold"))
-    fig.add_trace(go.Scatter(x=df_silver['Date'], y=df_silver['USD'], name="Silver", yaxis="y2"))
+    fig.add_trace(go.Scatter(x=gold.index, y=gold.values, name="Gold"))
+    fig.add_trace(go.Scatter(x=silver.index, y=silver.values, name="Silver", yaxis="y2"))
     y2 = go.layout.YAxis(side='right', overlaying='y', title='Silver')
     fig.update_layout(yaxis2=y2, title='Gold and Silver prices')
     if highlight_recession:
-        fig.add_vrect(x0="2020-02-11", x1="2020-05-31", fillcolor="LightSalmon", opacity=0.5, line_width=0)
-        fig.add_vrect(x0="2007-12-01", x1="2009-06-01", fillcolor="LightSalmon", opacity=0.5, line_width=0)
-        fig.add_vrect(x0="2001-03-01", x1="2001-11-01", fillcolor="LightSalmon", opacity=0.5, line_width=0)
-        fig.add_vrect(x0="1990-07-01", x1="1991-03-01", fillcolor="LightSalmon", opacity=0.5, line_width=0)
-        fig.add_vrect(x0="1981-07-01", x1="1982-11-01", fillcolor="LightSalmon", opacity=0.5, line_width=0)
-        fig.add_vrect(x0="1973-11-01", x1="1975-03-01", fillcolor="LightSalmon", opacity=0.5, line_width=0)
-        fig.add_vrect(x0="1969-12-01", x1="1970-11-01", fillcolor="LightSalmon", opacity=0.5, line_width=0)
+        fig.update_layout(shapes=list(RECESSION_SHAPES))
     return fig
 
 
@@ -1,57 +1,88 @@
 import pandas as pd
+import numpy as np
 import miniEnc as enc
-import threading
-import tqdm
 import requests
+import http_session
 import json
 from datetime import datetime
 import io
 
+try:
+    import orjson  # optional, faster parse of large intraday charts
+except ImportError:
+    orjson = None
+from ohlc_cache import OHLCCache
+from fetch_pool import FetchPool
+from functools import partial
+
+def loads_json(json_data):
+    if orjson is not None:
+        return orjson.loads(json_data)
+    return json.loads(json_data)
+
+def decode_yahoo_chart(json_data, interval='1d') -> pd.DataFrame:
+    ''' yahoo v8 chart json (str or bytes) to ohlc dataframe indexed by Date '''
+    result = loads_json(json_data)['chart']['result'][0]
+    meta = result.get('meta', {})
+    return yahoo_bars_to_df(result['timestamp'], result['indicators']['quote'][0], interval,
+                            meta.get('exchangeTimezoneName'), meta.get('currency'))
+
+def yahoo_bars_to_df(timestamps, quote: dict, interval='1d', timezone=None, currency=None) -> pd.DataFrame:
+    ''' columns are built straight from the quote arrays as float64 (null -> NaN),
+    timestamps are converted in one call to the exchange timezone, UTC if unknown.
+    1d bars are indexed by exchange date, other intervals by naive exchange local time.
+    The quote currency (eg GBp for LSE) is kept in df.attrs['currency'] '''
+    ohlc_df = pd.DataFrame({field: np.asarray(values, dtype=np.float64) for field, values in quote.items()})
+    dates = pd.to_datetime(np.asarray(timestamps, dtype=np.int64), unit='s', utc=True).tz_convert(timezone or 'UTC')
+    if interval == "1d":
+        ohlc_df['Date'] = dates.date
+    else:
+        ohlc_df['Date'] = dates.tz_localize(None)
+    ohlc_df.index = ohlc_df['Date']
+    ohlc_df.attrs['currency'] = currency
+    return ohlc_df
+
 class Finage:
-    def __init__(self, api_key) -> None:     
+    ''' last price and % changes from finage, fetched on a bounded FetchPool
+    eg. finage = Finage(api_key)
+        finage.get_finage_changes(["VOO", "VGT"])   # one row per symbol, in symbol_list order
+        finage.stats()                              # per symbol calls, errors and latency of all calls so far'''
+    host = "api.finage.co.uk"
+
+    def __init__(self, api_key, max_concurrent_query: int = 8) -> None:
         self.baseurl = "https://api.finage.co.uk/last/stock/changes/"
         finage = b'tbW808C4vtO8o6urmH15lnjCucbHxb6Ys2uIpcKbvsnHpbqiq5yr'
         self.finageapi = enc.decode(enc.cccccccz, finage)
-        self.dl_lock = threading.Lock()
-        max_concurrent_query = 8 # max concurrent query
-        self.dl_semaphore = threading.Semaphore(max_concurrent_query)
+        self.pool = FetchPool(max_workers=max_concurrent_query, per_host=max_concurrent_query)
         self.err_results = {}
-        self.result = []
+        self.result = {}
         self.api_key = api_key
 
     def get_finage_changes(self, symbol_list: list) -> pd.DataFrame:
         col_renames = {'lp': 'Last Price', 'cpd': 'Daily Percentage Change', 
         'cpw': 'Weekly Percentage Change', 'cpm': 'Monthly Percentage Change', 
         'cpsm': 'Six Monthly Percentage Change', 'cpy': 'Yearly Percentage Change'}
-        df_changes = pd.DataFrame()
-        threads = []
-        for i in symbol_list:
-            t = threading.Thread(target=self.query_threads, args=(i,))
-            t.start()
-            threads.append(t)            
-        for thread in tqdm.tqdm(threads):
-            thread.join()
-
-
-        for i in self.result:
-            df_changes = pd.concat([df_changes, i], axis=1)
-
-        df_changes_T = df_changes.T
-        df_changes_T.drop(columns=["t"], inplace=True)
-        df_changes_T.rename(columns=col_renames, inplace=True)
-        return df_changes_T
-    
-    def query_threads(self, symbol: str) -> pd.DataFrame:
-        df = pd.DataFrame()
-        self.dl_semaphore.acquire()
-        try:
-            df = pd.read_json(self.baseurl + symbol + "?apikey=" + self.api_key, typ="series")
-            self.result.append(df)
-        except Exception as e:
-            print(e)
-            self.err_results[symbol] = e
-        finally:
-            self.dl_semaphore.release()
+        jobs = {symbol: partial(self.query_symbol, symbol) for symbol in dict.fromkeys(symbol_list)}
+        # results of this call only, keyed by symbol
+        self.result, self.err_results = self.pool.run(jobs, host=self.host)
+        for symbol, e in self.err_results.items():
+            print(symbol, e)
+
+        df_changes = pd.DataFrame(list(self.result.values()))
+        df_changes.drop(columns=["t"], inplace=True, errors='ignore')
+        df_changes.rename(columns=col_renames, inplace=True)
+        return df_changes
+
+    def query_symbol(self, symbol: str) -> dict:
+        r = http_session.get(self.baseurl + symbol, params={"apikey": self.api_key})
+        r.raise_for_status()
+        return r.json()
+
+    def stats(self) -> pd.DataFrame:
+        df_stats = pd.DataFrame.from_dict(self.pool.stats, orient='index')
+        if not df_stats.empty:
+            df_stats['mean_latency'] = df_stats['total_latency'] / df_stats['calls']
+        return df_stats
 
 class OHLC_YahooFinance:
     ''' yahoo queries copied from OHCLData class
@@ -68,39 +99,63 @@ class OHLC_YahooFinance:
         self.header = {'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_11_2) AppleWebKit/601.3.9 (KHTML, like Gecko) Version/9.0.2 Safari/601.3.9'}
     
     def convert_json_to_df(self, json_data):
-        p = json.loads(json_data)
-        ohlc_json = p['chart']['result'][0]['indicators']['quote'][0]
-        dates = p['chart']['result'][0]['timestamp']
-        ohlc_df = pd.DataFrame.from_dict(ohlc_json)
-
-        if self.interval == "1d":
-            ohlc_df['Date'] = [datetime.fromtimestamp(x).date() for x in dates]
-        else:
-            ohlc_df['Date'] = [datetime.fromtimestamp(x) for x in dates] 
-        
-        ohlc_df.index = ohlc_df['Date']
-        return ohlc_df
+        return decode_yahoo_chart(json_data, self.interval)
 
     def get_epoch_time(self, date):
         return int(datetime.strptime(date, '%Y-%m-%d').timestamp())
 
-    def yahooDataV8(self):
-        if self.interval not in ["1m", "2m", "5m", "15m", "30m", "1h", "1d","5d", "1wk", "1mo"]:
-            raise ValueError("Invalid Parameter for YahooV8 interval!")
-        
-        start_epoch = self.get_epoch_time(self.start_date)
-        end_epoch = self.get_epoch_time(self.end_date)
+    def request_chart(self, start_epoch, end_epoch):
         baseurl = "https://query1.finance.yahoo.com/v8/finance/chart/" + self.symbol
         url = f"{baseurl}?period1={start_epoch}&period2={end_epoch}&interval={self.interval}&events=history"
       
         try:
-            r = requests.get(url, headers=self.header)
+            r = http_session.get(url, headers=self.header)
             r.raise_for_status()  # raises HTTPError for bad status codes
-            return self.convert_json_to_df(r.text)
+            return r.content
         except requests.RequestException as e:
             print(f"API request failed: {e}")
             raise  # re-raise so caller knows it failed
 
+    def yahooDataV8(self, use_cache=True):
+        ''' bars are served from the local OHLCCache, only the missing head/tail of the range is requested from yahoo
+        use_cache=False always requests the full range '''
+        if self.interval not in ["1m", "2m", "5m", "15m", "30m", "1h", "1d","5d", "1wk", "1mo"]:
+            raise ValueError("Invalid Parameter for YahooV8 interval!")
+        
+        start_epoch = self.get_epoch_time(self.start_date)
+        end_epoch = self.get_epoch_time(self.end_date)
+        if not use_cache:
+            return self.convert_json_to_df(self.request_chart(start_epoch, end_epoch))
+
+        cache = OHLCCache()
+        covered = cache.coverage(self.symbol, self.interval)
+        timezone = currency = None
+        if covered is None:
+            self.top_up_cache(cache, start_epoch, end_epoch)
+        else:
+            covered_start, covered_end, timezone, currency = covered
+            if start_epoch < covered_start:
+                self.top_up_cache(cache, start_epoch, covered_start)
+            if end_epoch > covered_end or currency is None:
+                # refetch from the last stored bar so a partial bar is overwritten
+                last_bar = cache.last_timestamp(self.symbol, self.interval)
+                self.top_up_cache(cache, min(last_bar or covered_end, covered_end), max(end_epoch, covered_end))
+
+        dates, ohlc_json = cache.read(self.symbol, self.interval, start_epoch, end_epoch)
+        if len(dates) == 0:
+            raise KeyError('timestamp')  # same error as an empty yahoo chart, see getEODprice.getEODpriceUK
+        if timezone is None or currency is None:
+            _, _, timezone, currency = cache.coverage(self.symbol, self.interval)
+        return yahoo_bars_to_df(dates, ohlc_json, self.interval, timezone, currency)
+
+    def top_up_cache(self, cache, start_epoch, end_epoch):
+        result = loads_json(self.request_chart(start_epoch, end_epoch))['chart']['result'][0]
+        dates = result.get('timestamp', [])
+        ohlc_json = result['indicators']['quote'][0] if dates else {}
+        meta = result.get('meta', {})
+        cache.write(self.symbol, self.interval, dates, ohlc_json, start_epoch, end_epoch,
+                    meta.get('exchangeTimezoneName'), meta.get('currency'))
+
     # def yahooDataV7(self):
     #     url = "https://query1.finance.yahoo.com/v7/finance/download/" + self.symbol
     #     start_epoch = self.get_epoch_time(self.start_date)
@@ -116,6 +171,27 @@ class OHLC_YahooFinance:
     #         print(e)
     #         return None
     
+def yahoo_batch_download(jobs: list, interval='1d', max_workers=8, per_host=4) -> tuple:
+    ''' fetch many tickers concurrently with yahooDataV8
+    eg. df, errors = yahoo_batch_download([("MSCI", "2022-08-08", None), ("PAY.L", "2023-01-03", "2024-05-01")])
+    jobs is a list of (ticker, start_date, end_date), end_date None means today
+    returns one frame with a ticker column, built with a single concat, and {ticker: exception} for failed tickers'''
+    def fetch(ticker, start_date, end_date):
+        end_date = end_date or datetime.now().strftime('%Y-%m-%d')
+        df = OHLC_YahooFinance(ticker, start_date, end_date, interval).yahooDataV8()
+        df['ticker'] = ticker
+        df['currency'] = df.attrs.get('currency')
+        return df
+
+    fetch_jobs = {ticker: partial(fetch, ticker, start_date, end_date) for ticker, start_date, end_date in jobs}
+    results, errors = FetchPool(max_workers, per_host).run(fetch_jobs, host="query1.finance.yahoo.com")
+    for ticker, e in errors.items():
+        print(f"Error retrieving data for {ticker}: {e}")
+    if not results:
+        return pd.DataFrame(), errors
+    return pd.concat(results.values(), ignore_index=True), errors
+
+
 class nasdaq_data_link:
     def __init__(self) -> None:
         self.base_url = "https://data.nasdaq.com/api/v3/datasets/"
@@ -125,7 +201,9 @@ class nasdaq_data_link:
     def treasury_yield(self, start_date: str) -> pd.DataFrame:        
         url = self.base_url + "USTREASURY/YIELD.csv?api_key" + self.k
         try:
-            df = pd.read_csv(url)
+            r = http_session.get(url)
+            r.raise_for_status()
+            df = pd.read_csv(io.StringIO(r.text))
             df.index = df['Date']
         except Exception as e:
             print(e)
@@ -1,4 +1,4 @@
-import requests
+import http_session
 from typing import Optional, List, Dict, Any, Union
 
 class NewsAPIClient:
@@ -21,7 +21,7 @@ class NewsAPIClient:
         if params:
             params = {k: v for k, v in params.items() if v is not None}
             
-        response = requests.get(url, headers=self.headers, params=params)
+        response = http_session.get(url, headers=self.headers, params=params)
         response.raise_for_status()
         return response.json()
 
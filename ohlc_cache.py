@@ -0,0 +1,96 @@
+import os
+import sqlite3
+import time
+from contextlib import closing
+from typing import Optional
+
+pwd = os.path.dirname(os.path.realpath(__file__))
+default_cache_dir = os.environ.get("OHLC_CACHE_DIR", pwd + "/.cache")
+
+QUOTE_FIELDS = ["open", "high", "low", "close", "volume"]
+
+
+class OHLCCache:
+    ''' local sqlite store of yahoo chart bars, one row per symbol + interval + bar timestamp
+    eg. cache = OHLCCache()
+        cache.coverage("MSCI", "1d")                    # (first_epoch, last_epoch, timezone, currency) already fetched, or None
+        cache.write("MSCI", "1d", timestamps, quote, start_epoch, end_epoch, "America/New_York", "USD")
+        cache.read("MSCI", "1d", start_epoch, end_epoch) # (timestamps, quote dict) in ascending order
+
+    coverage is the requested range that has been fetched, not the first/last bar, so a ticker
+    listed after the requested start date does not trigger a full refetch on every call.
+    A write replaces the stored bars of its [start_epoch, end_epoch) range, so a partial bar (eg. today's daily bar,
+    which yahoo stamps with the time of the last trade) is replaced by the next top-up instead of kept next to it.'''
+
+    def __init__(self, cache_dir: str = default_cache_dir):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.db_path = os.path.join(cache_dir, "ohlc_cache.sqlite")
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute('''CREATE TABLE IF NOT EXISTS bars (
+                symbol TEXT NOT NULL, interval TEXT NOT NULL, ts INTEGER NOT NULL,
+                open REAL, high REAL, low REAL, close REAL, volume REAL,
+                PRIMARY KEY (symbol, interval, ts))''')
+            conn.execute('''CREATE TABLE IF NOT EXISTS coverage (
+                symbol TEXT NOT NULL, interval TEXT NOT NULL,
+                start_epoch INTEGER NOT NULL, end_epoch INTEGER NOT NULL, timezone TEXT, currency TEXT,
+                PRIMARY KEY (symbol, interval))''')
+            if 'currency' not in [row[1] for row in conn.execute("PRAGMA table_info(coverage)")]:
+                conn.execute("ALTER TABLE coverage ADD COLUMN currency TEXT")  # caches created before quote currency was kept
+
+    def _connect(self) -> sqlite3.Connection:
+        # one connection per call so the cache can be shared by fetch threads
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def coverage(self, symbol: str, interval: str) -> Optional[tuple]:
+        with closing(self._connect()) as conn:
+            return conn.execute(
+                "SELECT start_epoch, end_epoch, timezone, currency FROM coverage WHERE symbol = ? AND interval = ?",
+                (symbol, interval)).fetchone()
+
+    def last_timestamp(self, symbol: str, interval: str) -> Optional[int]:
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT MAX(ts) FROM bars WHERE symbol = ? AND interval = ?", (symbol, interval)).fetchone()
+        return row[0]
+
+    def write(self, symbol: str, interval: str, timestamps: list, quote: dict,
+              start_epoch: int, end_epoch: int, timezone: Optional[str] = None, currency: Optional[str] = None):
+        ''' replace the bars of [start_epoch, end_epoch) and widen the covered range to include it
+        an empty response leaves the stored bars alone.
+        end_epoch is capped at now in the coverage, so a range ending today is topped up again on the next call'''
+        rows = zip([symbol] * len(timestamps), [interval] * len(timestamps), timestamps,
+                   *[quote.get(field, [None] * len(timestamps)) for field in QUOTE_FIELDS])
+        with closing(self._connect()) as conn, conn:
+            if len(timestamps):
+                conn.execute("DELETE FROM bars WHERE symbol = ? AND interval = ? AND ts >= ? AND ts < ?",
+                             (symbol, interval, min(start_epoch, min(timestamps)), max(end_epoch, max(timestamps) + 1)))
+            end_epoch = min(end_epoch, int(time.time()))
+            conn.executemany("INSERT OR REPLACE INTO bars VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            conn.execute('''INSERT INTO coverage (symbol, interval, start_epoch, end_epoch, timezone, currency)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (symbol, interval) DO UPDATE SET
+                start_epoch = MIN(start_epoch, excluded.start_epoch),
+                end_epoch = MAX(end_epoch, excluded.end_epoch),
+                timezone = COALESCE(excluded.timezone, timezone),
+                currency = COALESCE(excluded.currency, currency)''',
+                (symbol, interval, start_epoch, end_epoch, timezone, currency))
+
+    def read(self, symbol: str, interval: str, start_epoch: int, end_epoch: int) -> tuple:
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT ts, open, high, low, close, volume FROM bars "
+                "WHERE symbol = ? AND interval = ? AND ts >= ? AND ts < ? ORDER BY ts",
+                (symbol, interval, start_epoch, end_epoch)).fetchall()
+        columns = list(zip(*rows)) if rows else [[] for _ in range(len(QUOTE_FIELDS) + 1)]
+        timestamps = list(columns[0])
+        quote = {field: list(columns[i + 1]) for i, field in enumerate(QUOTE_FIELDS)}
+        return timestamps, quote
+
+    def clear(self, symbol: Optional[str] = None):
+        with closing(self._connect()) as conn, conn:
+            if symbol is None:
+                conn.execute("DELETE FROM bars")
+                conn.execute("DELETE FROM coverage")
+            else:
+                conn.execute("DELETE FROM bars WHERE symbol = ?", (symbol,))
+                conn.execute("DELETE FROM coverage WHERE symbol = ?", (symbol,))
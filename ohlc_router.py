@@ -0,0 +1,293 @@
+''' one OHLC bars API over every provider we have keys for, routed to the fastest healthy one with failover
+eg. df = get_bars("MSCI", "2024-01-02", "2024-06-28")            # interval default "1d", end default today
+    df, errors = get_bars_batch([("MSCI", "2022-08-08", None), ("PAY.L", "2023-01-03", "2024-05-01")])
+    provider_stats()                                                # rolling success rate / latency per provider
+
+every provider returns the same long frame: Date, open, high, low, close, volume, ticker, currency, provider,
+adjustment ("splits" for yahoo / polygon / twelve data, "splits+dividends" for eodhd's adjusted close).
+Date is a date for 1d / 1wk / 1mo bars and a naive exchange local timestamp for intraday ones.
+Intervals use the yahoo vocabulary (INTERVALS), each provider maps them to its own or is skipped.
+
+the last WINDOW calls of each provider are kept. A provider is healthy while its success rate is at least
+MIN_SUCCESS_RATE, healthy providers are tried fastest first (mean latency of their successful calls), providers
+not tried yet come next in registration order and unhealthy ones last, so a throttled yahoo falls over to
+eodhd / polygon / twelve data before the caller has to give up. Only transport and HTTP errors count against a
+provider, a ticker it does not have (404, no bars) just moves on to the next one.
+Bars of the providers other than yahoo, which caches itself, are kept in OHLCCache under "symbol@provider".
+A provider that already holds the start of the range is tried first, and only the part of the range its cache does
+not cover is requested, the tail from its last stored bar so a partial bar is replaced.'''
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from functools import partial
+from typing import Callable, Dict, Optional
+import pandas as pd
+import requests
+from fetch_pool import FetchPool, host_slot
+from freeOLHCdata import OHLCData
+from market_data_api import OHLC_YahooFinance, yahoo_bars_to_df
+from ohlc_cache import OHLCCache, QUOTE_FIELDS
+
+BAR_COLUMNS = ['Date', 'open', 'high', 'low', 'close', 'volume', 'ticker', 'currency', 'provider', 'adjustment']
+INTERVALS = ["1m", "5m", "15m", "30m", "1h", "1d", "1wk", "1mo"]
+DAILY_INTERVALS = ("1d", "1wk", "1mo")
+WINDOW = 20
+MIN_SUCCESS_RATE = 0.5
+
+# yahoo suffix: (eodhd exchange code, quote currency as yahoo reports it)
+EXCHANGES = {'': ('US', 'USD'), '.L': ('LSE', 'GBp'), '.DE': ('XETRA', 'EUR')}
+
+
+def exchange_of(symbol: str) -> Optional[tuple]:
+    suffix = symbol[symbol.rfind('.'):] if '.' in symbol else ''
+    return EXCHANGES.get(suffix)
+
+
+def provider_error(e: Exception) -> bool:
+    ''' transport and HTTP errors count against a provider's health, a 404 or a response without bars is a symbol miss '''
+    if isinstance(e, requests.HTTPError) and e.response is not None:
+        return e.response.status_code != 404
+    return isinstance(e, requests.RequestException)
+
+
+def to_bars(df: pd.DataFrame, interval: str) -> pd.DataFrame:
+    ''' Date column parsed to the unified type, rows sorted, other columns left to the caller '''
+    dates = pd.to_datetime(df['Date'])
+    df = df.assign(Date=dates.dt.date if interval in DAILY_INTERVALS else dates.dt.tz_localize(None))
+    return df.sort_values('Date').reset_index(drop=True)
+
+
+def utc_epoch(date) -> int:
+    return int(pd.Timestamp(date).tz_localize(None).tz_localize('UTC').timestamp())
+
+
+def utc_date(epoch: int) -> str:
+    return pd.Timestamp(epoch, unit='s').strftime('%Y-%m-%d')
+
+
+# ---- providers: fetch(symbol, start_date, end_date, provider_interval) -> frame with Date, open..volume, currency
+# requests and parsing are OHLCData's, these only map its per provider output to the unified columns
+
+def fetch_yahoo(symbol, start_date, end_date, interval) -> pd.DataFrame:
+    df = OHLC_YahooFinance(symbol, start_date, end_date, interval).yahooDataV8()
+    return df.reset_index(drop=True).assign(currency=df.attrs.get('currency'))
+
+
+def fetch_eodhd(symbol, start_date, end_date, interval) -> pd.DataFrame:
+    exchange, currency = exchange_of(symbol)
+    code = symbol.rsplit('.', 1)[0] if '.' in symbol else symbol
+    df = OHLCData(f"{code}.{exchange}", start_date, end_date, interval).eodhd().reset_index()
+    # eodhd Close is unadjusted, the bar is scaled to Adjusted_close so a failover does not jump at past splits
+    ratio = df['Adjusted_close'] / df['Close']
+    return pd.DataFrame({'Date': df['Date'], 'open': df['Open'] * ratio, 'high': df['High'] * ratio,
+                         'low': df['Low'] * ratio, 'close': df['Adjusted_close'], 'volume': df['Volume'],
+                         'currency': currency})
+
+
+def fetch_polygon(symbol, start_date, end_date, interval) -> pd.DataFrame:
+    df = OHLCData(symbol, start_date, end_date, interval).polygon_io_vw().reset_index(drop=True)
+    # polygon bars start at UTC timestamps, daily bars at midnight US/Eastern, aggregates are split adjusted
+    dates = pd.to_datetime(df['t'], unit='ms', utc=True).dt.tz_convert('America/New_York')
+    return pd.DataFrame({'Date': dates, 'open': df['Open'], 'high': df['High'], 'low': df['Low'],
+                         'close': df['Adj Close'], 'volume': df['Volume'], 'currency': 'USD'})
+
+
+def fetch_twelvedata(symbol, start_date, end_date, interval) -> pd.DataFrame:
+    df = OHLCData(symbol, start_date, end_date, interval).twelveData()
+    return df.rename_axis('Date').reset_index().assign(currency='USD')
+
+
+class Provider:
+    ''' cache=True keeps the bars in OHLCCache under "symbol@provider", yahoo has its own cache under the bare symbol '''
+    def __init__(self, name: str, fetch: Callable, intervals: dict, host: str,
+                 symbols: Callable[[str], bool] = lambda symbol: True, per_host: int = 4, cache: bool = True,
+                 adjustment: str = "splits"):
+        self.name = name
+        self.fetch = fetch
+        self.intervals = intervals
+        self.host = host
+        self.symbols = symbols
+        self.per_host = per_host
+        self.cache = cache
+        self.adjustment = adjustment
+        self.calls = deque(maxlen=WINDOW)  # (ok, latency seconds)
+
+    def supports(self, symbol: str, interval: str) -> bool:
+        return interval in self.intervals and self.symbols(symbol)
+
+    def success_rate(self) -> Optional[float]:
+        return sum(ok for ok, _ in self.calls) / len(self.calls) if self.calls else None
+
+    def latency(self) -> Optional[float]:
+        latencies = [latency for ok, latency in self.calls if ok]
+        return sum(latencies) / len(latencies) if latencies else None
+
+    def unified(self, df: pd.DataFrame, symbol: str, interval: str) -> pd.DataFrame:
+        df = to_bars(df, interval)
+        df[QUOTE_FIELDS] = df[QUOTE_FIELDS].astype(float)
+        df['ticker'] = symbol
+        df['provider'] = self.name
+        df['adjustment'] = self.adjustment
+        return df.reindex(columns=BAR_COLUMNS)
+
+    def has_cached(self, symbol: str, start_date: str, interval: str) -> bool:
+        ''' a previous fetch covered start_date, so at most the tail of the range has to be requested '''
+        if not self.cache:
+            return False
+        covered = OHLCCache().coverage(f"{symbol}@{self.name}", interval)
+        return covered is not None and covered[0] <= utc_epoch(start_date)
+
+    def store(self, df: pd.DataFrame, symbol: str, start_date: str, end_date: str, interval: str):
+        dates = pd.to_datetime(pd.Series(df['Date']))
+        timestamps = (dates - pd.Timestamp(0)) // pd.Timedelta(seconds=1)  # naive bar time kept as if UTC
+        quote = {field: df[field].astype(float).tolist() for field in QUOTE_FIELDS}
+        currency = df['currency'].iloc[0] if len(df) else None
+        OHLCCache().write(f"{symbol}@{self.name}", interval, timestamps.tolist(), quote, utc_epoch(start_date),
+                          utc_epoch(end_date) + 86400, 'UTC', currency)
+
+    def fetch_bars(self, symbol: str, start_date: str, end_date: str, interval: str, required: bool = True):
+        with host_slot(self.host, self.per_host):
+            df = self.fetch(symbol, start_date, end_date, self.intervals[interval])
+        if df is None or df.empty:
+            if required:
+                raise KeyError(f"no {interval} bars for {symbol} from {self.name}")
+            df = pd.DataFrame(columns=['Date', *QUOTE_FIELDS, 'currency'])
+        df = self.unified(df, symbol, interval)
+        if self.cache:
+            self.store(df, symbol, start_date, end_date, interval)
+        return df
+
+    def get_bars(self, symbol: str, start_date: str, end_date: str, interval: str) -> tuple:
+        ''' (bars, fetched), fetched is False when the cache already covered the whole range '''
+        if not self.cache:
+            return self.fetch_bars(symbol, start_date, end_date, interval), True
+        cache, key = OHLCCache(), f"{symbol}@{self.name}"
+        start_epoch, end_epoch = utc_epoch(start_date), utc_epoch(end_date) + 86400
+        covered = cache.coverage(key, interval)
+        if covered is None:
+            return self.fetch_bars(symbol, start_date, end_date, interval), True
+        fetched = start_epoch < covered[0] or end_epoch > covered[1]
+        if start_epoch < covered[0]:
+            self.fetch_bars(symbol, start_date, utc_date(covered[0]), interval, required=False)
+        if end_epoch > covered[1]:
+            # refetch from the last stored bar so a partial bar is overwritten
+            last_bar = cache.last_timestamp(key, interval)
+            self.fetch_bars(symbol, utc_date(min(last_bar or covered[1], covered[1])), end_date, interval,
+                            required=False)
+        timestamps, quote = cache.read(key, interval, start_epoch, end_epoch)
+        if not timestamps:
+            raise KeyError(f"no {interval} bars for {symbol} from {self.name}")
+        df = yahoo_bars_to_df(timestamps, quote, interval).reset_index(drop=True)
+        return self.unified(df.assign(currency=cache.coverage(key, interval)[3]), symbol, interval), fetched
+
+
+class OHLCRouter:
+    def __init__(self):
+        self.providers: Dict[str, Provider] = {}
+        self.lock = threading.Lock()
+
+    def register(self, provider: Provider):
+        self.providers[provider.name] = provider
+
+    def record(self, provider: Provider, ok: bool, latency: float):
+        with self.lock:
+            provider.calls.append((ok, latency))
+
+    def route(self, symbol: str, interval: str) -> list:
+        ''' providers able to serve symbol / interval, in the order they should be tried '''
+        order = {name: i for i, name in enumerate(self.providers)}
+
+        def rank(provider):
+            with self.lock:
+                rate, latency = provider.success_rate(), provider.latency()
+            if rate is None:
+                return 1, 0.0, order[provider.name]
+            if rate < MIN_SUCCESS_RATE:
+                return 2, -rate, order[provider.name]
+            return 0, latency if latency is not None else float('inf'), order[provider.name]
+
+        return sorted((p for p in self.providers.values() if p.supports(symbol, interval)), key=rank)
+
+    def get_bars(self, symbol: str, start_date: str, end_date: Optional[str] = None,
+                 interval: str = "1d") -> pd.DataFrame:
+        if interval not in INTERVALS:
+            raise ValueError(f"Invalid interval {interval}, use one of {INTERVALS}")
+        end_date = end_date or datetime.now().strftime('%Y-%m-%d')
+        providers = self.route(symbol, interval)
+        if not providers:
+            raise ValueError(f"No provider serves {interval} bars for {symbol}")
+        # a provider holding the start of the range only needs its tail, stable sort keeps the route order otherwise
+        providers.sort(key=lambda p: not p.has_cached(symbol, start_date, interval))
+        errors = {}
+        for provider in providers:
+            start = time.perf_counter()
+            try:
+                df, fetched = provider.get_bars(symbol, start_date, end_date, interval)
+            except Exception as e:
+                # only transport / HTTP errors are the provider's fault, a ticker it does not have is not
+                if provider_error(e):
+                    self.record(provider, False, time.perf_counter() - start)
+                errors[provider.name] = e
+                print(f"{provider.name} failed for {symbol}: {e}")
+                continue
+            if fetched:  # a cache hit says nothing about the provider's latency
+                self.record(provider, True, time.perf_counter() - start)
+            return df
+        raise LookupError(f"Every provider failed for {symbol}: {errors}")
+
+    def stats(self) -> pd.DataFrame:
+        with self.lock:
+            rows = {name: {'calls': len(p.calls), 'success_rate': p.success_rate(), 'latency': p.latency()}
+                    for name, p in self.providers.items()}
+        return pd.DataFrame.from_dict(rows, orient='index')
+
+
+def default_router() -> OHLCRouter:
+    router = OHLCRouter()
+    router.register(Provider("yahoo", fetch_yahoo, {i: i for i in INTERVALS}, "query1.finance.yahoo.com", cache=False))
+    router.register(Provider("eodhd", fetch_eodhd, {"1d": "d", "1wk": "w", "1mo": "m"}, "eodhistoricaldata.com",
+                             symbols=lambda symbol: exchange_of(symbol) is not None, adjustment="splits+dividends"))
+    us_only = lambda symbol: '.' not in symbol
+    # interval names as OHLCData.polygon_io_interval_match and OHLCData.twelveData expect them
+    router.register(Provider("polygon", fetch_polygon,
+                             {"1m": "1minute", "5m": "5minute", "15m": "15minute", "30m": "30minute", "1h": "1hour",
+                              "1d": "1d", "1wk": "1week", "1mo": "1month"},
+                             "api.polygon.io", symbols=us_only, per_host=1))
+    router.register(Provider("twelvedata", fetch_twelvedata,
+                             {"1m": "1min", "5m": "5min", "15m": "15min", "30m": "30min", "1h": "1h", "1d": "1day",
+                              "1wk": "1week", "1mo": "1month"},
+                             "api.twelvedata.com", symbols=us_only, per_host=1))
+    return router
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_router() -> OHLCRouter:
+    global _router
+    with _router_lock:
+        if _router is None:
+            _router = default_router()
+        return _router
+
+
+def get_bars(symbol: str, start_date: str, end_date: Optional[str] = None, interval: str = "1d") -> pd.DataFrame:
+    return get_router().get_bars(symbol, start_date, end_date, interval)
+
+
+def get_bars_batch(jobs: list, interval: str = "1d", max_workers: int = 8) -> tuple:
+    ''' get_bars for many (ticker, start_date, end_date) concurrently, each provider keeps its own host limit
+    returns one frame built with a single concat and {ticker: exception} for tickers no provider could serve '''
+    fetch_jobs = {ticker: partial(get_bars, ticker, start_date, end_date, interval) for ticker, start_date, end_date in jobs}
+    results, errors = FetchPool(max_workers).run(fetch_jobs)
+    for ticker, e in errors.items():
+        print(f"Error retrieving data for {ticker}: {e}")
+    if not results:
+        return pd.DataFrame(columns=BAR_COLUMNS), errors
+    return pd.concat(results.values(), ignore_index=True), errors
+
+
+def provider_stats() -> pd.DataFrame:
+    return get_router().stats()
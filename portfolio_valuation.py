@@ -0,0 +1,59 @@
+''' daily GBP valuation of a trade history
+eg. df_value, total = daily_portfolio_value(df_trades, df_prices, FXConverter.from_yahoo(["USD", "EUR"], "2021-01-04"), currencies)
+    value_between(total, "2024-01-01", "2024-06-30")
+
+df_trades:  Date, Ticker, Quantity (signed, sells negative)
+df_prices:  long frame from historical_market_data_yahoo, Date, ticker, close, currency (yahoo quote currency, eg GBp)
+fx:         currency_conversion.FXConverter
+currencies: Series ticker -> trade currency (GBP, USD, EUR), used where the quote currency is unknown'''
+import numpy as np
+import pandas as pd
+from currency_conversion import FXConverter
+
+
+def business_day_index(start, end) -> pd.DatetimeIndex:
+    return pd.bdate_range(pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize())
+
+
+def daily_quantity_matrix(df_trades: pd.DataFrame, dates: pd.DatetimeIndex) -> pd.DataFrame:
+    ''' cumulative quantity held per ticker at the end of each business day '''
+    df = pd.DataFrame({'Date': pd.to_datetime(df_trades['Date']).dt.normalize(),
+                       'Ticker': df_trades['Ticker'],
+                       'Quantity': pd.to_numeric(df_trades['Quantity'], errors='coerce').fillna(0)})
+    traded = df.pivot_table(index='Date', columns='Ticker', values='Quantity', aggfunc='sum')
+    # cumsum over trade dates and business days together so weekend trades still count
+    return traded.reindex(traded.index.union(dates)).fillna(0).cumsum().reindex(dates)
+
+
+def daily_close_matrix(df_prices: pd.DataFrame, dates: pd.DatetimeIndex) -> pd.DataFrame:
+    ''' close per ticker on each business day, carried forward over holidays and gaps, NaN before its first close '''
+    close = df_prices.pivot_table(index='Date', columns='ticker', values='close', aggfunc='last')
+    close.index = pd.to_datetime(close.index)
+    return close.reindex(close.index.union(dates)).ffill().reindex(dates)
+
+
+def daily_portfolio_value(df_trades: pd.DataFrame, df_prices: pd.DataFrame, fx: FXConverter,
+                          currencies: pd.Series, end=None) -> tuple:
+    ''' returns (dates x tickers GBP value matrix, daily total GBP series)
+    a position held before its first close is NaN in the matrix and left out of the total '''
+    dates = business_day_index(pd.to_datetime(df_trades['Date']).min(), end or pd.Timestamp.today())
+    quantity = daily_quantity_matrix(df_trades, dates)
+    tickers = quantity.columns
+    close = daily_close_matrix(df_prices, dates).reindex(columns=tickers)
+
+    quote_currency = currencies.reindex(tickers)
+    if 'currency' in df_prices.columns:
+        quote_currency = df_prices.dropna(subset=['currency']).groupby('ticker')['currency'].last().reindex(tickers).fillna(quote_currency)
+    fx_per_ticker = fx.rate_matrix(quote_currency.fillna(fx.base).tolist(), dates).to_numpy()
+
+    q = quantity.to_numpy()
+    value = np.where(q == 0, 0.0, q * close.to_numpy() * fx_per_ticker)
+    df_value = pd.DataFrame(value, index=dates, columns=tickers)
+    return df_value, df_value.sum(axis=1, min_count=1).fillna(0)
+
+
+def value_between(total: pd.Series, start, end) -> pd.Series:
+    ''' slice of a date indexed series from start to end inclusive, a label slice is a binary search on the sorted index '''
+    if total.empty:
+        return total
+    return total.loc[pd.Timestamp(start):pd.Timestamp(end)]
@@ -0,0 +1,190 @@
+import hashlib
+import json
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+
+pwd = os.path.dirname(os.path.realpath(__file__))
+default_snapshot_dir = os.environ.get("LEDGER_SNAPSHOT_DIR", pwd + "/.cache/ledgers")
+
+
+class PositionLedger:
+    ''' running position per ticker, built by applying trades in date order
+    eg. ledger = PositionLedger.for_trades(df_trade_history)   # resumes the snapshot of this trade history, if any
+        ledger.ingest(df_trade_history)   # only trades not applied before are parsed and added, then the snapshot is saved
+        ledger.positions()                # same as groupby('Ticker').agg({'Quantity': 'sum', 'Market': 'last', ...}) plus Costs
+
+    a ledger from for_trades / load saves its snapshot in .cache/ledgers whenever ingest applies trades,
+    an unnamed one (PositionLedger()) only on an explicit save(name).
+
+    trades are identified by a hash of their raw values, the ledger keeps the multiset of applied hashes.
+    An upload is matched against it before any parsing, so only the new rows are parsed and summed, and an
+    unchanged upload costs one hashing pass. If an applied trade is missing from the upload or a new one is dated
+    before the last applied date, eg. a different account or a ticker remap, the ledger is rebuilt from scratch
+    so it never drifts from a full groupby. Trades with an unparseable date are kept, like groupby does.
+    Snapshots are named after the trades of the earliest date of the history, which do not change as it grows,
+    so two uploads of different accounts never share a snapshot.'''
+
+    def __init__(self, key=('Ticker',), sum_columns=('Quantity', 'Cost/Proceeds', 'Charges', 'Commission'),
+                 last_columns=('Market', 'Currency'), date_column='Date'):
+        self.key = list(key)
+        self.sum_columns = list(sum_columns)
+        self.last_columns = list(last_columns)
+        self.date_column = date_column
+        self.name = None
+        self.snapshot_dir = default_snapshot_dir
+        self.reset()
+
+    def reset(self):
+        self.book = {}  # key tuple -> {column: value}
+        self.last_date = None
+        self.applied_hashes = np.array([], dtype=np.uint64)  # sorted unique row hashes of the applied trades
+        self.applied_counts = np.array([], dtype=np.int64)
+        self.rows_applied = 0
+
+    def row_hashes(self, df: pd.DataFrame) -> np.ndarray:
+        columns = self.key + [self.date_column] + self.sum_columns + self.last_columns
+        return pd.util.hash_pandas_object(df[columns], index=False).to_numpy(dtype=np.uint64)
+
+    def parse(self, df: pd.DataFrame) -> pd.DataFrame:
+        df = df.copy()
+        df[self.date_column] = pd.to_datetime(df[self.date_column], errors='coerce', dayfirst=True)
+        for c in self.sum_columns:
+            df[c] = pd.to_numeric(df[c], errors='coerce').fillna(0)
+        # undated trades first so they never provide the 'last' values
+        return df.sort_values(self.date_column, kind='stable', na_position='first')
+
+    def new_rows_mask(self, hashes: np.ndarray):
+        ''' mask of the rows not applied yet, None if an applied trade is missing from hashes '''
+        unique, inverse, counts = np.unique(hashes, return_inverse=True, return_counts=True)
+        # every applied trade must still be there, as many times as it was applied
+        pos = np.searchsorted(unique, self.applied_hashes)
+        found = pos < len(unique)
+        found[found] = unique[pos[found]] == self.applied_hashes[found]
+        if not found.all() or (counts[pos] < self.applied_counts).any():
+            return None
+        pos = np.searchsorted(self.applied_hashes, unique)
+        seen = np.zeros(len(unique), dtype=np.int64)
+        hit = pos < len(self.applied_hashes)
+        hit[hit] = self.applied_hashes[pos[hit]] == unique[hit]
+        seen[hit] = self.applied_counts[pos[hit]]
+        # occurrence number of each row among the rows with the same hash, the first seen[h] are already applied
+        order = np.argsort(inverse, kind='stable')
+        starts = np.r_[0, np.cumsum(counts)[:-1]]
+        occurrence = np.empty(len(hashes), dtype=np.int64)
+        occurrence[order] = np.arange(len(hashes)) - starts[inverse[order]]
+        return occurrence >= seen[inverse]
+
+    def ingest(self, df_trades: pd.DataFrame, save: bool = True) -> int:
+        ''' apply trades not seen before and save the snapshot of a named ledger, returns the number of trades applied '''
+        df_trades = df_trades.reset_index(drop=True)  # row position == index, to pick hashes after sorting
+        hashes = self.row_hashes(df_trades)
+        new = self.new_rows_mask(hashes)
+        if new is not None and not new.any():
+            return 0
+        df_new = self.parse(df_trades[new] if new is not None else df_trades)
+        if new is None or (self.last_date is not None and (df_new[self.date_column] < self.last_date).any()):
+            print("trade history differs from the ledger snapshot, rebuilding positions")
+            self.reset()
+            df_new = self.parse(df_trades)
+        undated = int(df_new[self.date_column].isna().sum())
+        if undated:
+            print(f"{undated} trades have no valid {self.date_column}, counted in the positions without a date")
+        self.apply(df_new, hashes[df_new.index.to_numpy()])
+        if save and self.name and len(df_new):
+            self.save()
+        return len(df_new)
+
+    def apply(self, df_new: pd.DataFrame, hashes: np.ndarray):
+        if len(df_new) == 0:
+            return
+        agg = {c: 'sum' for c in self.sum_columns}
+        agg.update({c: 'last' for c in self.last_columns})
+        for key, row in df_new.groupby(self.key, sort=False).agg(agg).iterrows():
+            key = key if isinstance(key, tuple) else (key,)
+            position = self.book.setdefault(key, {c: 0.0 for c in self.sum_columns})
+            for c in self.sum_columns:
+                position[c] += float(row[c])
+            for c in self.last_columns:
+                position[c] = row[c]
+
+        last_date = df_new[self.date_column].max()
+        if pd.notna(last_date) and (self.last_date is None or last_date > self.last_date):
+            self.last_date = last_date
+        merged = np.concatenate([np.repeat(self.applied_hashes, self.applied_counts), hashes])
+        self.applied_hashes, self.applied_counts = np.unique(merged, return_counts=True)
+        self.rows_applied += len(df_new)
+
+    def positions(self) -> pd.DataFrame:
+        columns = self.sum_columns + self.last_columns
+        index = pd.MultiIndex.from_tuples(list(self.book), names=self.key) if self.book else None
+        df = pd.DataFrame(list(self.book.values()), index=index, columns=columns)
+        if len(self.key) == 1:
+            df.index = df.index.get_level_values(0) if self.book else pd.Index([], name=self.key[0])
+        cost_columns = [c for c in ['Cost/Proceeds', 'Charges', 'Commission'] if c in self.sum_columns]
+        if cost_columns:
+            df['Costs'] = df[cost_columns].sum(axis=1)
+        return df.sort_index()
+
+    def to_dict(self) -> dict:
+        return {
+            'key': self.key, 'sum_columns': self.sum_columns, 'last_columns': self.last_columns,
+            'date_column': self.date_column,
+            'book': [[list(k), v] for k, v in self.book.items()],
+            'last_date': None if self.last_date is None else self.last_date.isoformat(),
+            'applied': [[int(h), int(n)] for h, n in zip(self.applied_hashes, self.applied_counts)],
+            'rows_applied': self.rows_applied,
+        }
+
+    @classmethod
+    def from_dict(cls, d: dict) -> 'PositionLedger':
+        ledger = cls(d['key'], d['sum_columns'], d['last_columns'], d['date_column'])
+        ledger.book = {tuple(k): v for k, v in d['book']}
+        ledger.last_date = None if d['last_date'] is None else pd.Timestamp(d['last_date'])
+        applied = np.array(d['applied'], dtype=np.uint64).reshape(-1, 2)
+        ledger.applied_hashes, ledger.applied_counts = applied[:, 0], applied[:, 1].astype(np.int64)
+        ledger.rows_applied = d['rows_applied']
+        return ledger
+
+    @staticmethod
+    def snapshot_path(name: str, snapshot_dir: str = default_snapshot_dir) -> str:
+        return os.path.join(snapshot_dir, "".join(c if c.isalnum() or c in "-_." else "_" for c in name) + ".json")
+
+    def save(self, name: str = None, snapshot_dir: str = None):
+        path = self.snapshot_path(name or self.name, snapshot_dir or self.snapshot_dir)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # unique temp file in the same directory, concurrent saves never write into each other's file
+        with tempfile.NamedTemporaryFile('w', dir=os.path.dirname(path), suffix=".tmp", delete=False) as f:
+            json.dump(self.to_dict(), f, default=str)
+        os.replace(f.name, path)
+
+    @classmethod
+    def load(cls, name: str, snapshot_dir: str = default_snapshot_dir, **kwargs) -> 'PositionLedger':
+        ''' resume from the snapshot saved under name, or a new empty ledger built with kwargs '''
+        empty = cls(**kwargs)
+        empty.name, empty.snapshot_dir = name, snapshot_dir
+        try:
+            with open(cls.snapshot_path(name, snapshot_dir)) as f:
+                ledger = cls.from_dict(json.load(f))
+        except (FileNotFoundError, ValueError, KeyError):
+            return empty
+        if (ledger.key, ledger.sum_columns, ledger.last_columns, ledger.date_column) != \
+                (empty.key, empty.sum_columns, empty.last_columns, empty.date_column):
+            return empty
+        ledger.name, ledger.snapshot_dir = name, snapshot_dir
+        return ledger
+
+    def identity(self, df_trades: pd.DataFrame) -> str:
+        ''' id of a trade history that stays the same as trades are added: hash of its earliest date's trades '''
+        dates = pd.to_datetime(df_trades[self.date_column], errors='coerce', dayfirst=True)
+        first = df_trades[(dates == dates.min()).to_numpy()] if dates.notna().any() else df_trades
+        digest = hashlib.sha256(np.sort(self.row_hashes(first)).tobytes())
+        digest.update(json.dumps([self.key, self.date_column, self.sum_columns, self.last_columns]).encode())
+        return digest.hexdigest()[:16]
+
+    @classmethod
+    def for_trades(cls, df_trades: pd.DataFrame, prefix: str = "positions", snapshot_dir: str = default_snapshot_dir,
+                   **kwargs) -> 'PositionLedger':
+        ''' the snapshot of this trade history, or a new ledger saved under its name, see identity '''
+        return cls.load(f"{prefix}-{cls(**kwargs).identity(df_trades)}", snapshot_dir, **kwargs)
@@ -0,0 +1,36 @@
+''' client side rate limiting shared by the market data clients
+eg. bucket = TokenBucket(8, 60.0)          # twelve data free tier: 8 credits per minute
+    sleep(bucket.wait_time(1)); bucket.take(1)'''
+from time import monotonic
+
+
+class TokenBucket:
+    ''' api credits of one key, refilled continuously at capacity credits per period seconds
+    twelve data free tier: 8 credits per minute, 1 credit per symbol on /eod '''
+    def __init__(self, capacity: int = 8, period: float = 60.0):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.tokens = float(capacity)
+        self.updated = monotonic()
+
+    def refill(self):
+        now = monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def available(self) -> int:
+        self.refill()
+        return int(self.tokens)
+
+    def take(self, n: int):
+        self.refill()
+        self.tokens -= n
+
+    def drain(self):
+        # server rejected the key for this minute, wait for a full refill before reusing it
+        self.refill()
+        self.tokens = min(self.tokens, 0)
+
+    def wait_time(self, n: int) -> float:
+        self.refill()
+        return max(0.0, (n - self.tokens) / self.rate)
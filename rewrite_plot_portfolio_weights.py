@@ -1,13 +1,10 @@
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 
-def plot_portfolio_weights(df, weights: list, exchange_rate: dict):
+def plot_portfolio_weights(df, weights: list, fx):
     company_list = df['Market']
-    # calculate cost in GBP if df['Currency'] is USD, use exchange_rate['GBPUSD=X'], else if EUR use exchange_rate['GBPEUR=X']
-    df['Cost in GBP'] = df.apply(
-        lambda row: row['Cost/Proceeds'] / exchange_rate['GBPUSD=X'] 
-        if row['Currency'] == 'USD' else (row['Cost/Proceeds'] / exchange_rate['GBPEUR=X'] 
-        if row['Currency'] == 'EUR' else row['Cost/Proceeds']), axis=1)
+    # calculate cost in GBP at the latest rate of each row's currency, fx is a currency_conversion.FXConverter
+    df['Cost in GBP'] = fx.to_base(df['Cost/Proceeds'], df['Currency'])
     
 
     fig = make_subplots(rows=1, cols=2, specs=[[{"type": "domain"}, {"type": "domain"}]]) # specs explained in https://plotly.com/python/subplots/
@@ -1,32 +1,34 @@
 import pandas as pd
+import numpy as np
 import streamlit as st
-import json
-import os
 from datetime import datetime, timedelta
 from rewrite_ticker_resolution import use_sec_site
-from getEODprice import getEODpriceUK, getEODpriceUSA
+from getEODprice import getEODpriceUK, getEODpriceUSA, getLivePriceUSA, us_market_open
 from plotly import express as px
 import rewrite_plot_portfolio_weights as ppw
 from market_data_api import OHLC_YahooFinance
+from ohlc_router import get_bars_batch
+from position_ledger import PositionLedger
+from portfolio_valuation import daily_portfolio_value, value_between
+from currency_conversion import FXConverter, infer_currencies
+from ticker_store import get_store
 
 
 @st.cache_data
+def get_eod_price(us_tickers: list, eu_tickers: list) -> dict:
+    # end of day closes do not change during the session, twelve data credits are only spent once per ticker list
+    return {**getEODpriceUSA(us_tickers), **getEODpriceUK(eu_tickers)}
+
+@st.cache_data(ttl=60)
+def get_live_price_usa(us_tickers: list) -> dict:
+    return getLivePriceUSA(us_tickers)
+
 def get_current_price(tickers: list) -> dict:
     eu_tickers = [ticker for ticker in tickers if ticker.endswith('.L') or ticker.endswith('.DE')]
     us_tickers = [ticker for ticker in tickers if '.' not in ticker]
-    us_tickers_positions = getEODpriceUSA(us_tickers)
-    eu_tickers_positions = getEODpriceUK(eu_tickers)
-    return {**us_tickers_positions, **eu_tickers_positions}
-
-def convert_to_gbp(row):
-    if row.name.endswith('.L'):
-        return row['Market Value']  # already in GBP
-    elif row.name.endswith('.DE'):
-        eur_to_gbp = GBPEUR.iloc[-1]
-        return row['Market Value'] / eur_to_gbp  # convert EUR to GBP
-    else:
-        usd_to_gbp = GBPUSD.iloc[-1]
-        return row['Market Value'] / usd_to_gbp  # convert USD to GBP
+    us_tickers_positions = get_live_price_usa(us_tickers) if us_market_open() else {}
+    us_eod_tickers = [ticker for ticker in us_tickers if ticker not in us_tickers_positions]
+    return {**get_eod_price(us_eod_tickers, eu_tickers), **us_tickers_positions}
 
 def color_green_red(val):
     color = 'green' if val > 0 else 'red'
@@ -58,15 +60,19 @@ def calculate_past_date(period: str) -> datetime:
     return past_date
 
 @st.cache_data
-def get_historical_fx(start_date: str):
-    fx_data ={}
-    for pair in ['GBPUSD=X', 'GBPEUR=X']:
-        try:
-            data = OHLC_YahooFinance(pair, start_date).yahooDataV8()
-            fx_data[pair] = data['close']
-        except Exception as e:
-            print(f"Error retrieving data for {pair}: {e}")
-    return fx_data
+def get_fx_converter(start_date: str, currencies: list) -> FXConverter:
+    return FXConverter.from_yahoo(currencies, start_date)
+
+@st.cache_data
+def portfolio_value_over_time(df_trade_history: pd.DataFrame) -> pd.Series:
+    df_trades = df_trade_history[df_trade_history['Activity'] == "TRADE"]
+    df_prices = historical_market_data_yahoo(symbol_trading_summary(df_trades), df_trades)
+    currencies = df_trades.groupby('Ticker')['Currency'].last()
+    currencies = pd.Series(infer_currencies(currencies, currencies.index).to_numpy(), index=currencies.index)
+    quote_currencies = df_prices['currency'].dropna().unique().tolist() if 'currency' in df_prices else []
+    fx = get_fx_converter(df_trades['Date'].min().strftime('%Y-%m-%d'), sorted(set(currencies.dropna()) | set(quote_currencies)))
+    _, total = daily_portfolio_value(df_trades, df_prices, fx, currencies)
+    return total
 
 
 # copilot generated code for ticker holding period
@@ -119,24 +125,17 @@ def synthetic_historical_data_generator(df_each_ticker: pd.DataFrame, ticker: st
     return df_synthetic
 
 def historical_market_data_yahoo(market_data_collections: pd.DataFrame, df_trade_history: pd.DataFrame) -> pd.DataFrame:
-    df_market_historical_data = pd.DataFrame()
-    for idx, row in market_data_collections.iterrows():
-        print(f"Fetching data for {row['Ticker']} from {row['FirstBuyDate']}")
-        try: 
-            if row['LastDate'] is None:
-                market_historical_data = OHLC_YahooFinance(row['Ticker'], row['FirstBuyDate'].strftime('%Y-%m-%d')).yahooDataV8()
-            else:
-                market_historical_data = OHLC_YahooFinance(row['Ticker'], row['FirstBuyDate'].strftime('%Y-%m-%d'), row['LastDate'].strftime('%Y-%m-%d')).yahooDataV8()
-            market_historical_data['ticker'] = row['Ticker']
-            df_market_historical_data = pd.concat([df_market_historical_data, market_historical_data], ignore_index=True)
-        except Exception as e:
-            print(f"Error retrieving data for {row['Ticker']}: {e}")
-            
-            # Fallback to synthetic data
-            df_synthetic = synthetic_historical_data_generator(df_trade_history[df_trade_history['Ticker'] == row['Ticker']], row['Ticker'])
-            df_market_historical_data = pd.concat([df_market_historical_data, df_synthetic], ignore_index=True)
-
-            continue
+    jobs = [(row['Ticker'], row['FirstBuyDate'].strftime('%Y-%m-%d'),
+             None if pd.isnull(row['LastDate']) else row['LastDate'].strftime('%Y-%m-%d'))
+            for row in market_data_collections.to_dict('records')]
+    print(f"Fetching data for {len(jobs)} tickers")
+    # fastest healthy provider first, the others when it fails or throttles, see ohlc_router
+    df_market_historical_data, errors = get_bars_batch(jobs)
+
+    # Fallback to synthetic data when no provider has the ticker
+    synthetic = [synthetic_historical_data_generator(df_trade_history[df_trade_history['Ticker'] == ticker], ticker) for ticker in errors]
+    if synthetic:
+        df_market_historical_data = pd.concat([df_market_historical_data, *synthetic], ignore_index=True)
     return df_market_historical_data
 
 
@@ -154,10 +153,8 @@ if uploaded_file is not None:
             df_trade_history['Date'] = pd.to_datetime(df_trade_history['TextDate'], errors='coerce', dayfirst=True)
             
             # add ticker to trade history table
-            pwd = os.path.dirname(os.path.realpath(__file__))
-            reference_data_json_file = pwd + '/company_name_to_ticker.json'
-            with open(reference_data_json_file, 'r') as json_file:
-                company_name_to_ticker = json.load(json_file)
+            ticker_store = get_store()
+            company_name_to_ticker = ticker_store.mapping()
             df_trade_history['Ticker'] = df_trade_history['Market'].map(company_name_to_ticker)
             
             ## find missing symbols
@@ -206,9 +203,8 @@ if uploaded_file is not None:
                     }
                     
                     if confirmed_mappings:
-                        company_name_to_ticker.update(confirmed_mappings)
-                        with open(reference_data_json_file, 'w') as json_file:
-                            json.dump(company_name_to_ticker, json_file, indent=2)
+                        ticker_store.update(confirmed_mappings)
+                        company_name_to_ticker = ticker_store.mapping()
                         st.success(f"✅ Saved {len(confirmed_mappings)} new mappings!")
                         st.rerun()
                         # check if trade history dataframe has no missing tickers now
@@ -242,18 +238,25 @@ if uploaded_file is not None:
             df_trade_history_ticker_updated = df_trade_history_not_null.copy()
             df_trade_history_ticker_updated['Ticker'] = df_trade_history_ticker_updated['Ticker'].replace(company_name_to_ticker)
 
-            # calculate current positions
-            df_current_positions = df_trade_history_ticker_updated.groupby('Ticker').agg({'Quantity':'sum', 'Market': 'last', 'Cost/Proceeds': 'sum', 'Charges': 'sum', 'Commission': 'sum', 'Currency': 'last'})
-            df_current_positions = df_current_positions[df_current_positions['Quantity'] != 0]
-            df_current_positions['Costs'] = df_current_positions['Cost/Proceeds'] + df_current_positions['Charges'] + df_current_positions['Commission']
+            # calculate current positions, the ledger snapshot only applies trades added since the last upload
+            position_ledger = PositionLedger.for_trades(df_trade_history_ticker_updated)
+            position_ledger.ingest(df_trade_history_ticker_updated)  # saves the snapshot when trades were added
+            df_current_positions = position_ledger.positions()
+            df_current_positions = df_current_positions[df_current_positions['Quantity'] != 0].copy()
             current_prices = get_current_price(df_current_positions.index.tolist())
-            df_current_positions['Current Price'] = df_current_positions.index.map(current_prices) # add EOD price to current price TODO: change when market open
+            df_current_positions['Current Price'] = df_current_positions.index.map(current_prices) # live price for US symbols while the market is open, EOD close otherwise
             df_current_positions['Quantity'] = pd.to_numeric(df_current_positions['Quantity'], errors='coerce')
             df_current_positions['Current Price'] = pd.to_numeric(df_current_positions['Current Price'], errors='coerce')
             df_current_positions['Market Value'] = df_current_positions['Quantity'] * df_current_positions['Current Price']
-            GBPUSD = get_historical_fx(df_trade_history_ticker_updated['Date'].min().strftime('%Y-%m-%d'))['GBPUSD=X']
-            GBPEUR = get_historical_fx(df_trade_history_ticker_updated['Date'].min().strftime('%Y-%m-%d'))['GBPEUR=X']
-            df_current_positions['Market Value GBP'] = df_current_positions.apply(convert_to_gbp, axis=1)
+            df_current_positions['Currency'] = infer_currencies(df_current_positions['Currency'], df_current_positions.index,
+                                                                df_current_positions['Market']).to_numpy()
+            fx = get_fx_converter(df_trade_history_ticker_updated['Date'].min().strftime('%Y-%m-%d'),
+                                  sorted(set(df_trade_history_ticker_updated['Currency'].dropna()) |
+                                         set(df_current_positions['Currency'].dropna())))
+            unknown_currencies = fx.unknown(df_current_positions['Currency'])
+            if unknown_currencies:
+                st.warning(f"⚠️ No GBP rate for currency {', '.join(unknown_currencies)}, those positions are left out of the GBP totals.")
+            df_current_positions['Market Value GBP'] = fx.to_base(df_current_positions['Market Value'], df_current_positions['Currency'])
 
             Total_market_value_gbp = df_current_positions['Market Value GBP'].sum()
             USD_market_value_in_gbp = df_current_positions[df_current_positions['Currency']=='USD']['Market Value GBP'].sum()
@@ -308,8 +311,7 @@ if uploaded_file is not None:
             if selected_company in instruments_list:
                 idx = instruments_list.index(selected_company)
                 standout[idx] = 0.5
-            current_GBP_rate = {'GBPUSD=X': GBPUSD.iloc[-1], 'GBPEUR=X': GBPEUR.iloc[-1]}
-            fig = ppw.plot_portfolio_weights(df_current_positions, standout, current_GBP_rate)
+            fig = ppw.plot_portfolio_weights(df_current_positions, standout, fx)
             st.plotly_chart(fig, use_container_width=True)
 
 
@@ -332,6 +334,7 @@ if uploaded_file is not None:
             start_date_selected, end_date_selected = selected_date_range
             st.write(f"Showing data from {start_date_selected} to {end_date_selected}")
             
+            selected_date = None
             left1, left2, middle1, middle2, right1, right2 = st.columns(6)
             if left1.button("1y", width="stretch"):
                 selected_date = calculate_past_date("1y")
@@ -345,4 +348,11 @@ if uploaded_file is not None:
                 selected_date = calculate_past_date("1w")
             if right2.button("1d", width="stretch"):
                 selected_date = calculate_past_date("1d")
-            
\ No newline at end of file
+
+            if selected_date is not None:
+                start_date_selected = selected_date.date()
+            portfolio_value = portfolio_value_over_time(df_trade_history_ticker_updated)
+            st.plotly_chart(px.line(
+                value_between(portfolio_value, start_date_selected, end_date_selected),
+                labels={'index': 'Date', 'value': 'Market Value GBP'}
+            ).update_layout(showlegend=False), use_container_width=True)
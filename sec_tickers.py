@@ -0,0 +1,100 @@
+''' local copy of the SEC company_tickers.json (~1 MB), revalidated with ETag / Last-Modified
+eg. records = company_tickers()   # [{'cik_str': 320193, 'ticker': 'AAPL', 'title': 'Apple Inc.'}, ...]
+
+the parsed list is kept in memory for the whole process, so every streamlit session shares one copy.
+Within ttl seconds no request is made, after that a conditional GET only downloads the file when the SEC
+has published a new version (304 otherwise). If the SEC cannot be reached the last snapshot on disk is used.'''
+import json
+import os
+import threading
+import time
+import http_session
+
+pwd = os.path.dirname(os.path.realpath(__file__))
+default_cache_dir = os.environ.get("SEC_CACHE_DIR", pwd + "/.cache/sec")
+
+SEC_TICKERS_URL = "https://www.sec.gov/files/company_tickers.json"
+SEC_HEADERS = {
+    "User-Agent": "MyApp/1.0 (contact: you@example.com) Mozilla/5.0 (Macintosh)",
+    "Accept": "application/json, text/javascript, */*; q=0.01",
+    "Referer": "https://www.sec.gov/",
+    "Accept-Language": "en-US,en;q=0.9",
+}
+DEFAULT_TTL = 24 * 3600
+
+_records = None
+_meta = {}
+_lock = threading.Lock()
+
+
+def _paths(cache_dir: str) -> tuple:
+    return os.path.join(cache_dir, "company_tickers.json"), os.path.join(cache_dir, "company_tickers.meta.json")
+
+
+def _load_snapshot(cache_dir: str) -> tuple:
+    data_path, meta_path = _paths(cache_dir)
+    try:
+        with open(data_path, 'rb') as f:
+            records = list(json.loads(f.read()).values())
+        with open(meta_path) as f:
+            meta = json.load(f)
+    except (FileNotFoundError, ValueError, AttributeError):
+        return None, {}
+    return records, meta
+
+
+def _save_snapshot(cache_dir: str, content: bytes, meta: dict):
+    data_path, meta_path = _paths(cache_dir)
+    os.makedirs(cache_dir, exist_ok=True)
+    if content is not None:
+        with open(data_path + ".tmp", 'wb') as f:
+            f.write(content)
+        os.replace(data_path + ".tmp", data_path)
+    with open(meta_path + ".tmp", 'w') as f:
+        json.dump(meta, f)
+    os.replace(meta_path + ".tmp", meta_path)
+
+
+def _revalidate(records, meta: dict, cache_dir: str) -> tuple:
+    headers = dict(SEC_HEADERS)
+    if records is not None:
+        if meta.get('etag'):
+            headers["If-None-Match"] = meta['etag']
+        if meta.get('last_modified'):
+            headers["If-Modified-Since"] = meta['last_modified']
+    try:
+        resp = http_session.get(SEC_TICKERS_URL, headers=headers, timeout=10, allow_redirects=True)
+        if resp.status_code == 304 and records is not None:
+            meta = dict(meta, fetched_at=time.time())
+            _save_snapshot(cache_dir, None, meta)
+            return records, meta
+        resp.raise_for_status()
+        new_records = list(resp.json().values())
+    except Exception as e:
+        if records is None:
+            raise
+        print(f"Error: CANNOT refresh {SEC_TICKERS_URL} ({e}), using snapshot from {time.ctime(meta.get('fetched_at', 0))}")
+        return records, meta
+    meta = {'etag': resp.headers.get("ETag"), 'last_modified': resp.headers.get("Last-Modified"), 'fetched_at': time.time()}
+    _save_snapshot(cache_dir, resp.content, meta)
+    return new_records, meta
+
+
+def company_tickers(ttl: float = DEFAULT_TTL, cache_dir: str = default_cache_dir) -> list:
+    ''' list of {'cik_str', 'ticker', 'title'} dicts, the same list object until the SEC file changes '''
+    global _records, _meta
+    with _lock:
+        if _records is None:
+            _records, _meta = _load_snapshot(cache_dir)
+        if _records is None or time.time() - _meta.get('fetched_at', 0) > ttl:
+            _records, _meta = _revalidate(_records, _meta, cache_dir)
+        return _records
+
+
+def snapshot_stamp(cache_dir: str = default_cache_dir):
+    ''' (mtime_ns, size) of the local copy, it only changes when a new version is downloaded, None without a copy '''
+    try:
+        st = os.stat(_paths(cache_dir)[0])
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size
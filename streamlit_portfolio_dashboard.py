@@ -2,10 +2,11 @@ import streamlit as st
 import pandas as pd
 import ticker_resolution as tr
 import getEODprice as g12
-# import macro_widgets as mw
+import macro_widgets as mw
 import plot_portfolio_weights as ppw
 import datetime as dt
 from market_data_api import Finage
+from position_ledger import PositionLedger
 from pandas.tseries.holiday import USFederalHolidayCalendar
 
 def replace_duplicated_ticker(df_in: pd.DataFrame) -> pd.DataFrame:
@@ -35,21 +36,25 @@ def color_green_red(val):
     return f'background-color: {color}'
 
 @st.cache_data
-def openPositionsCosts(df_in: pd.DataFrame) -> pd.DataFrame:  #TODO: rewrite a new open position table
-def color_green_red(val):
-    color = 'green' if val > 0 else 'red'
-    return f'background-color: {color}'
+def tickers_resolved(df_in: pd.DataFrame) -> pd.DataFrame:
+    return replace_duplicated_ticker(df_in)
 
 @st.cache_data
+def last_close_prices(us_symbols: list, uk_symbols: list) -> dict:
+    return {**g12.getEODpriceUSA(us_symbols), **g12.getEODpriceUK(uk_symbols)}
+
 def openPositionsCosts(df_in: pd.DataFrame) -> pd.DataFrame:  #TODO: rewrite a new open position table
-    """Calculate open position and costs for each ticker"""
-    df = replace_duplicated_ticker(df_in).drop(columns=['Settlement date']).drop(columns=['Settlement date'])
-    df_op = df.groupby(['Market','Ticker']).sum()
+    """Calculate open position and costs for each ticker, trades already in the ledger snapshot are not summed again
+    not cached by streamlit since it updates the ledger snapshot on disk, the slow parts are cached separately"""
+    df = tickers_resolved(df_in)
+    ledger = PositionLedger.for_trades(df, "open_positions_costs", key=['Market', 'Ticker'], last_columns=[], date_column='Settlement date',
+                                       sum_columns=['Quantity', 'Consideration', 'Cost/Proceeds', 'Commission', 'Charges'])
+    ledger.ingest(df)  # saves the snapshot when trades were added
+    df_op = ledger.positions()
     symbols_with_position = df_op[df_op['Quantity'] > 0].index.get_level_values('Ticker').tolist()
     us_symbols_with_position = [x for x in symbols_with_position if x.count('.') == 0]
     uk_symbols_with_position = [x for x in symbols_with_position if x[-2:] == '.L'] # TODO: add more market in other region in future
-    uk_symbols_with_position = [x for x in symbols_with_position if x[-2:] == '.L'] # TODO: add more market in other region in future
-    all_symbols_close_price = {**g12.getEODpriceUSA(us_symbols_with_position), **g12.getEODpriceUK(uk_symbols_with_position)}
+    all_symbols_close_price = last_close_prices(us_symbols_with_position, uk_symbols_with_position)
     df_op['Last Close'] = df_op.index.get_level_values("Ticker").map(all_symbols_close_price).astype(float)
     df_op['current position'] = df_op['Quantity'] * df_op['Last Close']
     return df_op[['Quantity', 'Consideration', 'current position','Cost/Proceeds', 'Commission','Charges']] # type: ignore
@@ -283,12 +288,12 @@ def threeTabs():
         if last_business_day.date() in usa_holidays:
             last_business_day = dt.datetime.today() - pd.offsets.BDay(5)
 
-        t_curve_date = st.date_input("Select date", last_business_day, help="present or future date show max history, data from NASDAQ data link").strftime("%Y-%m-%d")
-        # st.plotly_chart(mw.treasury_curve(t_curve_date), use_container_width=True)
+        t_curve_date = st.date_input("Select date", last_business_day, help="today animates the last 90 days, a future date shows the full history, data from FRED").strftime("%Y-%m-%d")
+        st.plotly_chart(mw.treasury_curve(t_curve_date), use_container_width=True)
 
         st.subheader("Gold and Silver")
         show_recession_highlights = st.checkbox("show recession dates")
-        # st.plotly_chart(mw.gold_silver_price(show_recession_highlights), use_container_width=True)
+        st.plotly_chart(mw.gold_silver_price(show_recession_highlights), use_container_width=True)
 
     with tab4:
         st.header("Financial Independent and Retire Early")
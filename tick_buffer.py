@@ -0,0 +1,84 @@
+''' fixed size, per symbol tick store between a websocket thread and a UI refreshing at a fixed frame rate
+eg. buffer = CoalescingTickBuffer(interval=1.0, max_bars=300)
+    buffer.on_trades(message["data"])     # websocket thread, finnhub trades [{"s": "AAPL", "p": 189.5, "t": 1700000000000, "v": 10}]
+    version, symbols = buffer.snapshot()  # UI thread, once per frame, redraw only when version changed
+
+ticks are not queued: each symbol keeps only its latest trade, the OHLCV bar of the current interval and a deque
+of the last max_bars completed bars, so memory does not depend on the tick rate and a slow UI never falls behind,
+it just shows the latest state on its next frame.'''
+import threading
+from collections import deque
+import pandas as pd
+
+BAR_COLUMNS = ["time", "open", "high", "low", "close", "volume"]
+
+
+class SymbolTicks:
+    __slots__ = ("price", "time", "trades", "bar", "bars")
+
+    def __init__(self, max_bars: int):
+        self.price = None
+        self.time = None
+        self.trades = 0
+        self.bar = None  # [start_ms, open, high, low, close, volume]
+        self.bars = deque(maxlen=max_bars)
+
+
+class CoalescingTickBuffer:
+    def __init__(self, interval: float = 1.0, max_bars: int = 300):
+        self.interval_ms = int(interval * 1000)
+        self.max_bars = max_bars
+        self.symbols = {}
+        self.version = 0
+        self.lock = threading.Lock()
+
+    def on_trades(self, trades: list):
+        with self.lock:
+            for trade in trades:
+                ticks = self.symbols.get(trade["s"])
+                if ticks is None:
+                    ticks = self.symbols[trade["s"]] = SymbolTicks(self.max_bars)
+                price, ts, volume = trade["p"], trade["t"], trade.get("v") or 0
+                if ticks.time is not None and ts < ticks.time:  # late tick, only counts for volume of its bar
+                    if ticks.bar is not None and ts >= ticks.bar[0]:
+                        ticks.bar[5] += volume
+                    continue
+                start = ts - ts % self.interval_ms
+                bar = ticks.bar
+                if bar is None or start != bar[0]:
+                    if bar is not None:
+                        ticks.bars.append(tuple(bar))
+                    ticks.bar = [start, price, price, price, price, volume]
+                else:
+                    bar[2] = max(bar[2], price)
+                    bar[3] = min(bar[3], price)
+                    bar[4] = price
+                    bar[5] += volume
+                ticks.price, ticks.time = price, ts
+                ticks.trades += 1
+            self.version += 1
+
+    def snapshot(self) -> tuple:
+        ''' (version, {symbol: {"price", "time", "trades", "bars": list of (time ms, open, high, low, close, volume)}}) '''
+        with self.lock:
+            return self.version, {
+                symbol: {"price": t.price, "time": t.time, "trades": t.trades,
+                         "bars": list(t.bars) + ([tuple(t.bar)] if t.bar is not None else [])}
+                for symbol, t in self.symbols.items()}
+
+    @staticmethod
+    def bars_frame(bars: list) -> pd.DataFrame:
+        df = pd.DataFrame(bars, columns=BAR_COLUMNS)
+        df["time"] = pd.to_datetime(df["time"], unit="ms")
+        return df.set_index("time")
+
+    def discard(self, symbols):
+        with self.lock:
+            for symbol in symbols:
+                self.symbols.pop(symbol, None)
+            self.version += 1
+
+    def clear(self):
+        with self.lock:
+            self.symbols = {}
+            self.version += 1
@@ -0,0 +1,137 @@
+''' trigram inverted index over company names, for fuzzy name -> ticker lookups
+eg. index = index_for([("Apple Inc.", "AAPL"), ("Alphabet Inc.", "GOOGL")], "sec", snapshot_stamp())
+    index.search("Apple Incorporated", limit=5)   # [(name, ticker, score), ...] best first, score is trigram dice 0..1
+    index.first_containing("alphabet")            # ("Alphabet Inc.", "GOOGL"), first name in list order containing the word
+
+one index per name is cached in memory and pickled to .cache/ticker_index/{name}-{version}.pkl, version being a
+cheap stamp of the source (eg. the file's mtime and size), so SEC company_tickers.json and the IG share list are
+indexed once and reused across uploads and restarts. A new version replaces the previous index of the same name
+and deletes its older pickles. Without a name the (name, ticker) list itself is hashed on every call and the
+hash is both name and version, so unrelated lists never evict each other.'''
+import hashlib
+import os
+import pickle
+import re
+import threading
+from typing import Optional
+import numpy as np
+
+pwd = os.path.dirname(os.path.realpath(__file__))
+default_index_dir = os.environ.get("TICKER_INDEX_DIR", pwd + "/.cache/ticker_index")
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def normalise_name(name: str) -> str:
+    name = re.sub(r'\(.*?\)', ' ', str(name).upper())  # eg (All Sessions)
+    return " ".join(re.sub(r'[^0-9A-Z]+', ' ', name).split())
+
+
+def trigrams(text: str, pad: bool = True) -> set:
+    text = f" {text} " if pad else text
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class TickerIndex:
+    def __init__(self, pairs):
+        self.names = [str(name) for name, _ in pairs]
+        self.tickers = [ticker for _, ticker in pairs]
+        self.lower_names = [name.lower() for name in self.names]
+        postings = {}
+        sizes = np.zeros(len(self.names), dtype=np.int32)
+        for i, name in enumerate(self.names):
+            grams = trigrams(normalise_name(name))
+            sizes[i] = len(grams)
+            for gram in grams:
+                postings.setdefault(gram, []).append(i)
+        self.sizes = sizes
+        self.postings = {gram: np.asarray(ids, dtype=np.int32) for gram, ids in postings.items()}
+        # unpadded lowercase trigrams of the raw names, for substring lookups
+        raw_postings = {}
+        for i, name in enumerate(self.lower_names):
+            for gram in trigrams(name, pad=False):
+                raw_postings.setdefault(gram, []).append(i)
+        self.raw_postings = {gram: np.asarray(ids, dtype=np.int32) for gram, ids in raw_postings.items()}
+
+    def __len__(self):
+        return len(self.names)
+
+    def search(self, query: str, limit: int = 5) -> list:
+        grams = trigrams(normalise_name(query))
+        hits = [self.postings[g] for g in grams if g in self.postings]
+        if not hits or not grams:
+            return []
+        overlap = np.bincount(np.concatenate(hits), minlength=len(self.names))
+        candidates = np.flatnonzero(overlap)
+        scores = 2.0 * overlap[candidates] / (len(grams) + self.sizes[candidates])
+        if len(candidates) > limit:
+            top = np.argpartition(-scores, limit - 1)[:limit]
+            candidates, scores = candidates[top], scores[top]
+        order = np.lexsort((candidates, -scores))  # best score first, list order breaks ties
+        return [(self.names[i], self.tickers[i], float(s)) for i, s in zip(candidates[order], scores[order])]
+
+    def first_containing(self, word: str):
+        ''' first (name, ticker) in list order whose name contains word, case insensitive, or None '''
+        word = word.lower()
+        grams = trigrams(word, pad=False)
+        if grams:
+            if any(g not in self.raw_postings for g in grams):
+                return None
+            postings = sorted((self.raw_postings[g] for g in grams), key=len)
+            candidates = postings[0]
+            for p in postings[1:]:
+                candidates = np.intersect1d(candidates, p, assume_unique=True)
+        else:  # one or two letter words have no trigram, scan
+            candidates = range(len(self.names))
+        for i in candidates:
+            if word in self.lower_names[i]:
+                return self.names[i], self.tickers[i]
+        return None
+
+
+def _stamp_digest(version) -> str:
+    return hashlib.sha256(repr(version).encode()).hexdigest()[:16]
+
+
+def _remove_stale(index_dir: str, name: str, keep: str):
+    ''' delete the pickles of name written before keep, other names are left alone '''
+    written = os.path.getmtime(os.path.join(index_dir, keep))
+    for entry in os.listdir(index_dir):
+        if not entry.endswith(".pkl") or entry == keep or entry[:-len(".pkl")].rsplit("-", 1)[0] != name:
+            continue
+        path = os.path.join(index_dir, entry)
+        try:
+            if os.path.getmtime(path) <= written:
+                os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def index_for(pairs, name: Optional[str] = None, version=None, index_dir: str = default_index_dir) -> TickerIndex:
+    ''' pairs is a list of (name, ticker) or a dict name -> ticker, version changes whenever pairs does
+    name and version identify the source, eg. ("sec", snapshot_stamp()), without them the pairs are hashed '''
+    if not pairs:
+        return TickerIndex([])
+    if name is None or version is None:
+        pairs = list(pairs.items()) if isinstance(pairs, dict) else list(pairs)
+        version = hashlib.sha256(repr(pairs).encode()).hexdigest()[:32]
+        name = name or f"pairs_{version[:16]}"
+    with _indexes_lock:
+        cached = _indexes.get(name)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        filename = f"{name}-{_stamp_digest(version)}.pkl"
+        path = os.path.join(index_dir, filename)
+        try:
+            with open(path, 'rb') as f:
+                index = pickle.load(f)
+        except (FileNotFoundError, pickle.UnpicklingError, EOFError, AttributeError):
+            index = TickerIndex(list(pairs.items()) if isinstance(pairs, dict) else pairs)
+            os.makedirs(index_dir, exist_ok=True)
+            with open(path + ".tmp", 'wb') as f:
+                pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(path + ".tmp", path)
+            _remove_stale(index_dir, name, filename)
+        _indexes[name] = (version, index)
+        return index
@@ -1,23 +1,25 @@
 import pandas as pd
 import numpy as np
-import json
+import hashlib
 import re
 import os
 import PyPDF2
 from datetime import datetime
 from difflib import get_close_matches
+from ticker_index import index_for
 import tqdm
-import requests
+from sec_tickers import company_tickers, snapshot_stamp
+from ticker_store import get_store
 
 # reference_data_json_file = sys.path[0] + '/company_name_to_ticker.json'
 pwd = os.path.dirname(os.path.realpath(__file__))
 reference_data_json_file = pwd + '/company_name_to_ticker.json'
+pdf_cache_dir = os.environ.get("IG_PDF_CACHE_DIR", pwd + "/.cache/ig_share_list")
 print("reference_data_json_file: ", reference_data_json_file)
 
 def load_ticker_from_json(json_file: str, df_in: pd.DataFrame) -> pd.DataFrame:
     try: 
-        with open(json_file) as f: 
-            ticker_dict = json.load(f)
+        ticker_dict = get_store(json_file).mapping()
     except FileNotFoundError:
         print(f"Error: {json_file} not found")
         df_in['Ticker'] = np.nan
@@ -28,24 +30,9 @@ def load_ticker_from_json(json_file: str, df_in: pd.DataFrame) -> pd.DataFrame:
     return df_in
 
 def get_sec_tickers() -> dict:
-    # get json from sec site and convert to dict
-    url = "https://www.sec.gov/files/company_tickers.json"
-    request_headers = {
-    "accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7",
-    "priority": "u=0, i",
-    "sec-ch-ua": '"Not(A:Brand";v="99", "Google Chrome";v="133", "Chromium";v="133"',
-    "sec-ch-ua-mobile": "?0",
-    "sec-ch-ua-platform": '"Windows"',
-    "sec-fetch-dest": "document",
-    "sec-fetch-mode": "navigate",
-    "sec-fetch-site": "none",
-    "sec-fetch-user": "?1",
-    "upgrade-insecure-requests": "1",
-    "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/133.0.0.0 Safari/537.36",
-    }
+    # sec company_tickers.json from the local revalidated copy, see sec_tickers.py
     try:
-        response = requests.get(url, headers=request_headers, allow_redirects=True)
-        list_of_dicts = [value for value in response.json().values()]
+        list_of_dicts = company_tickers()
     except:
         print("Error: CANNOT get to sec tickers from https://www.sec.gov/files/company_tickers.json")
         return {}
@@ -55,9 +42,40 @@ def get_sec_tickers() -> dict:
     return dict(zip(sec_site_mapping['title'], sec_site_mapping['ticker']))   
 
 
-def pdf_to_dataframe(pdf_path: str) -> pd.DataFrame:
-    """read from local pdf and return_type accepts symbol or ticker or US-symbol """
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def file_stamp(path: str):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+def pdf_to_dataframe(pdf_path: str, cache_dir: str = pdf_cache_dir) -> pd.DataFrame:
+    """read from local pdf and return_type accepts symbol or ticker or US-symbol
+    the parsed share list is saved as parquet keyed by the pdf's sha256, so each version of the pdf is parsed once"""
     start = datetime.now()
+    if not os.path.exists(pdf_path):
+        print("Error: can not open pdf")
+        return {}
+    cache_path = os.path.join(cache_dir, file_sha256(pdf_path)[:32] + ".parquet")
+    try:
+        cached = pd.read_parquet(cache_path)
+        print(f"Total extracted records loaded from parsed IG pdf cache: {len(cached)} and time taken: {datetime.now() - start}")
+        return cached
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError, ImportError) as e:  # truncated or corrupt file (pyarrow ArrowInvalid is a ValueError), no parquet engine
+        print(f"Error: can not read parsed IG pdf cache {cache_path} ({e}), parsing the pdf again")
+        try:
+            os.remove(cache_path)
+        except OSError:
+            pass
     print("Start reading pdf file...")
     alltext = ""
     try:
@@ -81,16 +99,18 @@ def pdf_to_dataframe(pdf_path: str) -> pd.DataFrame:
         if i.endswith('Y') or i.endswith('N'):
             mapping_lines.append(i)
     print(f"Total usable lines found  in IG pdf: {len(mapping_lines)} and time taken: {datetime.now() - start}")
-    pattern = r"(?P<name>^.*)\s(?P<ticker>\w+.\w+)\s\/\s(?P<symbol>\w+)\s(?P<region>\w+).*\s(?P<ISA>\w)\s(?P<SIPP>\w)$"
+    pattern = re.compile(r"(?P<name>^.*)\s(?P<ticker>\w+.\w+)\s\/\s(?P<symbol>\w+)\s(?P<region>\w+).*\s(?P<ISA>\w)\s(?P<SIPP>\w)$")
     print("Start parsing pdf lines...")
-    all_pdf_data = pd.DataFrame()
-    for i in tqdm.tqdm(mapping_lines):
-        m = re.search(pattern, i)
-        if m:
-            # all_pdf_tickers = all_pdf_tickers.append(m.groupdict(), ignore_index=True) also works but futureWarning
-            all_pdf_data = pd.concat([all_pdf_data, pd.DataFrame.from_dict(m.groupdict(), orient='index').T], ignore_index=True)
-    pdf_uppercase_ticker_only = all_pdf_data[all_pdf_data['ticker'].apply(no_lowercase)] # remove ticker with lowercase to avoid duplication eg SDRt.L
+    records = [m.groupdict() for m in map(pattern.search, mapping_lines) if m]
+    all_pdf_data = pd.DataFrame(records, columns=list(pattern.groupindex))
+    pdf_uppercase_ticker_only = all_pdf_data[~all_pdf_data['ticker'].str.contains(r'[a-z]')].reset_index(drop=True) # remove ticker with lowercase to avoid duplication eg SDRt.L
     print(f"Total extracted records found in IG pdf: {len(pdf_uppercase_ticker_only)} and time taken: {datetime.now() - start}")
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        pdf_uppercase_ticker_only.to_parquet(cache_path + ".tmp", index=False)
+        os.replace(cache_path + ".tmp", cache_path)
+    except (OSError, ValueError, ImportError) as e:
+        print(f"Error: can not save parsed IG pdf cache {cache_path} ({e})")
     return pdf_uppercase_ticker_only
 
 def ig_pdf_dataframe_to_dict(df_in: pd.DataFrame, return_type: str = 'symbol') -> dict:
@@ -136,14 +156,18 @@ def ig_pdf_dataframe_to_dict(df_in: pd.DataFrame, return_type: str = 'symbol') -
 def no_lowercase(s: str) -> bool:
     return not bool(re.search(r'[a-z]', s))
 
-def close_matched_tickers(unknown_ticker_list: list, tickers_dict: dict, cutoff_ratio = 0.801) -> dict:
+def close_matched_tickers(unknown_ticker_list: list, tickers_dict: dict, cutoff_ratio = 0.801, index=None) -> dict:
     """
     compare company name without tickers against a ticker dictionary find close word match ratio above 0.8 by default
+    difflib only scores the 20 names sharing the most trigrams with each company name, see ticker_index.py,
+    a name outside that shortlist is not matched even if its ratio is above the cutoff
     """
     possible_resolute = {}
-    ticker_keys = list(tickers_dict.keys())
+    index = index_for(tickers_dict) if index is None else index
     for i in unknown_ticker_list:
-        closely_matched_name = get_close_matches(i, ticker_keys, cutoff=cutoff_ratio)
+        # shortlist by trigram index, then the same difflib ratio and cutoff on the shortlist only
+        shortlist = [name for name, _, _ in index.search(i, limit=20)]
+        closely_matched_name = get_close_matches(i, shortlist, cutoff=cutoff_ratio)
         if len(closely_matched_name) > 0:
             possible_resolute[i] = tickers_dict[closely_matched_name[0]]
     return possible_resolute
@@ -172,27 +196,23 @@ def match_tickers_dict(ticker_dict: dict, df_in: pd.DataFrame, close_match=False
 
 
 def add_ticker_to_json(new_dict: dict, output_json_file: str):
-    ''' open existing json, read to dict, add new dict, write to json'''
-    with open(output_json_file, 'r+') as f:
-        existing_dict = json.load(f)
-        existing_dict.update(new_dict)
-        f.seek(0)
-        json.dump(existing_dict, f, indent=4)
-
-def ticker_by_keyword(unresolved_tpname: list, tickers_dict: dict) -> dict:
+    ''' merge new dict into the json under a file lock, see ticker_store.py'''
+    get_store(output_json_file).update(new_dict)
+
+def ticker_by_keyword(unresolved_tpname: list, tickers_dict: dict, index=None) -> dict:
     """
     find keyword in company name and search for relevant ticker in ticker dictionary, case insensitive
     """
     not_keyword = ["the", "inc", "corp", "ltd", "limited", "co", "corporation", 
     "company", "plc", "group", "lp", "holdings", "trust", "laboratories"] # non-keywords must be lower case
     possible_resolute = {}
+    index = index_for(tickers_dict) if index is None else index
     for i in unresolved_tpname: 
         for j in [x.lower() for x in i.split()]:
             if j not in not_keyword:
-                for k in tickers_dict.keys():
-                    if j in k.lower():
-                        possible_resolute[i] = tickers_dict[k]
-                        break
+                match = index.first_containing(j)
+                if match:
+                    possible_resolute[i] = match[1]
                 break
     return possible_resolute      
 
@@ -224,7 +244,8 @@ def add_ticker(df_in: pd.DataFrame, output_json_file = reference_data_json_file)
         return df_in
 
     # add ticker from IG pdf
-    df_pdf = pdf_to_dataframe(f'{pwd}/Stockbroking Share List.pdf')
+    pdf_path = f'{pwd}/Stockbroking Share List.pdf'
+    df_pdf = pdf_to_dataframe(pdf_path)
     pdf_tickers = ig_pdf_dataframe_to_dict(df_pdf)
     df_in, ttl_resolved_instrument = match_tickers_dict(pdf_tickers, df_in)
     print(f"Total instruments resolved after appending json file: {ttl_resolved_instrument} out of {total_instruments}")
@@ -234,7 +255,8 @@ def add_ticker(df_in: pd.DataFrame, output_json_file = reference_data_json_file)
 
 
     # close match tickers from sec site
-    close_matched_result = close_matched_tickers(df_in[df_in['Ticker'].isna()]['Market'], sec_tickers)
+    sec_index = index_for(sec_tickers, "sec", snapshot_stamp())
+    close_matched_result = close_matched_tickers(df_in[df_in['Ticker'].isna()]['Market'], sec_tickers, index=sec_index)
     print(f"{close_matched_result} to be added to dataframe and json file, sec")
     df_in, ttl_resolved_instrument = match_tickers_dict(close_matched_result, df_in, close_match=True)
     if ttl_resolved_instrument == total_instruments:
@@ -242,7 +264,8 @@ def add_ticker(df_in: pd.DataFrame, output_json_file = reference_data_json_file)
         return df_in
 
     # close match tickers from IG pdf
-    close_matched_result = close_matched_tickers(df_in[df_in['Ticker'].isna()]['Market'], pdf_tickers, cutoff_ratio=0.667)
+    close_matched_result = close_matched_tickers(df_in[df_in['Ticker'].isna()]['Market'], pdf_tickers, cutoff_ratio=0.667,
+                                                 index=index_for(pdf_tickers, "ig_pdf", file_stamp(pdf_path)))
     print(f"{close_matched_result} to be added to dataframe and json file, pdf")
     df_in, ttl_resolved_instrument = match_tickers_dict(close_matched_result, df_in, close_match=True)
     if ttl_resolved_instrument == total_instruments:
@@ -251,7 +274,7 @@ def add_ticker(df_in: pd.DataFrame, output_json_file = reference_data_json_file)
 
     # resolve by keyword
     unresolved_company_name = df_in[df_in['Ticker'].isna()]['Market'].unique()
-    keyword_resolution = ticker_by_keyword(unresolved_company_name, sec_tickers)
+    keyword_resolution = ticker_by_keyword(unresolved_company_name, sec_tickers, index=sec_index)
     #keyword_resolution = ticker_by_keyword(unresolved_company_name, pdf_tickers)
     print(f"{keyword_resolution} to be added to dataframe and json file, keyword")
     df_in, ttl_resolved_instrument = match_tickers_dict(keyword_resolution, df_in, close_match=True)
@@ -0,0 +1,107 @@
+''' company name -> ticker mapping file shared by every dashboard session
+eg. store = get_store()                       # company_name_to_ticker.json next to this file
+    store.mapping()                           # dict, parsed again only when the file's mtime/size changes
+    store.update({"Apple Inc": "AAPL"})       # locked read-merge-write, atomic rename, logged
+
+update takes an exclusive file lock, merges into what is on disk at that moment (not the cached copy) and
+replaces the file with os.replace, so two sessions saving at once both keep their mappings and a reader
+never sees a half written file. Every changed entry is appended to a jsonl change log.
+mapping() returns a new dict after every change, never mutate it in place.'''
+import json
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+try:
+    import fcntl
+except ImportError:  # windows
+    fcntl = None
+    import msvcrt
+
+pwd = os.path.dirname(os.path.realpath(__file__))
+default_mapping_file = pwd + '/company_name_to_ticker.json'
+default_log_dir = os.environ.get("TICKER_STORE_LOG_DIR", pwd + "/.cache")
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+class TickerMappingStore:
+    def __init__(self, path: str = default_mapping_file, log_dir: str = default_log_dir):
+        self.path = os.path.realpath(path)
+        name = os.path.splitext(os.path.basename(self.path))[0]
+        self.lock_path = os.path.join(log_dir, name + ".lock")
+        self.log_path = os.path.join(log_dir, name + ".changes.jsonl")
+        self.log_dir = log_dir
+        self._mapping = None
+        self._stamp = None
+        self._lock = threading.Lock()
+
+    def _file_stamp(self) -> tuple:
+        st = os.stat(self.path)
+        return st.st_mtime_ns, st.st_size
+
+    def _read(self) -> tuple:
+        stamp = self._file_stamp()
+        with open(self.path) as f:
+            return json.load(f), stamp
+
+    def mapping(self) -> dict:
+        ''' raises FileNotFoundError if the mapping file does not exist yet '''
+        stamp = self._file_stamp()
+        with self._lock:
+            if stamp != self._stamp:
+                self._mapping, self._stamp = self._read()
+            return self._mapping
+
+    @contextmanager
+    def _file_lock(self):
+        os.makedirs(self.log_dir, exist_ok=True)
+        with open(self.lock_path, 'a+') as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+                else:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def update(self, new_dict: dict) -> dict:
+        ''' merge new_dict into the file, returns the entries that actually changed '''
+        with self._lock, self._file_lock():
+            try:
+                current, _ = self._read()
+            except FileNotFoundError:
+                current = {}
+            changed = {k: v for k, v in new_dict.items() if current.get(k) != v}
+            if not changed:
+                return {}
+            merged = {**current, **changed}
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp, 'w') as f:
+                json.dump(merged, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+
+            now = datetime.now().isoformat(timespec='seconds')
+            with open(self.log_path, 'a') as log:
+                for k, v in changed.items():
+                    log.write(json.dumps({'time': now, 'name': k, 'old': current.get(k), 'new': v}) + "\n")
+            self._mapping, self._stamp = merged, self._file_stamp()
+            return changed
+
+
+def get_store(path: str = default_mapping_file) -> TickerMappingStore:
+    ''' one store per mapping file per process '''
+    path = os.path.realpath(path)
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = TickerMappingStore(path)
+        return _stores[path]
@@ -1,12 +1,17 @@
+import asyncio
 import unittest
 from unittest.mock import MagicMock, patch
 from alpaca_client import AlpacaMarketDataClient
+try:
+    from alpaca_async import AsyncAlpacaMarketDataClient
+except ImportError:  # aiohttp not installed
+    AsyncAlpacaMarketDataClient = None
 
 class TestAlpacaMarketDataClient(unittest.TestCase):
     def setUp(self):
         self.client = AlpacaMarketDataClient("test_key", "test_secret")
 
-    @patch('requests.get')
+    @patch('http_session.get')
     def test_get_stock_bars(self, mock_get):
         mock_response = MagicMock()
         mock_response.json.return_value = {"bars": []}
@@ -30,7 +35,7 @@ class TestAlpacaMarketDataClient(unittest.TestCase):
             }
         )
 
-    @patch('requests.get')
+    @patch('http_session.get')
     def test_get_crypto_trades(self, mock_get):
         mock_response = MagicMock()
         mock_response.json.return_value = {"trades": []}
@@ -52,7 +57,7 @@ class TestAlpacaMarketDataClient(unittest.TestCase):
             }
         )
 
-    @patch('requests.get')
+    @patch('http_session.get')
     def test_get_news(self, mock_get):
         mock_response = MagicMock()
         mock_response.json.return_value = {"news": []}
@@ -76,5 +81,79 @@ class TestAlpacaMarketDataClient(unittest.TestCase):
             }
         )
 
+    @patch('http_session.get')
+    def test_iter_dataframes_follows_page_token(self, mock_get):
+        pages = [
+            {"trades": {"AAPL": [{"p": 1.0}, {"p": 2.0}], "MSFT": [{"p": 3.0}]}, "next_page_token": "abc"},
+            {"trades": {"AAPL": [{"p": 4.0}]}, "next_page_token": None},
+        ]
+        for prefetch in (False, True):
+            mock_get.side_effect = [MagicMock(json=MagicMock(return_value=page)) for page in pages]
+            chunks = list(self.client.iter_dataframes(self.client.get_multi_stock_trades, ["AAPL", "MSFT"],
+                                                      "2023-01-01", chunk_size=3, prefetch=prefetch))
+            self.assertEqual([len(c) for c in chunks], [3, 1])
+            self.assertEqual(chunks[0]["symbol"].tolist(), ["AAPL", "AAPL", "MSFT"])
+            self.assertEqual(mock_get.call_args_list[-1].kwargs["params"]["page_token"], "abc")
+
+
+class FakeResponse:
+    def __init__(self, page):
+        self.page = page
+        self.status = 200
+        self.headers = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+    async def json(self):
+        return self.page
+
+
+class FakeSession:
+    def __init__(self, pages):
+        self.pages = list(pages)
+        self.calls = []
+
+    def get(self, url, params=None):
+        self.calls.append((url, params))
+        return FakeResponse(self.pages.pop(0))
+
+
+@unittest.skipIf(AsyncAlpacaMarketDataClient is None, "aiohttp is not installed")
+class TestAsyncAlpacaMarketDataClient(unittest.TestCase):
+    pages = [
+        {"trades": {"AAPL": [{"p": 1.0}, {"p": 2.0}]}, "next_page_token": "abc"},
+        {"trades": {"MSFT": [{"p": 3.0}]}, "next_page_token": None},
+    ]
+
+    def collect(self, prefetch):
+        async def run():
+            client = AsyncAlpacaMarketDataClient("test_key", "test_secret")
+            session = FakeSession(self.pages)
+            client.session = lambda: session
+            pages = [page async for page in client.iter_pages(client.get_multi_stock_trades, ["AAPL", "MSFT"],
+                                                                "2023-01-01", prefetch=prefetch)]
+            return pages, session.calls
+        return asyncio.run(run())
+
+    def test_iter_pages_follows_page_token(self):
+        for prefetch in (False, True):
+            pages, calls = self.collect(prefetch)
+            self.assertEqual(pages, self.pages)
+            self.assertEqual([params.get("page_token") for _, params in calls], [None, "abc"])
+            self.assertEqual(calls[0][0], "https://data.alpaca.markets/v2/stocks/trades")
+
+    def test_iter_dataframes_is_sync_only(self):
+        client = AsyncAlpacaMarketDataClient("test_key", "test_secret")
+        with self.assertRaises(TypeError):
+            client.iter_dataframes(client.get_multi_stock_trades, ["AAPL"], "2023-01-01")
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,42 @@
+import unittest
+import numpy as np
+import pandas as pd
+from currency_conversion import FXConverter, infer_currencies, normalise_minor_units
+
+
+class TestCurrencyConversion(unittest.TestCase):
+    def setUp(self):
+        # units per GBP, no rate on the 3rd and 4th
+        self.fx = FXConverter(pd.DataFrame({'USD': [1.25, 1.30], 'EUR': [1.15, 1.20]},
+                                           index=['2024-01-02', '2024-01-05']))
+
+    def test_normalise_minor_units(self):
+        amounts, majors = normalise_minor_units([1234.0, 500.0, 10.0, 7.0], ['GBp', 'GBX', 'USD', 'GBP'])
+        np.testing.assert_allclose(amounts, [12.34, 5.0, 10.0, 7.0])
+        self.assertEqual(majors.tolist(), ['GBP', 'GBP', 'USD', 'GBP'])
+
+    def test_to_base_latest_and_on_or_before_dates(self):
+        np.testing.assert_allclose(self.fx.to_base([130.0, 120.0, 250.0], ['USD', 'EUR', 'GBp']), [100.0, 100.0, 2.5])
+        dated = self.fx.to_base([125.0, 125.0, 130.0, 125.0], ['USD'] * 4,
+                                ['2024-01-02', '2024-01-04', '2024-01-06', '2023-12-29'])
+        np.testing.assert_allclose(dated, [100.0, 100.0, 100.0, 100.0])  # carried forward, first rate before the start
+
+    def test_unknown_currency_is_nan_not_an_error(self):
+        converted = self.fx.to_base([100.0, 100.0, 125.0], ['JPY', None, 'USD'])
+        self.assertTrue(np.isnan(converted[:2]).all())
+        self.assertAlmostEqual(converted[2], 125.0 / 1.30)
+        self.assertEqual(self.fx.unknown(['JPY', None, 'USD', 'GBX']), ['JPY', 'missing'])
+        matrix = self.fx.rate_matrix(['USD', 'JPY'], pd.bdate_range('2024-01-02', '2024-01-05'))
+        self.assertTrue(matrix['JPY'].isna().all())
+        self.assertAlmostEqual(matrix['USD'].iloc[-1], 1 / 1.30)
+
+    def test_infer_currencies(self):
+        currencies = infer_currencies(['EUR', None, None, None, None], ['SAP', 'VOD.L', 'MSFT', 'BRK.B', None],
+                                      [None, None, None, None, 'RTX Corporation (All Sessions)'])
+        self.assertEqual(currencies.tolist()[:3], ['EUR', 'GBP', 'USD'])
+        self.assertTrue(pd.isna(currencies[3]))
+        self.assertEqual(currencies[4], 'USD')
+
+
+if __name__ == '__main__':
+    unittest.main()
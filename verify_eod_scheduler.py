@@ -0,0 +1,56 @@
+import unittest
+from unittest.mock import MagicMock, patch
+from getEODprice import TwelveDataEODScheduler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def eod_response(symbols):
+    response = MagicMock()
+    if len(symbols) == 1:
+        response.json.return_value = {"symbol": symbols[0], "close": "1.0"}
+    else:
+        response.json.return_value = {s: {"symbol": s, "close": "1.0"} for s in symbols}
+    return response
+
+
+class TestTwelveDataEODScheduler(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patchers = [patch('rate_limit.monotonic', self.clock.monotonic), patch('getEODprice.sleep', self.clock.sleep)]
+        for p in patchers:
+            p.start()
+            self.addCleanup(p.stop)
+
+    @patch('http_session.get')
+    def test_batch_larger_than_key_capacity(self, mock_get):
+        mock_get.side_effect = lambda url, params: eod_response(params["symbol"].split(","))
+        symbols = [f"S{i}" for i in range(10)]
+
+        prices = TwelveDataEODScheduler(['k1'], credits_per_minute=4, batch_size=8).fetch(symbols)
+
+        self.assertEqual(set(prices), set(symbols))
+        self.assertTrue(all(len(call.kwargs["params"]["symbol"].split(",")) <= 4 for call in mock_get.call_args_list))
+        self.assertAlmostEqual(self.clock.now, 90.0)  # 4 now, 4 a minute later, the last 2 after 30s more
+
+    def test_no_api_keys(self):
+        with self.assertRaisesRegex(ValueError, "api key"):
+            TwelveDataEODScheduler([])
+
+    @patch('http_session.get')
+    def test_no_symbols(self, mock_get):
+        self.assertEqual(TwelveDataEODScheduler(['k1']).fetch([]), {})
+        mock_get.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+import unittest
+from unittest.mock import MagicMock, patch
+from urllib.parse import parse_qs
+from ig.models import UserSession
+from ig.streaming import IGStreamingClient, apply_update
+
+class TestIGStreamingClient(unittest.TestCase):
+    def setUp(self):
+        session = UserSession(client_id="c", account_id="ABC12", lightstreamer_endpoint="https://ls.example.com",
+                              active_account_id="ABC12", cst_token="cst", x_security_token="xst")
+        self.client = IGStreamingClient(session, reconnect=False)
+        # stand-in for the server side of the websocket: record what the client sends, feed lines back
+        self.client.ws = MagicMock()
+        self.sent = lambda: [c.args[0] for c in self.client.ws.send.call_args_list]
+
+    def test_apply_update_decodes_deltas(self):
+        values = ["1.1", "1.2", "1.0", "1.3", "TRADEABLE"]
+        changed = apply_update(values, "1.15||^2|$")
+        self.assertEqual(values, ["1.15", "1.2", "1.0", "1.3", ""])
+        self.assertEqual(changed, [0, 4])
+        apply_update(values, "#|1%7C2|^3")
+        self.assertEqual(values[:2], [None, "1|2"])
+
+    def test_session_subscribe_and_updates(self):
+        updates = []
+        self.client.add_listener(lambda epic, values: updates.append((epic, values["BID"], values["OFFER"])))
+        sub_id = self.client.subscribe(["CS.D.EURUSD.TODAY.IP", "IX.D.FTSE.DAILY.IP"])
+
+        self.client._on_open(self.client.ws)
+        request, params = self.sent()[1].split("\r\n")
+        self.assertEqual(self.sent()[0], "wsok")
+        self.assertEqual(request, "create_session")
+        self.assertEqual(parse_qs(params)["LS_password"], ["CST-cst|XST-xst"])
+
+        self.client._on_message(self.client.ws, "WSOK\r\nCONOK,S1,50000,5000,*\r\n")
+        control, params = self.sent()[2].split("\r\n")
+        params = parse_qs(params)
+        self.assertEqual(control, "control")
+        self.assertEqual(params["LS_group"], ["MARKET:CS.D.EURUSD.TODAY.IP MARKET:IX.D.FTSE.DAILY.IP"])
+        self.assertEqual(params["LS_subId"], [str(sub_id)])
+
+        self.client._on_message(self.client.ws, f"SUBOK,{sub_id},2,5\r\nU,{sub_id},1,1.1|1.2|1.3|1.0|TRADEABLE\r\n")
+        self.client._on_message(self.client.ws, f"U,{sub_id},1,1.15|^4\r\nU,{sub_id},2,7500|7501|^3")
+        self.assertEqual(updates, [("CS.D.EURUSD.TODAY.IP", "1.1", "1.2"), ("CS.D.EURUSD.TODAY.IP", "1.15", "1.2"),
+                                   ("IX.D.FTSE.DAILY.IP", "7500", "7501")])
+        self.assertEqual(self.client.market_data("CS.D.EURUSD.TODAY.IP").bid, 1.15)
+        self.assertEqual(self.client.market_data("CS.D.EURUSD.TODAY.IP").market_status, "TRADEABLE")
+
+        self.client.unsubscribe(sub_id)
+        self.assertIn("LS_op=delete", self.sent()[-1])
+        self.client._on_message(self.client.ws, f"REQOK,2\r\nUNSUB,{sub_id}")
+        self.assertEqual(self.client.values("CS.D.EURUSD.TODAY.IP"), {})
+
+class FakeWebSocketApp:
+    """Plays scripted TLCP server frames through the client's callbacks, one script per connection."""
+    def __init__(self, scripts, url, subprotocols, on_open, on_message, on_error, on_close):
+        self.script = scripts.pop(0)
+        self.on_open, self.on_message, self.on_close = on_open, on_message, on_close
+        self.sent = []
+        self.closed = False
+
+    def send(self, request):
+        self.sent.append(request)
+
+    def close(self):
+        self.closed = True
+
+    def run_forever(self):
+        self.on_open(self)
+        for frame in self.script:
+            if self.closed:
+                break
+            frame(self) if callable(frame) else self.on_message(self, frame)
+        self.on_close(self, None, None)
+
+
+class TestIGStreamingReconnect(unittest.TestCase):
+    def test_loop_rebinds_session_without_resubscribing(self):
+        session = UserSession(client_id="c", account_id="ABC12", lightstreamer_endpoint="https://ls.example.com",
+                              active_account_id="ABC12", cst_token="cst", x_security_token="xst")
+        client = IGStreamingClient(session)
+        updates = []
+        client.add_listener(lambda epic, values: updates.append((epic, values["BID"])))
+        sub_id = client.subscribe(["CS.D.EURUSD.TODAY.IP"])
+        scripts = [
+            ["WSOK\r\nCONOK,S1,50000,5000,*\r\n", f"SUBOK,{sub_id},1,5\r\nU,{sub_id},1,1.1|1.2|#|#|TRADEABLE\r\n",
+             "LOOP,0\r\n", f"U,{sub_id},1,9.9|^4\r\n"],
+            ["WSOK\r\nCONOK,S1,50000,5000,*\r\n", f"U,{sub_id},1,1.15|^4\r\n", lambda ws: client.disconnect()],
+        ]
+        sockets = []
+        def websocket_app(*args, **kwargs):
+            sockets.append(FakeWebSocketApp(scripts, *args, **kwargs))
+            return sockets[-1]
+
+        with patch('ig.streaming.websocket.WebSocketApp', side_effect=websocket_app):
+            client.connect()
+            client.wst.join(timeout=5)
+
+        self.assertFalse(client.wst.is_alive())
+        self.assertEqual(len(sockets), 2)
+        self.assertTrue(sockets[0].sent[1].startswith("create_session"))
+        self.assertIn("LS_subId=%s" % sub_id, sockets[0].sent[2])
+        self.assertTrue(sockets[1].sent[1].startswith("bind_session\r\nLS_session=S1"))
+        self.assertFalse(any("LS_op=add" in request for request in sockets[1].sent))
+        self.assertTrue(sockets[1].sent[-1].endswith("LS_op=destroy"))
+        self.assertEqual(updates, [("CS.D.EURUSD.TODAY.IP", "1.1"), ("CS.D.EURUSD.TODAY.IP", "1.15")])
+        self.assertEqual(client.market_data("CS.D.EURUSD.TODAY.IP").bid, 1.15)
+
+if __name__ == '__main__':
+    unittest.main()
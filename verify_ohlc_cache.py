@@ -0,0 +1,73 @@
+import json
+import shutil
+import tempfile
+import unittest
+from functools import partial
+from unittest.mock import patch
+import pandas as pd
+from market_data_api import OHLC_YahooFinance
+from ohlc_cache import OHLCCache
+
+
+def epoch(t) -> int:
+    return int(pd.Timestamp(t, tz="UTC").timestamp())
+
+
+def chart(timestamps, closes, currency="USD"):
+    """yahoo v8 chart json as request_chart returns it"""
+    quote = {"open": closes, "high": closes, "low": closes, "close": closes, "volume": [100] * len(closes)}
+    result = {"meta": {"exchangeTimezoneName": "America/New_York", "currency": currency},
+              "indicators": {"quote": [quote]}}
+    if timestamps:
+        result["timestamp"] = timestamps
+    return json.dumps({"chart": {"result": [result]}}).encode()
+
+
+class TestOHLCCache(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+        self.cache = OHLCCache(self.cache_dir)
+        patcher = patch('market_data_api.OHLCCache', partial(OHLCCache, cache_dir=self.cache_dir))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_coverage_is_the_requested_range_capped_at_now(self):
+        self.cache.write("MSCI", "1d", [epoch("2024-01-03 14:30")], {"close": [1.0]},
+                         epoch("2024-01-01"), epoch("2024-01-10"), "America/New_York", "USD")
+        self.cache.write("MSCI", "1d", [], {}, epoch("2023-12-01"), epoch("2099-01-01"))
+        start, end, timezone, currency = self.cache.coverage("MSCI", "1d")
+        self.assertEqual(start, epoch("2023-12-01"))
+        self.assertLess(end, epoch("2099-01-01"))
+        self.assertEqual((timezone, currency), ("America/New_York", "USD"))
+        self.assertEqual(self.cache.read("MSCI", "1d", epoch("2024-01-01"), epoch("2024-01-10"))[0],
+                         [epoch("2024-01-03 14:30")])  # an empty response keeps the stored bars
+
+    def test_top_up_replaces_the_partial_daily_bar(self):
+        # today's bar is stamped with the last trade time, a later refresh stamps it again
+        self.cache.write("MSCI", "1d", [epoch("2024-01-02 14:30"), epoch("2024-01-03 15:10")], {"close": [1.0, 2.0]},
+                         epoch("2024-01-02"), epoch("2024-01-04"))
+        last_bar = self.cache.last_timestamp("MSCI", "1d")
+        self.cache.write("MSCI", "1d", [epoch("2024-01-03 14:30")], {"close": [2.5]}, last_bar, epoch("2024-01-04"))
+        timestamps, quote = self.cache.read("MSCI", "1d", epoch("2024-01-02"), epoch("2024-01-04"))
+        self.assertEqual(timestamps, [epoch("2024-01-02 14:30"), epoch("2024-01-03 14:30")])
+        self.assertEqual(quote["close"], [1.0, 2.5])
+
+    def test_yahoo_top_up_requests_only_the_tail(self):
+        yahoo = OHLC_YahooFinance("MSCI", "2024-01-02", "2024-01-05")
+        responses = [chart([epoch("2024-01-02 14:30"), epoch("2024-01-03 14:30"), epoch("2024-01-04 15:10")],
+                           [1.0, 2.0, 3.0]),
+                     chart([epoch("2024-01-04 14:30"), epoch("2024-01-05 14:30")], [3.5, 4.0])]
+        with patch.object(OHLC_YahooFinance, 'request_chart', side_effect=responses) as request:
+            first = yahoo.yahooDataV8()
+            second = OHLC_YahooFinance("MSCI", "2024-01-02", "2024-01-06").yahooDataV8()
+
+        self.assertEqual(len(first), 3)
+        self.assertEqual(request.call_args_list[1].args[0], epoch("2024-01-04 15:10"))  # from the last stored bar
+        self.assertFalse(second['Date'].duplicated().any())
+        self.assertEqual(second['close'].tolist(), [1.0, 2.0, 3.5, 4.0])
+        self.assertEqual(second.attrs['currency'], "USD")
+
+
+if __name__ == '__main__':
+    unittest.main()
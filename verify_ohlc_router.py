@@ -0,0 +1,111 @@
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+from functools import partial
+from unittest.mock import MagicMock, patch
+import pandas as pd
+import requests
+import ohlc_router
+from ohlc_cache import OHLCCache
+from ohlc_router import OHLCRouter, Provider, provider_error
+
+
+class FakeFetch:
+    """Business day bars for the requested dates, records every request, raises error when set."""
+    def __init__(self, error=None):
+        self.calls = []
+        self.error = error
+
+    def __call__(self, symbol, start_date, end_date, interval):
+        self.calls.append((start_date, end_date))
+        if self.error is not None:
+            raise self.error
+        dates = pd.bdate_range(start_date, end_date)
+        return pd.DataFrame({'Date': dates.strftime('%Y-%m-%d'), 'open': 1.0, 'high': 2.0, 'low': 0.5,
+                             'close': range(len(dates)), 'volume': 100, 'currency': 'USD'})
+
+
+class TestOHLCRouter(unittest.TestCase):
+    def setUp(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        patcher = patch('ohlc_router.OHLCCache', partial(OHLCCache, cache_dir=cache_dir))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.router = OHLCRouter()
+
+    def provider(self, name, fetch, cache=True):
+        provider = Provider(name, fetch, {"1d": "1d"}, f"{name}.example.com", cache=cache)
+        self.router.register(provider)
+        return provider
+
+    def test_failover_on_provider_error(self):
+        down, up = FakeFetch(requests.ConnectionError("down")), FakeFetch()
+        a, b = self.provider("a", down), self.provider("b", up)
+
+        df = self.router.get_bars("MSCI", "2024-01-02", "2024-01-05")
+
+        self.assertEqual(df['provider'].unique().tolist(), ["b"])
+        self.assertEqual(len(df), 4)
+        self.assertEqual(a.success_rate(), 0.0)
+        self.assertEqual(b.success_rate(), 1.0)
+
+    def test_symbol_miss_does_not_count_against_provider(self):
+        a, b = self.provider("a", FakeFetch(ValueError("Invalid symbol"))), self.provider("b", FakeFetch())
+        self.router.get_bars("MSCI", "2024-01-02", "2024-01-05")
+        self.assertIsNone(a.success_rate())
+        self.assertEqual(b.success_rate(), 1.0)
+        b.fetch.error = KeyError("no bars")
+        with self.assertRaises(LookupError):
+            self.router.get_bars("PAY", "2024-01-02", "2024-01-05")
+
+    def test_route_ranks_healthy_fastest_first(self):
+        slow, fast, failing, new = (self.provider(name, FakeFetch()) for name in ("slow", "fast", "failing", "new"))
+        slow.calls.extend([(True, 2.0)] * 3)
+        fast.calls.extend([(True, 0.1)] * 3)
+        failing.calls.extend([(False, 0.1)] * 3)
+        self.assertEqual([p.name for p in self.router.route("MSCI", "1d")], ["fast", "slow", "new", "failing"])
+
+    def test_cached_history_is_served_without_refetch(self):
+        fetch = FakeFetch()
+        self.provider("a", fetch)
+        first = self.router.get_bars("MSCI", "2024-01-02", "2024-01-31")
+        second = self.router.get_bars("MSCI", "2024-01-02", "2024-01-31")
+        pd.testing.assert_frame_equal(first, second)
+        self.assertEqual(len(fetch.calls), 1)
+
+    def test_range_ending_today_only_tops_up_the_tail(self):
+        fetch = FakeFetch()
+        cached = self.provider("a", fetch)
+        other = self.provider("b", FakeFetch())
+        other.calls.append((True, 0.0))  # faster than a, still a holds the history
+        today = datetime.now().strftime('%Y-%m-%d')
+        start = (pd.Timestamp(today) - pd.Timedelta(days=60)).strftime('%Y-%m-%d')
+        cached.get_bars("MSCI", start, today, "1d")
+
+        df = self.router.get_bars("MSCI", start, today)
+
+        self.assertEqual(df['provider'].unique().tolist(), ["a"])
+        self.assertEqual(len(fetch.calls), 2)
+        last_bar = pd.bdate_range(start, today)[-1].strftime('%Y-%m-%d')
+        self.assertEqual(fetch.calls[-1], (last_bar, today))  # not the full history again
+        self.assertFalse(df['Date'].duplicated().any())
+
+    def test_twelve_data_rate_limit_is_a_provider_error(self):
+        response = MagicMock(text='{"code": 429, "message": "You have run out of API credits", "status": "error"}')
+        response.json.return_value = {"code": 429, "message": "You have run out of API credits", "status": "error"}
+        with patch('http_session.get', return_value=response):
+            with self.assertRaises(requests.HTTPError) as raised:
+                ohlc_router.fetch_twelvedata("MSCI", "2024-01-02", "2024-01-05", "1day")
+        self.assertTrue(provider_error(raised.exception))
+
+        response.json.return_value = {"code": 404, "message": "symbol not found", "status": "error"}
+        with patch('http_session.get', return_value=response):
+            with self.assertRaises(ValueError) as raised:
+                ohlc_router.fetch_twelvedata("XXXX", "2024-01-02", "2024-01-05", "1day")
+        self.assertFalse(provider_error(raised.exception))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import unittest
+import numpy as np
+import pandas as pd
+from currency_conversion import FXConverter
+from portfolio_valuation import daily_portfolio_value, value_between
+
+
+class TestPortfolioValuation(unittest.TestCase):
+    def setUp(self):
+        self.trades = pd.DataFrame({
+            'Date': ['2024-01-02', '2024-01-02', '2024-01-06', '2024-01-10'],  # the 6th is a Saturday
+            'Ticker': ['MSCI', 'VOD.L', 'MSCI', 'MSCI'],
+            'Quantity': [10, 100, 5, -15],
+        })
+        self.prices = pd.DataFrame({
+            'Date': ['2024-01-02', '2024-01-04', '2024-01-03', '2024-01-05'],
+            'ticker': ['MSCI', 'MSCI', 'VOD.L', 'VOD.L'],
+            'close': [500.0, 520.0, 70.0, 72.0],
+            'currency': ['USD', 'USD', 'GBp', 'GBp'],
+        })
+        self.fx = FXConverter(pd.DataFrame({'USD': [1.25, 1.30]}, index=['2024-01-02', '2024-01-05']))
+        self.currencies = pd.Series({'MSCI': 'USD', 'VOD.L': 'GBP'})
+
+    def test_daily_value(self):
+        df_value, total = daily_portfolio_value(self.trades, self.prices, self.fx, self.currencies, end='2024-01-12')
+        msci, vod = df_value['MSCI'], df_value['VOD.L']
+        # quantities carried forward, the weekend trade counts from the next business day
+        self.assertAlmostEqual(msci['2024-01-03'], 10 * 500.0 / 1.25)  # close carried over the gap
+        self.assertAlmostEqual(msci['2024-01-05'], 10 * 520.0 / 1.30)
+        self.assertAlmostEqual(msci['2024-01-08'], 15 * 520.0 / 1.30)
+        self.assertEqual(msci['2024-01-10'], 0.0)                      # closed position
+        # no close before the 3rd: not back-filled, left out of the total
+        self.assertTrue(np.isnan(vod['2024-01-02']))
+        self.assertAlmostEqual(vod['2024-01-03'], 100 * 0.70)           # GBp pence to GBP
+        self.assertAlmostEqual(total['2024-01-02'], 10 * 500.0 / 1.25)
+        self.assertAlmostEqual(total['2024-01-12'], 100 * 0.72)
+
+    def test_value_between_edges(self):
+        _, total = daily_portfolio_value(self.trades, self.prices, self.fx, self.currencies, end='2024-01-12')
+        self.assertEqual(value_between(total, '2024-01-06', '2024-01-09').index.strftime('%m-%d').tolist(),
+                         ['01-08', '01-09'])                            # weekend start
+        self.assertEqual(value_between(total, '2024-01-11', '2024-03-01').index[-1], pd.Timestamp('2024-01-12'))
+        self.assertTrue(value_between(total, '2023-01-01', '2023-12-31').empty)
+        holidays = total.drop(pd.Timestamp('2024-01-08'))              # not a Mon-Fri calendar any more
+        self.assertEqual(value_between(holidays, '2024-01-09', '2024-01-10').tolist(), total['2024-01-09':'2024-01-10'].tolist())
+
+
+if __name__ == '__main__':
+    unittest.main()
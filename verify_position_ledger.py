@@ -0,0 +1,78 @@
+import shutil
+import tempfile
+import unittest
+import pandas as pd
+from position_ledger import PositionLedger
+
+SUM_COLUMNS = ['Quantity', 'Cost/Proceeds', 'Charges', 'Commission']
+
+
+def trades(rows):
+    return pd.DataFrame(rows, columns=['Date', 'Ticker', 'Market', 'Currency'] + SUM_COLUMNS)
+
+
+HISTORY = trades([
+    ['02/01/2024', 'MSCI', 'MSCI Inc', 'USD', 10, -5000.0, -1.0, -10.0],
+    ['03/01/2024', 'VOD.L', 'Vodafone', 'GBP', 1000, -700.0, -3.5, -5.0],
+    ['03/01/2024', 'VOD.L', 'Vodafone', 'GBP', 1000, -700.0, -3.5, -5.0],  # same fill twice
+    ['10/01/2024', 'MSCI', 'MSCI Inc', 'USD', -4, 2100.0, 0.0, -10.0],
+    ['15/02/2024', 'FDS', 'FactSet', 'USD', 3, -1350.0, 0.0, -10.0],
+])
+
+
+def expected_positions(df):
+    df = df.assign(Date=pd.to_datetime(df['Date'], dayfirst=True)).sort_values('Date', kind='stable')
+    agg = dict({c: 'sum' for c in SUM_COLUMNS}, Market='last', Currency='last')
+    expected = df.groupby('Ticker').agg(agg).astype({c: float for c in SUM_COLUMNS})
+    expected['Costs'] = expected[['Cost/Proceeds', 'Charges', 'Commission']].sum(axis=1)
+    return expected
+
+
+class TestPositionLedger(unittest.TestCase):
+    def setUp(self):
+        self.snapshot_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.snapshot_dir)
+
+    def ledger(self, df):
+        return PositionLedger.for_trades(df, snapshot_dir=self.snapshot_dir)
+
+    def assert_matches_groupby(self, ledger, df):
+        pd.testing.assert_frame_equal(ledger.positions(), expected_positions(df), check_names=False)
+
+    def test_resume_from_snapshot_applies_only_new_trades(self):
+        first = self.ledger(HISTORY.iloc[:3])
+        self.assertEqual(first.ingest(HISTORY.iloc[:3]), 3)  # saved without an explicit save()
+
+        resumed = self.ledger(HISTORY)
+        self.assertEqual(resumed.rows_applied, 3)
+        self.assertEqual(resumed.ingest(HISTORY), 2)
+        self.assert_matches_groupby(resumed, HISTORY)
+        self.assertEqual(self.ledger(HISTORY).ingest(HISTORY), 0)  # unchanged upload is a no-op
+
+    def test_duplicate_rows_are_counted_every_time(self):
+        ledger = self.ledger(HISTORY)
+        ledger.ingest(HISTORY)
+        self.assertEqual(ledger.positions().loc['VOD.L', 'Quantity'], 2000)
+        more = pd.concat([HISTORY, HISTORY.iloc[[4]]], ignore_index=True)  # a second identical fill of the last trade
+        self.assertEqual(ledger.ingest(more), 1)
+        self.assert_matches_groupby(ledger, more)
+
+    def test_removed_trade_rebuilds(self):
+        ledger = self.ledger(HISTORY)
+        ledger.ingest(HISTORY)
+        fewer = HISTORY.drop(index=3)
+        self.assertEqual(ledger.ingest(fewer), len(fewer))
+        self.assert_matches_groupby(ledger, fewer)
+
+    def test_backdated_trade_rebuilds(self):
+        ledger = self.ledger(HISTORY)
+        ledger.ingest(HISTORY)
+        backdated = pd.concat([HISTORY, trades([['05/01/2024', 'MSCI', 'MSCI Inc.', 'USD', 1, -480.0, 0.0, -10.0]])],
+                              ignore_index=True)
+        self.assertEqual(ledger.ingest(backdated), len(backdated))
+        self.assert_matches_groupby(ledger, backdated)
+        self.assertEqual(ledger.positions().loc['MSCI', 'Market'], 'MSCI Inc')  # last by date, not by row
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+''' treasury yield curve kept in memory as a dates x maturities matrix, fed incrementally from fred_store
+eg. cube = yield_curve()                        # process wide, loaded once from HISTORY_START
+    curve = cube.curve_series("2024-03-16")     # yields of the nearest prior day with data, indexed by maturity
+    df_long = cube.frames("2024-01-01", max_frames=60)   # DATE, variable, value rows for an animation
+
+rows are the observation dates (FRED has no row on week-ends and bond market holidays), a missing maturity is
+carried forward for a few rows. row_of_day holds, for every calendar day from the first to the last observation,
+the row of the last observation on or before it, so a date lookup is a subtraction and an array index.
+A refresh, at most every REFRESH_SECONDS, only re-reads the last OVERLAP_DAYS from the store and replaces those rows.'''
+import threading
+import time
+import numpy as np
+import pandas as pd
+from fred_store import fred
+
+TREASURY_MATURITIES = {'DGS1MO': '1 MO', 'DGS3MO': '3 MO', 'DGS6MO': '6 MO', 'DGS1': '1 YR', 'DGS2': '2 YR',
+                       'DGS3': '3 YR', 'DGS5': '5 YR', 'DGS7': '7 YR', 'DGS10': '10 YR', 'DGS20': '20 YR',
+                       'DGS30': '30 YR'}
+HISTORY_START = "1990-01-01"
+REFRESH_SECONDS = 15 * 60
+OVERLAP_DAYS = 10
+FILL_LIMIT = 5
+
+
+def to_day(date) -> np.datetime64:
+    return np.datetime64(pd.Timestamp(date).date(), 'D')
+
+
+class YieldCurveCube:
+    def __init__(self, start_date: str = HISTORY_START, maturities: dict = TREASURY_MATURITIES, loader=fred):
+        self.codes = list(maturities)
+        self.labels = list(maturities.values())
+        self.loader = loader
+        self.lock = threading.Lock()
+        self.start = None
+        self.refreshed_at = 0.0
+        empty = np.empty((0, len(self.codes)))
+        # (dates, raw values, forward filled values, row_of_day), replaced as a whole so readers need no lock
+        self._cube = (np.array([], dtype='datetime64[D]'), empty, empty, np.array([], dtype=np.int64))
+        self.ensure(start_date)
+
+    def _load(self, start: np.datetime64) -> tuple:
+        df = self.loader(self.codes, str(start)).reindex(columns=self.codes).dropna(how='all')
+        return df.index.to_numpy().astype('datetime64[D]'), df.to_numpy(dtype=float)
+
+    def _build(self, dates: np.ndarray, raw: np.ndarray):
+        filled = pd.DataFrame(raw).ffill(limit=FILL_LIMIT).to_numpy()
+        if len(dates):
+            days = np.arange(dates[0], dates[-1] + np.timedelta64(1, 'D'))
+            row_of_day = np.searchsorted(dates, days, side='right') - 1
+        else:
+            row_of_day = np.array([], dtype=np.int64)
+        self._cube = (dates, raw, filled, row_of_day)
+
+    def ensure(self, start_date=None, now: float = None):
+        ''' load from start_date if the cube starts later, otherwise refresh the tail once REFRESH_SECONDS passed '''
+        now = time.time() if now is None else now
+        start = to_day(start_date) if start_date is not None else self.start
+        with self.lock:
+            if self.start is None or start < self.start:
+                self._build(*self._load(start))
+                self.start, self.refreshed_at = start, now
+            elif now - self.refreshed_at > REFRESH_SECONDS:
+                dates, raw, _, _ = self._cube
+                since = max(self.start, dates[-1] - np.timedelta64(OVERLAP_DAYS, 'D')) if len(dates) else self.start
+                new_dates, new_raw = self._load(since)
+                keep = dates < since
+                self._build(np.concatenate([dates[keep], new_dates]), np.vstack([raw[keep], new_raw]))
+                self.refreshed_at = now
+        return self
+
+    @property
+    def dates(self) -> np.ndarray:
+        return self._cube[0]
+
+    def curve(self, date):
+        ''' (observation date, yields in maturity order) of the last observation on or before date, None before the first '''
+        dates, _, values, row_of_day = self._cube
+        if not len(dates):
+            return None
+        offset = int((to_day(date) - dates[0]).astype(np.int64))
+        if offset < 0:
+            return None
+        row = row_of_day[min(offset, len(row_of_day) - 1)]
+        return dates[row], values[row]
+
+    def curve_series(self, date) -> pd.Series:
+        found = self.curve(date)
+        if found is None:
+            return None
+        day, yields = found
+        return pd.Series(yields, index=self.labels, name=str(day))
+
+    def _rows(self, start_date=None, end_date=None) -> slice:
+        dates = self._cube[0]
+        lo = 0 if start_date is None else np.searchsorted(dates, to_day(start_date), side='left')
+        hi = len(dates) if end_date is None else np.searchsorted(dates, to_day(end_date), side='right')
+        return slice(lo, hi)
+
+    def frames(self, start_date=None, end_date=None, max_frames: int = 60) -> pd.DataFrame:
+        ''' long frame (DATE, variable, value) of at most max_frames evenly spaced dates, the last one always included '''
+        dates, _, values, _ = self._cube
+        rows = self._rows(start_date, end_date)
+        if rows.stop <= rows.start:
+            return pd.DataFrame(columns=['DATE', 'variable', 'value'])
+        picked = np.unique(np.linspace(rows.start, rows.stop - 1, min(max_frames, rows.stop - rows.start)).round().astype(int))
+        return pd.DataFrame({
+            'DATE': np.repeat(dates[picked].astype(str), len(self.labels)),
+            'variable': np.tile(self.labels, len(picked)),
+            'value': values[picked].ravel(),
+        })
+
+    def history(self, start_date=None, end_date=None, max_points: int = 2000) -> pd.DataFrame:
+        ''' wide frame, DATE index and one column per maturity, thinned to at most max_points rows '''
+        dates, _, values, _ = self._cube
+        rows = self._rows(start_date, end_date)
+        picked = np.arange(rows.start, rows.stop)
+        if len(picked) > max_points:
+            picked = np.unique(np.linspace(rows.start, rows.stop - 1, max_points).round().astype(int))
+        return pd.DataFrame(values[picked], columns=self.labels,
+                            index=pd.DatetimeIndex(dates[picked], name='DATE'))
+
+
+_cube = None
+_cube_lock = threading.Lock()
+
+
+def yield_curve(start_date=None) -> YieldCurveCube:
+    ''' process wide cube covering at least HISTORY_START, or start_date if earlier '''
+    global _cube
+    with _cube_lock:
+        if _cube is None:
+            _cube = YieldCurveCube(min(HISTORY_START, str(start_date or HISTORY_START)))
+    return _cube.ensure(start_date)